@@ -0,0 +1,76 @@
+"""
+Persistent cache of synthesized audio per text segment.
+
+Audio is keyed on hash(segment text, voice, speed, lang_code, model version),
+so re-rendering a lightly edited chapter only synthesizes the changed or new
+segments. Entries are stored as .npy files and evicted least recently used
+first once the cache exceeds its byte budget, like gemini_cache.ResponseCache.
+"""
+
+import os
+import json
+import hashlib
+import numpy as np
+
+DEFAULT_CACHE_DIR = ".audio_cache"
+DEFAULT_MAX_BYTES = 2 * 1024 * 1024 * 1024
+
+def segment_key(text, voice, speed, lang_code, model_version):
+    payload = json.dumps([text, str(voice), float(speed), lang_code, model_version])
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+class SegmentAudioCache:
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        os.makedirs(cache_dir, exist_ok=True)
+        # Chapters have thousands of segments, so keep a running total instead of rescanning on every put
+        self.total_bytes = sum(size for _, size, _ in self._entries())
+
+    def _entries(self):
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith(".npy"):
+                continue
+            path = os.path.join(self.cache_dir, name)
+            stat = os.stat(path)
+            entries.append((stat.st_mtime, stat.st_size, path))
+        return entries
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.npy")
+
+    def get(self, key):
+        """Return the cached float32 audio for key, or None on a miss."""
+        path = self._path(key)
+        try:
+            audio = np.load(path)
+        except (FileNotFoundError, ValueError):
+            return None
+
+        # Bump the modification time so eviction drops least recently used entries first
+        os.utime(path)
+        return audio
+
+    def put(self, key, audio):
+        path = self._path(key)
+        previous = os.path.getsize(path) if os.path.exists(path) else 0
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            np.save(f, np.asarray(audio, dtype=np.float32))
+        os.replace(tmp_path, path)
+
+        self.total_bytes += os.path.getsize(path) - previous
+        if self.total_bytes > self.max_bytes:
+            self.evict()
+
+    def evict(self):
+        """Remove least recently used entries until the cache fits in max_bytes."""
+        entries = self._entries()
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            os.remove(path)
+            total -= size
+        self.total_bytes = total
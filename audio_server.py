@@ -0,0 +1,321 @@
+"""
+Async HTTP server for the output_audio/ library.
+
+Replaces the single-threaded `python -m http.server` over a copied MP3 that
+AudioStreamingOptions.start_local_server used to run. Files are served in place
+from the library directory with:
+
+    - Range requests (206 / 416), so players can seek and resume
+    - ETag / Last-Modified validators with If-None-Match, If-Modified-Since
+      and If-Range, so players revalidate instead of downloading again
+    - zero-copy transfer with loop.sendfile (os.sendfile under the hood)
+    - keep-alive connections, all handled on one event loop, so many
+      listeners stream at once without a thread each
+
+GET / lists the library with an in-page player.
+
+Usage:
+    python audio_server.py --root output_audio --port 8000
+    curl -r 0-1023 http://localhost:8000/combined_output.mp3 -o head.mp3
+"""
+
+import os
+import re
+import html
+import time
+import asyncio
+import argparse
+import mimetypes
+from email.utils import formatdate, parsedate_to_datetime
+from urllib.parse import unquote, urlsplit, quote
+
+AUDIO_TYPES = {
+    ".mp3": "audio/mpeg",
+    ".wav": "audio/wav",
+    ".flac": "audio/flac",
+    ".ogg": "audio/ogg",
+    ".opus": "audio/ogg",
+    ".m4a": "audio/mp4",
+}
+# Idle keep-alive connections are closed after this many seconds
+KEEP_ALIVE_TIMEOUT = 60
+MAX_HEADER_LINES = 100
+RANGE_PATTERN = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+REASONS = {
+    200: "OK", 206: "Partial Content", 304: "Not Modified", 400: "Bad Request", 403: "Forbidden",
+    404: "Not Found", 405: "Method Not Allowed", 416: "Range Not Satisfiable",
+}
+
+def etag(stat):
+    """Validator that changes whenever the file is rewritten (size or modification time)."""
+    return f'"{stat.st_size:x}-{stat.st_mtime_ns:x}"'
+
+def parse_http_date(value):
+    try:
+        return parsedate_to_datetime(value).timestamp()
+    except (TypeError, ValueError):
+        return None
+
+def not_modified(headers, stat):
+    """Whether a conditional GET can be answered with 304 (If-None-Match takes precedence)."""
+    if "if-none-match" in headers:
+        tags = [tag.strip() for tag in headers["if-none-match"].split(",")]
+        # Weak comparison: W/"x" matches "x"
+        return "*" in tags or etag(stat) in [tag[2:] if tag.startswith("W/") else tag for tag in tags]
+    since = parse_http_date(headers.get("if-modified-since"))
+    return since is not None and int(stat.st_mtime) <= since
+
+def range_applies(headers, stat):
+    """If-Range: only honor Range when the client's copy is still current (strong ETag or exact date)."""
+    if_range = headers.get("if-range")
+    if if_range is None:
+        return True
+    if if_range.startswith('"') or if_range.startswith("W/"):
+        return if_range == etag(stat)
+    date = parse_http_date(if_range)
+    return date is not None and int(stat.st_mtime) == date
+
+def parse_range(value, size):
+    """
+    Byte span requested by a single-range Range header.
+
+    Returns:
+        tuple: (start, end) inclusive, None to ignore the header (multiple or
+               malformed ranges get the whole file) or "unsatisfiable"
+    """
+    match = RANGE_PATTERN.match(value.replace(" ", ""))
+    if match is None:
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if size == 0:
+        return "unsatisfiable"
+    if not first:
+        # Suffix range: the last N bytes
+        length = int(last)
+        if length == 0:
+            return "unsatisfiable"
+        return max(0, size - length), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if last and int(last) < start:
+        return None
+    if start >= size:
+        return "unsatisfiable"
+    return start, end
+
+def chapter_order(path):
+    match = re.match(r'^(\d+)', os.path.basename(path))
+    return (int(match.group(1)) if match else float('inf'), path)
+
+def list_audio(root):
+    """Audio files below root as paths relative to it, chapters in order."""
+    files = []
+    for directory, _, names in os.walk(root):
+        for name in names:
+            if os.path.splitext(name)[1].lower() in AUDIO_TYPES:
+                files.append(os.path.relpath(os.path.join(directory, name), root))
+    return sorted(files, key=chapter_order)
+
+def index_page(root):
+    items = "\n".join(
+        f'<li><a href="/{quote(path)}" onclick="play(this); return false;">{html.escape(path)}</a></li>'
+        for path in list_audio(root)
+    )
+    return f"""<!DOCTYPE html>
+<html>
+<head>
+    <title>Audio Library</title>
+    <meta name="viewport" content="width=device-width, initial-scale=1">
+    <style>
+        body {{ font-family: Arial, sans-serif; padding: 20px; }}
+        .player {{ max-width: 600px; margin: 0 auto; }}
+        audio {{ width: 100%; margin: 20px 0; }}
+        li {{ margin: 6px 0; }}
+    </style>
+</head>
+<body>
+    <div class="player">
+        <h1>Audio Library</h1>
+        <audio id="player" controls preload="none"></audio>
+        <ul>
+{items}
+        </ul>
+    </div>
+    <script>
+        function play(link) {{
+            const player = document.getElementById("player");
+            player.src = link.href;
+            player.play();
+        }}
+    </script>
+</body>
+</html>"""
+
+class AudioServer:
+    """
+    Serves the files below root over HTTP/1.1.
+
+    Args:
+        root (str): Library directory (output_audio/)
+    """
+
+    def __init__(self, root="output_audio"):
+        self.root = os.path.realpath(root)
+
+    def resolve(self, target):
+        """Filesystem path for a request target, or None if it escapes the root."""
+        path = os.path.realpath(os.path.join(self.root, unquote(urlsplit(target).path).lstrip("/")))
+        if os.path.commonpath([path, self.root]) != self.root:
+            return None
+        return path
+
+    async def handle(self, reader, writer):
+        """One client connection; requests are answered in turn until either side closes."""
+        try:
+            while True:
+                request = await self.read_request(reader)
+                if request is None:
+                    break
+                method, target, version, headers = request
+                await self.respond(writer, method, target, headers)
+                connection = headers.get("connection", "").lower()
+                if connection == "close" or (version == "HTTP/1.0" and connection != "keep-alive"):
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.LimitOverrunError, ValueError):
+            # Listener went away or sent garbage; nothing to answer
+            pass
+        finally:
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except ConnectionError:
+                pass
+
+    async def read_request(self, reader):
+        """(method, target, version, headers) of the next request, or None when the connection is idle or closed."""
+        try:
+            line = await asyncio.wait_for(reader.readline(), KEEP_ALIVE_TIMEOUT)
+        except asyncio.TimeoutError:
+            return None
+        if not line:
+            return None
+        parts = line.decode("latin-1").split()
+        if len(parts) != 3:
+            raise ValueError(f"Malformed request line {line!r}")
+
+        headers = {}
+        for _ in range(MAX_HEADER_LINES):
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+        else:
+            raise ValueError("Too many header lines")
+
+        # GET and HEAD carry no body, but drain one so the next request parses
+        length = int(headers.get("content-length", 0) or 0)
+        if length:
+            await reader.readexactly(length)
+        return parts[0], parts[1], parts[2], headers
+
+    async def send_head(self, writer, status, headers):
+        lines = [f"HTTP/1.1 {status} {REASONS[status]}", f"Date: {formatdate(time.time(), usegmt=True)}"]
+        lines += [f"{name}: {value}" for name, value in headers.items()]
+        writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1"))
+        await writer.drain()
+
+    async def send_body(self, writer, status, body, content_type="text/plain; charset=utf-8", head_only=False):
+        data = body.encode("utf-8")
+        await self.send_head(writer, status, {"Content-Type": content_type, "Content-Length": len(data)})
+        if not head_only:
+            writer.write(data)
+            await writer.drain()
+
+    async def respond(self, writer, method, target, headers):
+        """Answer one GET or HEAD request for the index page or a file."""
+        head_only = method == "HEAD"
+        if method not in ("GET", "HEAD"):
+            await self.send_head(writer, 405, {"Allow": "GET, HEAD", "Content-Length": 0})
+            return
+
+        if urlsplit(target).path == "/":
+            await self.send_body(writer, 200, index_page(self.root), "text/html; charset=utf-8", head_only)
+            return
+
+        path = self.resolve(target)
+        if path is None:
+            await self.send_body(writer, 403, "Forbidden\n", head_only=head_only)
+            return
+        try:
+            file = open(path, "rb")
+        except PermissionError:
+            await self.send_body(writer, 403, "Forbidden\n", head_only=head_only)
+            return
+        except OSError:
+            # Missing, a directory, a dangling link, a name too long, ...
+            await self.send_body(writer, 404, "Not found\n", head_only=head_only)
+            return
+
+        with file:
+            stat = os.fstat(file.fileno())
+            size = stat.st_size
+            extension = os.path.splitext(path)[1].lower()
+            common = {
+                "Content-Type": AUDIO_TYPES.get(extension) or mimetypes.guess_type(path)[0]
+                                or "application/octet-stream",
+                "Accept-Ranges": "bytes",
+                "ETag": etag(stat),
+                "Last-Modified": formatdate(stat.st_mtime, usegmt=True),
+                # Revalidate with the ETag rather than trusting a cached copy blindly
+                "Cache-Control": "no-cache",
+            }
+
+            if not_modified(headers, stat):
+                await self.send_head(writer, 304, {k: common[k] for k in ("ETag", "Last-Modified", "Cache-Control")})
+                return
+
+            status, start, end = 200, 0, size - 1
+            if "range" in headers and range_applies(headers, stat):
+                span = parse_range(headers["range"], size)
+                if span == "unsatisfiable":
+                    await self.send_head(writer, 416, {"Content-Range": f"bytes */{size}", "Content-Length": 0})
+                    return
+                if span is not None:
+                    status, (start, end) = 206, span
+                    common["Content-Range"] = f"bytes {start}-{end}/{size}"
+
+            length = max(0, end - start + 1)
+            await self.send_head(writer, status, {**common, "Content-Length": length})
+            if not head_only and length:
+                # os.sendfile where the transport supports it, plain reads and writes otherwise
+                await asyncio.get_running_loop().sendfile(writer.transport, file, start, length)
+
+async def serve(root="output_audio", host="0.0.0.0", port=8000):
+    server = AudioServer(root)
+    listener = await asyncio.start_server(server.handle, host, port)
+    print(f"Serving {server.root} on http://{host}:{port}/")
+    async with listener:
+        await listener.serve_forever()
+
+def run_server(root="output_audio", host="0.0.0.0", port=8000):
+    """Serve root until interrupted with Ctrl+C."""
+    try:
+        asyncio.run(serve(root, host, port))
+    except KeyboardInterrupt:
+        print("\nServer stopped.")
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the audio library with Range, conditional requests and sendfile.")
+    parser.add_argument("--root", default="output_audio", help="Directory to serve")
+    parser.add_argument("--host", default="0.0.0.0", help="Interface to listen on")
+    parser.add_argument("--port", type=int, default=8000, help="Port to listen on")
+    args = parser.parse_args()
+
+    run_server(args.root, args.host, args.port)
+
+if __name__ == "__main__":
+    main()
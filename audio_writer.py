@@ -0,0 +1,252 @@
+"""
+Incremental encoding of synthesized audio into a single file.
+
+Synthesis used to write every segment to its own WAV file, which the stitch
+step then listed, reloaded, concatenated in memory and deleted. Here segments
+are appended to one open encoder as they are produced, through a small fixed
+buffer, so memory stays flat however long the chapter is and the audio is
+only encoded once. libsndfile (via soundfile) encodes WAV, FLAC, Ogg
+Vorbis/Opus and MP3 incrementally.
+"""
+
+import os
+import numpy as np
+import soundfile as sf
+
+SAMPLE_RATE = 24000
+# About 10 seconds of 24 kHz audio between encoder calls
+DEFAULT_BUFFER_FRAMES = 1 << 18
+
+# Output extension -> (libsndfile format, subtype)
+FORMATS = {
+    "wav": ("WAV", "PCM_16"),
+    "flac": ("FLAC", "PCM_16"),
+    "ogg": ("OGG", "VORBIS"),
+    "opus": ("OGG", "OPUS"),
+    "mp3": ("MP3", "MPEG_LAYER_III"),
+}
+
+def format_from_path(path):
+    """Output format named by the file extension, e.g. 'mp3' for chapter.mp3."""
+    return os.path.splitext(path)[1].lstrip(".").lower()
+
+class StreamingAudioWriter:
+    """
+    Append float32 audio arrays to one encoded file.
+
+    The file is written under a temporary name and moved into place on close,
+    so a partially synthesized chapter never looks finished.
+
+    Args:
+        path (str): Output file
+        format (str): One of FORMATS; defaults to the file extension
+        sample_rate (int): Sample rate of the appended audio
+        buffer_frames (int): Frames collected before each encoder call
+    """
+
+    def __init__(self, path, format=None, sample_rate=SAMPLE_RATE, buffer_frames=DEFAULT_BUFFER_FRAMES):
+        format = (format or format_from_path(path)).lower()
+        if format not in FORMATS:
+            raise ValueError(f"Unsupported audio format '{format}', expected one of {sorted(FORMATS)}")
+
+        self.path = path
+        self.sample_rate = sample_rate
+        self.frames = 0
+        self.buffer = np.empty(buffer_frames, dtype=np.float32)
+        self.buffered = 0
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.tmp_path = f"{path}.{os.getpid()}.tmp"
+        container, subtype = FORMATS[format]
+        self.file = sf.SoundFile(self.tmp_path, "w", samplerate=sample_rate, channels=1,
+                                 format=container, subtype=subtype)
+
+    def write(self, audio):
+        """Append one array of mono samples."""
+        audio = np.asarray(audio, dtype=np.float32).reshape(-1)
+        self.frames += len(audio)
+        while len(audio):
+            count = min(len(audio), len(self.buffer) - self.buffered)
+            self.buffer[self.buffered:self.buffered + count] = audio[:count]
+            self.buffered += count
+            audio = audio[count:]
+            if self.buffered == len(self.buffer):
+                self.flush()
+
+    def flush(self):
+        if self.buffered:
+            self.file.write(self.buffer[:self.buffered])
+            self.buffered = 0
+
+    @property
+    def duration(self):
+        return self.frames / self.sample_rate
+
+    def close(self):
+        """Finish encoding and move the file into place."""
+        if self.file.closed:
+            return
+        self.flush()
+        self.file.close()
+        os.replace(self.tmp_path, self.path)
+
+    def abort(self):
+        """Drop the partial file."""
+        if not self.file.closed:
+            self.file.close()
+        if os.path.exists(self.tmp_path):
+            os.remove(self.tmp_path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+def wav_stream_header(sample_rate=SAMPLE_RATE):
+    """
+    Header of a 16-bit mono WAV stream of unknown length.
+
+    The RIFF and data sizes are set to the maximum, which players treat as
+    "read until the connection closes".
+    """
+    byte_rate = sample_rate * 2
+    return (b"RIFF" + (0xFFFFFFFF).to_bytes(4, "little") + b"WAVE"
+            + b"fmt " + (16).to_bytes(4, "little") + (1).to_bytes(2, "little") + (1).to_bytes(2, "little")
+            + sample_rate.to_bytes(4, "little") + byte_rate.to_bytes(4, "little")
+            + (2).to_bytes(2, "little") + (16).to_bytes(2, "little")
+            + b"data" + (0xFFFFFFFF).to_bytes(4, "little"))
+
+def pcm16(audio):
+    audio = np.clip(np.asarray(audio, dtype=np.float32).reshape(-1), -1, 1)
+    return (audio * 32767).astype("<i2").tobytes()
+
+class _ChunkSink:
+    """
+    Write-only file object collecting what libsndfile encodes.
+
+    Encoders seek back at close to patch headers; bytes already handed out
+    cannot be changed, so writes behind the end of the stream are dropped.
+    """
+
+    def __init__(self):
+        self.chunks = []
+        self.pos = 0
+        self.end = 0
+
+    def write(self, data):
+        data = bytes(data)
+        if self.pos >= self.end:
+            self.chunks.append(data)
+            self.end += len(data)
+        self.pos += len(data)
+        return len(data)
+
+    def seek(self, offset, whence=0):
+        self.pos = {0: offset, 1: self.pos + offset, 2: self.end + offset}[whence]
+        return self.pos
+
+    def tell(self):
+        return self.pos
+
+    def read(self, size=-1):
+        return b""
+
+    def take(self):
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
+
+# libsndfile compression level of streamed MP3; 0.5 is 80 kbps CBR at 24 kHz
+MP3_STREAM_COMPRESSION = 0.5
+# Layer III bitrates in kbps by bitrate index, for MPEG-1 and for MPEG-2/2.5
+MP3_BITRATES = {
+    3: (0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320),
+    2: (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+}
+# Sample rates by version bits (3 MPEG-1, 2 MPEG-2, 0 MPEG-2.5) and sample rate index
+MP3_SAMPLE_RATES = {3: (44100, 48000, 32000), 2: (22050, 24000, 16000), 0: (11025, 12000, 8000)}
+
+def mp3_frame_length(header):
+    """Length in bytes of the Layer III frame starting with these 4 header bytes, or None."""
+    if len(header) < 4 or header[0] != 0xFF or header[1] & 0xE0 != 0xE0 or (header[1] >> 1) & 3 != 1:
+        return None
+    version = (header[1] >> 3) & 3
+    bitrate_index, rate_index, padding = header[2] >> 4, (header[2] >> 2) & 3, (header[2] >> 1) & 1
+    if version not in MP3_SAMPLE_RATES or rate_index == 3 or bitrate_index in (0, 15):
+        return None
+    bitrate = MP3_BITRATES[3 if version == 3 else 2][bitrate_index] * 1000
+    return (144 if version == 3 else 72) * bitrate // MP3_SAMPLE_RATES[version][rate_index] + padding
+
+def drop_info_placeholder(chunks):
+    """
+    Drop the zeroed first frame of an MP3 byte stream.
+
+    libsndfile reserves that frame for LAME's info tag and only fills it in by
+    seeking back at close, which a stream cannot do.
+    """
+    head = b""
+    for data in chunks:
+        if head is None:
+            yield data
+            continue
+        head += data
+        length = mp3_frame_length(head[:4])
+        if len(head) < 4 or (length is not None and len(head) < length):
+            continue
+        if length is not None and not any(head[4:length]):
+            head = head[length:]
+        if head:
+            yield head
+        head = None
+    if head:
+        yield head
+
+def encode_stream(arrays, format="mp3", sample_rate=SAMPLE_RATE):
+    """
+    Encode an iterable of audio arrays into a byte stream, yielding bytes as soon as
+    the encoder produces them.
+
+    WAV is sent as raw PCM behind a streaming header. MP3 and Ogg Vorbis/Opus are
+    encoded incrementally by libsndfile. MP3 is encoded at a constant bitrate:
+    the VBR info tag cannot be filled in on a stream, and without it decoders
+    size a VBR stream from its first frames and stop after a fraction of it.
+
+    >>> import io
+    >>> audio = (0.3 * np.sin(np.arange(5 * SAMPLE_RATE) * 0.05)).astype(np.float32)
+    >>> data = b"".join(encode_stream([audio[:SAMPLE_RATE], audio[SAMPLE_RATE:]], "mp3"))
+    >>> len(sf.read(io.BytesIO(data))[0]) >= len(audio)
+    True
+    """
+    if format == "wav":
+        yield wav_stream_header(sample_rate)
+        for audio in arrays:
+            yield pcm16(audio)
+        return
+
+    if format not in ("mp3", "ogg", "opus"):
+        raise ValueError(f"Format '{format}' cannot be streamed, expected wav, mp3, ogg or opus")
+
+    chunks = _encode_chunks(arrays, format, sample_rate)
+    yield from drop_info_placeholder(chunks) if format == "mp3" else chunks
+
+def _encode_chunks(arrays, format, sample_rate):
+    """Bytes libsndfile has encoded after each array."""
+    sink = _ChunkSink()
+    container, subtype = FORMATS[format]
+    options = {"compression_level": MP3_STREAM_COMPRESSION, "bitrate_mode": "CONSTANT"} if format == "mp3" else {}
+    with sf.SoundFile(sink, "w", samplerate=sample_rate, channels=1, format=container, subtype=subtype,
+                      **options) as encoder:
+        for audio in arrays:
+            encoder.write(np.asarray(audio, dtype=np.float32).reshape(-1))
+            data = sink.take()
+            if data:
+                yield data
+    data = sink.take()
+    if data:
+        yield data
@@ -0,0 +1,166 @@
+"""
+Local citation index built from chapters/Bibliography.pdf.
+
+The bibliography is parsed once into {number: {"title", "year"}} and saved next
+to the PDF, so chapter requests only carry the few entries each chapter cites
+(as compact text) instead of the whole bibliography PDF, and [N] markers can be
+resolved locally.
+"""
+
+import io
+import os
+import re
+import json
+import hashlib
+import argparse
+from PyPDF2 import PdfReader
+
+DEFAULT_BIBLIOGRAPHY = "chapters/Bibliography.pdf"
+DEFAULT_INDEX = "chapters/bibliography.json"
+
+ENTRY_PATTERN = re.compile(r'^\[(\d+)\]\s+', re.MULTILINE)
+# Matches [15], [3, 7] and [4-6]; PDF text uses an en dash for ranges
+CITATION_PATTERN = re.compile(r'\[(\d+(?:\s*[,–-]\s*\d+)*)\]')
+# IEEE style ends the quoted title with a comma inside the closing quote
+TITLE_PATTERNS = [re.compile(r'[“"](.+?),[”"]'), re.compile(r'[“"](.+?)[”"]')]
+YEAR_PATTERN = re.compile(r'\b(19\d{2}|20\d{2})\b')
+# Brackets right after these are intervals or matrices ("x ∈ [0, 1]", "the interval [1, 2]"), not citations
+MATH_BEFORE = re.compile(r'(?:[∈∉=<>≤≥≈×·^_]|\b(?:intervals?|ranges?|bounded by|clipped to))\s*$', re.IGNORECASE)
+# ... and so are brackets followed by these ("[0, 1]^d", "[1, 2] × [3, 4]")
+MATH_AFTER = re.compile(r'^\s*[\^_×]')
+
+def extract_text(pdf_bytes):
+    """Extract the plain text of a PDF with one page per block."""
+    reader = PdfReader(io.BytesIO(pdf_bytes))
+    return "\n".join(page.extract_text() or "" for page in reader.pages)
+
+def normalize_entry(text):
+    """Join wrapped lines, undoing hyphenation at line breaks."""
+    text = re.sub(r'-\n', '', text)
+    text = re.sub(r'\s+', ' ', text)
+    return text.replace(' ,', ',').strip()
+
+def parse_entry(text):
+    entry = normalize_entry(text)
+    title_match = next(filter(None, (pattern.search(entry) for pattern in TITLE_PATTERNS)), None)
+    if title_match:
+        title = title_match.group(1).rstrip(',. ')
+    else:
+        # Unquoted entries (e.g. web pages): use the part after the authors
+        parts = entry.split('. ')
+        title = (parts[1] if len(parts) > 1 else parts[0]).rstrip('. ')
+
+    years = YEAR_PATTERN.findall(entry)
+    return {"title": title, "year": years[-1] if years else None}
+
+def parse_bibliography(pdf_bytes):
+    """
+    Parse bibliography text into a citation index.
+
+    Returns:
+        dict: Citation number (int) -> {"title": str, "year": str or None}
+    """
+    text = extract_text(pdf_bytes)
+    matches = list(ENTRY_PATTERN.finditer(text))
+
+    index = {}
+    for match, next_match in zip(matches, matches[1:] + [None]):
+        end = next_match.start() if next_match else len(text)
+        index[int(match.group(1))] = parse_entry(text[match.end():end])
+    return index
+
+def load_citation_index(pdf_path=DEFAULT_BIBLIOGRAPHY, index_path=DEFAULT_INDEX):
+    """
+    Load the citation index, rebuilding it only when the bibliography PDF changed.
+    """
+    with open(pdf_path, "rb") as f:
+        pdf_bytes = f.read()
+    pdf_hash = hashlib.sha256(pdf_bytes).hexdigest()
+
+    if os.path.exists(index_path):
+        with open(index_path, "r") as f:
+            stored = json.load(f)
+        if stored.get("pdf_sha256") == pdf_hash:
+            return {int(k): v for k, v in stored["entries"].items()}
+
+    index = parse_bibliography(pdf_bytes)
+    with open(index_path, "w") as f:
+        json.dump({"pdf_sha256": pdf_hash, "entries": index}, f, indent=4)
+    print(f"Indexed {len(index)} bibliography entries to {index_path}")
+    return index
+
+def expand_citation(group):
+    """Turn the inside of a citation marker ('3, 5-7') into [3, 5, 6, 7]."""
+    numbers = []
+    for part in re.split(r'\s*,\s*', group):
+        bounds = re.split(r'\s*[–-]\s*', part)
+        if len(bounds) == 2:
+            numbers.extend(range(int(bounds[0]), int(bounds[1]) + 1))
+        else:
+            numbers.append(int(bounds[0]))
+    return numbers
+
+def cited_numbers(text):
+    """Sorted citation numbers referenced in text."""
+    numbers = set()
+    for match in CITATION_PATTERN.finditer(text):
+        numbers.update(expand_citation(match.group(1)))
+    return sorted(numbers)
+
+def format_source(entry):
+    if entry["year"]:
+        return f"source: {entry['title']} from {entry['year']}"
+    return f"source: {entry['title']}"
+
+def format_entries(index, numbers):
+    """Compact text listing of the given bibliography entries, one per line."""
+    lines = []
+    for n in numbers:
+        if n not in index:
+            continue
+        year = index[n]["year"]
+        lines.append(f"[{n}] {index[n]['title']}" + (f" ({year})" if year else ""))
+    return "\n".join(lines)
+
+def cited_entries_text(chapter_bytes, index):
+    """Bibliography entries cited by a chapter PDF, as a text part for the request."""
+    entries = format_entries(index, cited_numbers(extract_text(chapter_bytes)))
+    return f"<bibliography>\n{entries}\n</bibliography>"
+
+def resolve_citations(text, index):
+    """
+    Replace [N] markers with '(source: title from year)' using the local index.
+
+    A marker is only resolved when every number in it is in the index and it
+    is not written as math, so intervals such as [0, 1] stay as they are.
+
+    >>> index = {1: {"title": "Deep RL from human preferences", "year": "2017"},
+    ...          2: {"title": "Proximal policy optimization", "year": "2017"}}
+    >>> resolve_citations("RLHF [1, 2] learns rewards in [0, 1].", index)
+    'RLHF (source: Deep RL from human preferences from 2017; source: Proximal policy optimization from 2017) learns rewards in [0, 1].'
+    >>> resolve_citations("with x ∈ [1, 2] on the interval [1, 2]", index)
+    'with x ∈ [1, 2] on the interval [1, 2]'
+    >>> resolve_citations("as in [2], over [1, 2]^d", index)
+    'as in (source: Proximal policy optimization from 2017), over [1, 2]^d'
+    """
+    def replace(match):
+        numbers = expand_citation(match.group(1))
+        if not all(n in index for n in numbers):
+            return match.group(0)
+        if MATH_BEFORE.search(text, max(0, match.start() - 30), match.start()) or MATH_AFTER.match(text[match.end():match.end() + 2]):
+            return match.group(0)
+        return "(" + "; ".join(format_source(index[n]) for n in numbers) + ")"
+
+    return CITATION_PATTERN.sub(replace, text)
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the local citation index from the bibliography PDF.")
+    parser.add_argument("--pdf", default=DEFAULT_BIBLIOGRAPHY, help="Path to the bibliography PDF")
+    parser.add_argument("--output", default=DEFAULT_INDEX, help="Path to write the citation index")
+    args = parser.parse_args()
+
+    index = load_citation_index(args.pdf, args.output)
+    print(f"{len(index)} entries")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,344 @@
+"""
+Local figure captioning with MiniCPM-o.
+
+The Gemini backend explains figures in place; the local backend used to drop
+them. This stage extracts the embedded images of each chapter PDF with PyPDF2,
+has MiniCPM-o (loaded once) explain them in batches and stores the result per
+chapter as figure_captions/<chapter>.json: one list of captions per page,
+which local_parse.parse_chapter_file injects next to the matching
+"Figure N" caption. Captions are cached by image content hash (plus model and
+prompt), so re-running on unchanged chapters, or images repeated across
+chapters, never reaches the model.
+
+Usage:
+    python caption_figures.py                          # every chapter in chapters/
+    python caption_figures.py "chapters/6 Preference Data.pdf" --batch-size 8
+"""
+
+import io
+import os
+import json
+import zlib
+import struct
+import hashlib
+import argparse
+from collections import namedtuple
+from PyPDF2 import PdfReader
+from PyPDF2.generic import NameObject
+
+from minicpm import MODEL_ID, load_minicpm, chat
+
+DEFAULT_CACHE_DIR = ".caption_cache"
+DEFAULT_OUTPUT_DIR = "figure_captions"
+DEFAULT_BATCH_SIZE = 4
+# Smaller images are icons, logos or bullets rather than figures
+MIN_FIGURE_SIZE = 100
+CAPTION_PROMPT = (
+    "This figure is from a technical book that is being turned into an audiobook. "
+    "Explain it for a listener who cannot see it: what it shows and what the data or results mean, "
+    "in two to four sentences of plain prose. Do not read out raw numbers, table cells or axis ticks one by one."
+)
+
+Figure = namedtuple("Figure", ["page", "name", "data"])
+
+def image_hash(data):
+    return hashlib.sha256(data).hexdigest()
+
+def png_chunk(kind, data):
+    return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+
+def color_space(xobject):
+    """
+    (name, components, palette) of an image's color space.
+
+    Calibrated and ICCBased spaces are reported as the device space with the
+    same number of components; palette is the RGB lookup table of an Indexed space, else None.
+    """
+    space = xobject.get("/ColorSpace", "/DeviceGray")
+    space = space.get_object() if hasattr(space, "get_object") else space
+    if not isinstance(space, list):
+        return str(space), {"/DeviceGray": 1, "/DeviceRGB": 3, "/DeviceCMYK": 4}.get(space), None
+    kind = space[0]
+    if kind in ("/CalGray", "/CalRGB"):
+        return {"/CalGray": "/DeviceGray", "/CalRGB": "/DeviceRGB"}[kind], 1 if kind == "/CalGray" else 3, None
+    if kind == "/ICCBased":
+        components = space[1].get_object().get("/N")
+        return {1: "/DeviceGray", 3: "/DeviceRGB", 4: "/DeviceCMYK"}.get(components, kind), components, None
+    if kind == "/Indexed":
+        if color_space({"/ColorSpace": space[1]})[0] != "/DeviceRGB":
+            return kind, None, None
+        lookup = space[3].get_object()
+        lookup = lookup.get_data() if hasattr(lookup, "get_data") else bytes(lookup)
+        return kind, 1, lookup[:3 * (int(space[2]) + 1)]
+    return str(kind), None, None
+
+def predicted_rows(xobject):
+    """
+    Inflated samples of a Flate image with the PNG predictor of every row still applied.
+
+    PyPDF2 3.0 undoes PNG predictors as if every pixel were one byte, which
+    mis-sizes the rows of images with more than one color component and fails
+    on most plots, so the predictor is hidden from get_data while it inflates.
+    """
+    parms = xobject.pop("/DecodeParms")
+    try:
+        return xobject.get_data()
+    finally:
+        xobject[NameObject("/DecodeParms")] = parms
+        # get_data caches its result; drop the one without the predictor
+        xobject.decoded_self = None
+
+def png_from_flate(xobject):
+    """
+    Wrap a FlateDecode image with PNG predictors into a PNG file, or None if it is not one.
+
+    PDF's PNG predictors are PNG's own row filters, so the filtered rows are
+    stored as they are and the PNG decoder undoes them. Gray, RGB and Indexed
+    (RGB palette) images are handled.
+    """
+    parms = xobject.get("/DecodeParms")
+    if isinstance(parms, list):
+        parms = parms[0] if len(parms) == 1 else None
+    if xobject.get("/Filter") not in ("/FlateDecode", ["/FlateDecode"]) or not parms:
+        return None
+    width, height = xobject["/Width"], xobject["/Height"]
+    colors = parms.get("/Colors", 1)
+    bits = parms.get("/BitsPerComponent", xobject.get("/BitsPerComponent", 8))
+    space, components, palette = color_space(xobject)
+    if palette is not None:
+        color_type = 3 if colors == 1 and bits in (1, 2, 4, 8) else None
+    else:
+        color_type = {1: 0, 3: 2}.get(colors) if bits == 8 and components == colors else None
+    if parms.get("/Predictor", 1) < 10 or parms.get("/Columns", 1) != width or color_type is None:
+        return None
+
+    header = struct.pack(">IIBBBBB", width, height, bits, color_type, 0, 0, 0)
+    chunks = png_chunk(b"IHDR", header)
+    if palette is not None:
+        chunks += png_chunk(b"PLTE", palette)
+    return b"\x89PNG\r\n\x1a\n" + chunks + png_chunk(b"IDAT", zlib.compress(predicted_rows(xobject), 1)) + png_chunk(b"IEND", b"")
+
+def decode_image(xobject):
+    """
+    Encoded image bytes of an image XObject, or None when its format is not supported.
+
+    JPEG and JPEG 2000 streams are returned as they are; other filters are
+    decoded by PyPDF2 and the raw samples re-encoded as PNG.
+    """
+    from PIL import Image
+
+    filters = xobject.get("/Filter")
+    filters = list(filters) if isinstance(filters, list) else [filters]
+    if filters[-1] in ("/DCTDecode", "/JPXDecode"):
+        return xobject.get_data()
+
+    space, components, palette = color_space(xobject)
+    bits = xobject.get("/BitsPerComponent", 8)
+    modes = {("/DeviceGray", 8): "L", ("/DeviceGray", 1): "1", ("/DeviceRGB", 8): "RGB",
+             ("/DeviceCMYK", 8): "CMYK", ("/Indexed", 8): "P"}
+    mode = modes.get((space, bits))
+    if mode is None or (mode == "P" and palette is None):
+        # No RGB palette could be built; PIL's default palette would give wrong colors
+        return None
+    image = Image.frombytes(mode, (xobject["/Width"], xobject["/Height"]), xobject.get_data())
+    if palette is not None:
+        image.putpalette(palette)
+    output = io.BytesIO()
+    image.convert("RGB" if mode in ("CMYK", "P") else mode).save(output, format="PNG")
+    return output.getvalue()
+
+def page_images(page):
+    """
+    (name, encoded image bytes) of the image XObjects drawn on a page.
+
+    Soft masks (/SMask) are not applied: the figures are captioned in RGB, so
+    only their color samples matter. Images in color spaces decode_image does
+    not know are skipped with a message.
+    """
+    resources = page.get("/Resources")
+    xobjects = resources.get_object().get("/XObject") if resources is not None else None
+    if xobjects is None:
+        return []
+    images = []
+    for name, ref in xobjects.get_object().items():
+        xobject = ref.get_object()
+        if xobject.get("/Subtype") != "/Image":
+            continue
+        try:
+            data = png_from_flate(xobject) or decode_image(xobject)
+        except Exception as e:
+            print(f"Could not decode image {name}: {e}")
+            continue
+        if data is None:
+            print(f"Skipping image {name}: unsupported color space {color_space(xobject)[0]} "
+                  f"with {xobject.get('/BitsPerComponent')} bits per component")
+            continue
+        images.append((name[1:], data))
+    return images
+
+def extract_figures(pdf_path, min_size=MIN_FIGURE_SIZE):
+    """
+    Embedded images of a PDF large enough to be figures, in page order.
+
+    An image repeated on several pages (a logo, a running decoration) is only
+    kept the first time.
+
+    Returns:
+        list: Figure(page index, image name, encoded image bytes) tuples
+    """
+    from PIL import Image
+
+    figures, seen = [], set()
+    for page_number, page in enumerate(PdfReader(pdf_path).pages):
+        for name, data in page_images(page):
+            digest = image_hash(data)
+            if digest in seen:
+                continue
+            seen.add(digest)
+            try:
+                width, height = Image.open(io.BytesIO(data)).size
+            except Exception:
+                continue
+            if min(width, height) >= min_size:
+                figures.append(Figure(page_number, name, data))
+    return figures
+
+class CaptionCache:
+    """Captions on disk, one text file per (model, prompt, image content) hash."""
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, model_id=MODEL_ID, prompt=CAPTION_PROMPT):
+        self.cache_dir = cache_dir
+        self.fingerprint = hashlib.sha256(f"{model_id}\n{prompt}".encode()).hexdigest()
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def key(self, data):
+        return hashlib.sha256(f"{self.fingerprint}:{image_hash(data)}".encode()).hexdigest()
+
+    def _path(self, data):
+        return os.path.join(self.cache_dir, f"{self.key(data)}.txt")
+
+    def get(self, data):
+        try:
+            with open(self._path(data), "r") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def put(self, data, caption):
+        path = self._path(data)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            f.write(caption)
+        os.replace(tmp_path, path)
+
+class FigureCaptioner:
+    """
+    Batched MiniCPM-o captioning behind a CaptionCache.
+
+    The model is only loaded when an image is missing from the cache.
+    """
+
+    def __init__(self, cache=None, device="auto", batch_size=DEFAULT_BATCH_SIZE, prompt=CAPTION_PROMPT):
+        self.cache = cache if cache is not None else CaptionCache(prompt=prompt)
+        self.device = device
+        self.batch_size = batch_size
+        self.prompt = prompt
+        self.model = self.tokenizer = None
+
+    def caption_images(self, images):
+        """Captions for a list of encoded images, batch_size images per model call."""
+        from PIL import Image
+
+        if self.model is None:
+            self.model, self.tokenizer = load_minicpm(self.device)
+
+        captions = []
+        for start in range(0, len(images), self.batch_size):
+            batch = [Image.open(io.BytesIO(data)).convert("RGB") for data in images[start:start + self.batch_size]]
+            # A list of conversations is answered as one batch
+            answers = chat(self.model, self.tokenizer, [[{"role": "user", "content": [image, self.prompt]}]
+                                                         for image in batch])
+            if isinstance(answers, str):
+                answers = [answers]
+            captions.extend(answer.strip() for answer in answers)
+            print(f"Captioned {len(captions)}/{len(images)} figures")
+        return captions
+
+    def caption_chapters(self, pdf_paths):
+        """
+        Captions for the figures of several chapters, batching cache misses across chapters.
+
+        Returns:
+            dict: pdf path -> one list of captions per page
+        """
+        figures = {pdf_path: extract_figures(pdf_path) for pdf_path in pdf_paths}
+
+        misses = {}
+        for chapter_figures in figures.values():
+            for figure in chapter_figures:
+                if self.cache.get(figure.data) is None:
+                    misses.setdefault(self.cache.key(figure.data), figure.data)
+        total = sum(len(chapter_figures) for chapter_figures in figures.values())
+        print(f"{total - len(misses)}/{total} figure captions from cache")
+
+        if misses:
+            images = list(misses.values())
+            for data, caption in zip(images, self.caption_images(images)):
+                self.cache.put(data, caption)
+
+        captions = {}
+        for pdf_path, chapter_figures in figures.items():
+            pages = [[] for _ in range(len(PdfReader(pdf_path).pages))]
+            for figure in chapter_figures:
+                pages[figure.page].append(self.cache.get(figure.data))
+            captions[pdf_path] = pages
+        return captions
+
+def captions_path(pdf_path, output_dir=DEFAULT_OUTPUT_DIR):
+    """output_dir/<chapter name>.json for a chapter PDF."""
+    chapter = os.path.splitext(os.path.basename(pdf_path))[0]
+    return os.path.join(output_dir, f"{chapter}.json")
+
+def save_captions(path, pages):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(pages, f, indent=2)
+
+def load_captions(path):
+    """Per-page captions saved by save_captions, or None if the chapter was not captioned."""
+    try:
+        with open(path, "r") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+def caption_chapters(pdf_paths, captioner, output_dir=DEFAULT_OUTPUT_DIR):
+    """Caption the figures of every chapter and save them; returns the caption file paths."""
+    paths = []
+    for pdf_path, pages in captioner.caption_chapters(pdf_paths).items():
+        path = captions_path(pdf_path, output_dir)
+        save_captions(path, pages)
+        print(f"{sum(len(page) for page in pages)} figure captions for {os.path.basename(pdf_path)}")
+        paths.append(path)
+    return paths
+
+def main():
+    parser = argparse.ArgumentParser(description="Explain the figures of chapter PDFs locally with MiniCPM-o.")
+    parser.add_argument("pdfs", nargs="*", help="Chapter PDFs (default: every chapter in --chapters-dir)")
+    parser.add_argument("--chapters-dir", default="chapters", help="Directory of chapter PDFs")
+    parser.add_argument("--output-dir", default=DEFAULT_OUTPUT_DIR, help="Directory of the per-chapter caption files")
+    parser.add_argument("--cache-dir", default=DEFAULT_CACHE_DIR, help="Directory of the caption cache")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE, help="Images per model call")
+    parser.add_argument("--device", default="auto", help="Torch device: auto, cpu, cuda or mps")
+    args = parser.parse_args()
+
+    pdf_paths = args.pdfs
+    if not pdf_paths:
+        from parse_content import list_chapter_pdfs
+        pdf_paths = [os.path.join(args.chapters_dir, fp) for fp in list_chapter_pdfs(args.chapters_dir)]
+
+    captioner = FigureCaptioner(CaptionCache(args.cache_dir), device=args.device, batch_size=args.batch_size)
+    caption_chapters(pdf_paths, captioner, args.output_dir)
+
+if __name__ == "__main__":
+    main()
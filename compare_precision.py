@@ -0,0 +1,200 @@
+"""
+Speed, memory and quality of reduced-precision TTS inference.
+
+Synthesizes fixed sample texts (the opening of the first chapters in
+parsed_text/) at every precision of quantize.py and compares each against the
+fp32 output:
+
+    RTF       synthesis time / audio duration; below 1 is faster than real time
+    peak RSS  maximum resident memory of the process, model included
+    SNR       waveform signal-to-noise ratio against fp32, in dB (higher is closer)
+    LSD       log-spectral distance against fp32, in dB (lower is closer)
+
+Each precision runs in its own subprocess so the peak RSS of one does not hide
+another's. Quantization can change predicted durations, so SNR and LSD are
+computed over the common length and the length difference is reported too.
+Dia samples its output: runs are seeded, but its distances still include
+sampling noise and say less than Kokoro's.
+
+Usage:
+    python compare_precision.py --engine kokoro
+    python compare_precision.py --engine dia --precisions fp32 bf16 --samples 2 --threads 8
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import resource
+import subprocess
+import numpy as np
+import soundfile as sf
+
+from segmenter import segment_text
+from quantize import PRECISIONS
+
+DEFAULT_OUTPUT_DIR = os.path.join("output_audio", "precision")
+
+def sample_texts(text_dir="parsed_text", count=3, max_chars=200):
+    """The first segment of up to max_chars characters of each of the first `count` chapters."""
+    from generate_kokoro import list_chapter_texts
+
+    texts = []
+    for fp in list_chapter_texts(text_dir)[:count]:
+        with open(os.path.join(text_dir, fp), "r") as f:
+            segments = segment_text(f.read(), target=max_chars, length_fn=len)
+        if segments:
+            texts.append(segments[0].text)
+    return texts
+
+def peak_rss_mb():
+    """Peak resident memory of this process in MB (ru_maxrss is in KB on Linux, bytes on macOS)."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1024 ** 2 if sys.platform == "darwin" else peak / 1024
+
+def run_precision(engine_name, precision, texts, output_dir, device="cpu", voice=None, lang_code="b", seed=0):
+    """
+    Load one engine at one precision, synthesize every text and save the audio.
+
+    Returns:
+        dict: Timings, peak RSS and the paths of the WAV files
+    """
+    import torch
+    from tts_engines import get_engine
+
+    options = {"lang_code": lang_code} if engine_name == "kokoro" else {}
+    start = time.time()
+    engine = get_engine(engine_name, device, precision=precision, **options)
+    load_seconds = time.time() - start
+
+    if engine_name == "kokoro":
+        # Time the model, not the segment audio cache; G2P is warmed so every precision skips it alike
+        engine.cache = None
+        for text in texts:
+            engine.phonemizer.phonemize(text)
+    # First call pays one-off allocations and kernel selection
+    engine.synthesize(texts[0][:50], voice=voice)
+
+    directory = os.path.join(output_dir, precision)
+    os.makedirs(directory, exist_ok=True)
+    files = []
+    synth_seconds = audio_seconds = 0
+    for i, text in enumerate(texts):
+        torch.manual_seed(seed)
+        start = time.time()
+        audio = engine.synthesize(text, voice=voice)
+        synth_seconds += time.time() - start
+        audio_seconds += len(audio) / engine.sample_rate
+        path = os.path.join(directory, f"{i}.wav")
+        sf.write(path, audio, engine.sample_rate, subtype="FLOAT")
+        files.append(path)
+
+    return {
+        "precision": precision, "load_seconds": load_seconds, "synth_seconds": synth_seconds,
+        "audio_seconds": audio_seconds, "rtf": synth_seconds / audio_seconds if audio_seconds else None,
+        "peak_rss_mb": peak_rss_mb(), "files": files,
+    }
+
+def snr_db(reference, audio):
+    """Signal-to-noise ratio of audio against reference over their common length."""
+    n = min(len(reference), len(audio))
+    noise = np.sum((reference[:n] - audio[:n]) ** 2)
+    if noise == 0:
+        return float("inf")
+    return float(10 * np.log10(np.sum(reference[:n] ** 2) / noise))
+
+def power_spectrogram(audio, n_fft=1024, hop=256):
+    frames = 1 + max(0, len(audio) - n_fft) // hop
+    window = np.hanning(n_fft)
+    padded = np.pad(audio, (0, max(0, n_fft - len(audio))))
+    stacked = np.stack([padded[i * hop:i * hop + n_fft] * window for i in range(frames)])
+    return np.abs(np.fft.rfft(stacked, axis=1)) ** 2
+
+def log_spectral_distance(reference, audio, n_fft=1024, hop=256):
+    """
+    Mean over frames of the RMS difference of the log power spectra, in dB.
+
+    Both spectra are floored 80 dB below the reference's peak so near-silent
+    bins do not dominate the distance.
+    """
+    n = min(len(reference), len(audio))
+    ref = power_spectrogram(reference[:n], n_fft, hop)
+    floor = max(ref.max(), 1e-20) * 1e-8
+    ref = 10 * np.log10(np.maximum(ref, floor))
+    test = 10 * np.log10(np.maximum(power_spectrogram(audio[:n], n_fft, hop), floor))
+    return float(np.mean(np.sqrt(np.mean((ref - test) ** 2, axis=1))))
+
+def compare(reference_files, files):
+    """Average SNR, LSD and relative length difference of files against reference_files."""
+    snrs, lsds, lengths = [], [], []
+    for reference_path, path in zip(reference_files, files):
+        reference, _ = sf.read(reference_path, dtype="float32")
+        audio, _ = sf.read(path, dtype="float32")
+        snrs.append(snr_db(reference, audio))
+        lsds.append(log_spectral_distance(reference, audio))
+        lengths.append(abs(len(audio) - len(reference)) / max(len(reference), 1))
+    return {"snr_db": float(np.mean(snrs)), "lsd_db": float(np.mean(lsds)), "length_diff": float(np.mean(lengths))}
+
+def print_report(results):
+    print(f"{'precision':<10}{'RTF':>8}{'load s':>9}{'peak RSS MB':>13}{'SNR dB':>9}{'LSD dB':>9}{'length':>9}")
+    for r in results:
+        if "snr_db" in r:
+            distances = f"{r['snr_db']:>9.1f}{r['lsd_db']:>9.2f}{r['length_diff']:>9.1%}"
+        else:
+            distances = f"{'(reference)':>27}"
+        print(f"{r['precision']:<10}{r['rtf']:>8.3f}{r['load_seconds']:>9.1f}{r['peak_rss_mb']:>13.0f}{distances}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare reduced-precision TTS inference against fp32.")
+    parser.add_argument("--engine", default="kokoro", choices=["kokoro", "dia"], help="TTS backend")
+    parser.add_argument("--precisions", nargs="+", default=list(PRECISIONS), choices=PRECISIONS,
+                        help="Precisions to compare; fp32 always runs as the reference")
+    parser.add_argument("--text-dir", default="parsed_text", help="Directory of parsed chapter texts")
+    parser.add_argument("--samples", type=int, default=3, help="Number of chapters to take a sample text from")
+    parser.add_argument("--max-chars", type=int, default=200, help="Maximum characters per sample text")
+    parser.add_argument("--voice", help="Kokoro voice or Dia voice profile")
+    parser.add_argument("--lang-code", default="b", help="Kokoro language code")
+    parser.add_argument("--device", default="cpu", help="Torch device (int8 always runs on cpu)")
+    parser.add_argument("--threads", type=int, help="Torch intra-op threads")
+    parser.add_argument("--output-dir", default=DEFAULT_OUTPUT_DIR, help="Directory for the sample audio and report")
+    parser.add_argument("--worker", choices=PRECISIONS, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    texts_path = os.path.join(args.output_dir, "texts.json")
+
+    if args.worker:
+        from device_utils import configure_threads
+        configure_threads(args.threads)
+        with open(texts_path, "r") as f:
+            texts = json.load(f)
+        result = run_precision(args.engine, args.worker, texts, args.output_dir, args.device, args.voice,
+                               args.lang_code)
+        with open(os.path.join(args.output_dir, args.worker, "result.json"), "w") as f:
+            json.dump(result, f, indent=2)
+        return
+
+    texts = sample_texts(args.text_dir, args.samples, args.max_chars)
+    if not texts:
+        raise SystemExit(f"No sample texts found in {args.text_dir}")
+    os.makedirs(args.output_dir, exist_ok=True)
+    with open(texts_path, "w") as f:
+        json.dump(texts, f, indent=2)
+
+    precisions = ["fp32"] + [p for p in args.precisions if p != "fp32"]
+    results = []
+    for precision in precisions:
+        print(f"Running {args.engine} at {precision} on {len(texts)} sample texts")
+        subprocess.run([sys.executable, os.path.abspath(__file__), *sys.argv[1:], "--worker", precision], check=True)
+        with open(os.path.join(args.output_dir, precision, "result.json"), "r") as f:
+            result = json.load(f)
+        if precision != "fp32":
+            result.update(compare(results[0]["files"], result["files"]))
+        results.append(result)
+
+    with open(os.path.join(args.output_dir, "report.json"), "w") as f:
+        json.dump({"engine": args.engine, "texts": texts, "results": results}, f, indent=2)
+    print_report(results)
+
+if __name__ == "__main__":
+    main()
@@ -1,94 +1,143 @@
+import argparse
 import json
 import os
 import PyPDF2
 import ast
 import glob
 import re
+from concurrent.futures import ThreadPoolExecutor
 
-def create_chapters():
-    # Load the TOC data from JSON file
-    with open('toc.json', 'r') as f:
+def load_sections(toc_path='toc.json'):
+    """Load the chapter page ranges from the TOC JSON produced by get_toc.py."""
+    with open(toc_path, 'r') as f:
         toc_data = json.load(f)
 
     # Parse the sections data (it's stored as a string in the JSON)
-    sections = ast.literal_eval(toc_data['sections'])
-
-    # Get a list of all PDF files in the current directory
-    pdf_files = glob.glob('output_pdf_chunks/*.pdf')
-
-    # Sort PDF files by the part number in their filename
-    def get_part_number(filename):
-        match = re.search(r'part_(\d+)\.pdf$', filename)
-        return int(match.group(1)) if match else 0
-
-    pdf_files.sort(key=get_part_number)
-
-    print(f"Found {len(pdf_files)} PDF files")
-    print(f"Sorted PDF files: {pdf_files}")
-
-    # Create output directory if it doesn't exist
-    output_dir = 'chapters'
+    return ast.literal_eval(toc_data['sections'])
+
+def get_part_number(filename):
+    """Sort key for chunk files named like 'rlhfbook_part_3.pdf'."""
+    match = re.search(r'part_(\d+)\.pdf$', filename)
+    return int(match.group(1)) if match else 0
+
+def safe_filename(section_name):
+    """Create a valid filename from a section name."""
+    return section_name.replace('/', '-').replace(':', '-')
+
+def build_page_index(readers):
+    """
+    Map every global page number to the chunk holding it.
+
+    Args:
+        readers (list): Open PdfReader objects, in chunk order
+
+    Returns:
+        list: Entry i is the (chunk index, local page) pair for global page i + 1
+    """
+    page_index = []
+    for chunk_idx, reader in enumerate(readers):
+        for local_page in range(len(reader.pages)):
+            page_index.append((chunk_idx, local_page))
+    return page_index
+
+def resolve_page_range(section_name, page_range, total_pages):
+    """Turn a TOC (start, end) pair into 1-based integer bounds clamped to the book."""
+    start_page, end_page = page_range
+
+    # Handle the "NA" case for end_page (e.g., Bibliography section)
+    if end_page == "NA":
+        end_page = total_pages
+        print(f"Setting end page for {section_name} to total page count: {end_page}")
+
+    return int(start_page), min(int(end_page), total_pages)
+
+def write_pdf(pdf_writer, output_filename):
+    with open(output_filename, 'wb') as output_pdf:
+        pdf_writer.write(output_pdf)
+    print(f"Created: {output_filename}")
+    return output_filename
+
+def write_chapters(readers, sections, output_dir='chapters', max_workers=None):
+    """
+    Write one PDF per TOC section from already opened readers.
+
+    Pages are copied into per-section writers in a single pass over the page
+    index, then the chapter files are serialized in parallel.
+
+    Args:
+        readers (list): Open PdfReader objects whose pages, concatenated, form the book
+        sections (dict): Section name -> (start, end) page range from the TOC
+        output_dir (str): Directory to save the chapter PDFs
+        max_workers (int): Number of threads writing chapter files
+
+    Returns:
+        list: Paths of the created chapter files
+    """
     os.makedirs(output_dir, exist_ok=True)
 
-    # Process each section
-    for section_name, page_range in sections.items():
-        start_page, end_page = page_range
-
-        # Handle the "NA" case for end_page (e.g., Bibliography section)
-        if end_page == "NA":
-            # Calculate the total number of pages across all PDF files
-            total_pages = 0
-            for pdf_file in pdf_files:
-                with open(pdf_file, 'rb') as f:
-                    reader = PyPDF2.PdfReader(f)
-                    total_pages += len(reader.pages)
-
-            # Use the total page count as the end page
-            end_page = total_pages
-            print(f"Setting end page for {section_name} to total page count: {end_page}")
-
-        # Convert page numbers to integers
-        start_page = int(start_page)
-        end_page = int(end_page)
+    page_index = build_page_index(readers)
+    total_pages = len(page_index)
 
+    jobs = []
+    for section_name, page_range in sections.items():
+        start_page, end_page = resolve_page_range(section_name, page_range, total_pages)
         print(f"Processing section: {section_name} (pages {start_page}-{end_page})")
 
-        # Create a new PDF writer for this section
+        # add_page clones the page into the writer, so once this loop is done
+        # the writers no longer read from the shared source readers
         pdf_writer = PyPDF2.PdfWriter()
+        for chunk_idx, local_page in page_index[start_page - 1:end_page]:
+            pdf_writer.add_page(readers[chunk_idx].pages[local_page])
 
-        # Get the pages from the appropriate PDF files
-        current_page = 1
-        for pdf_file in pdf_files:
-            with open(pdf_file, 'rb') as f:
-                pdf_reader = PyPDF2.PdfReader(f)
-                num_pages = len(pdf_reader.pages)
-
-                # Check if this PDF contains pages we need
-                for page_num in range(num_pages):
-                    if start_page <= current_page <= end_page:
-                        pdf_writer.add_page(pdf_reader.pages[page_num])
+        output_filename = os.path.join(output_dir, f"{safe_filename(section_name)}.pdf")
+        jobs.append((pdf_writer, output_filename))
 
-                    current_page += 1
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(lambda job: write_pdf(*job), jobs))
 
-                    if current_page > end_page:
-                        break
+def create_chapters(toc_path='toc.json', output_dir='chapters'):
+    sections = load_sections(toc_path)
 
-            if current_page > end_page:
-                break
+    # Get a list of all PDF files in the current directory
+    pdf_files = glob.glob('output_pdf_chunks/*.pdf')
 
-        # Create a valid filename from the section name
-        safe_section_name = section_name.replace('/', '-').replace(':', '-')
-        output_filename = os.path.join(output_dir, f"{safe_section_name}.pdf")
+    # Sort PDF files by the part number in their filename
+    pdf_files.sort(key=get_part_number)
 
-        # Write the output file
-        with open(output_filename, 'wb') as output_pdf:
-            pdf_writer.write(output_pdf)
+    print(f"Found {len(pdf_files)} PDF files")
+    print(f"Sorted PDF files: {pdf_files}")
 
-        print(f"Created: {output_filename}")
+    # Each chunk is parsed exactly once and its reader stays open for all sections
+    readers = [PyPDF2.PdfReader(pdf_file) for pdf_file in pdf_files]
+    write_chapters(readers, sections, output_dir=output_dir)
 
     for file_to_remove in glob.glob("output_pdf_chunks/*.pdf"):
         os.remove(file_to_remove)
     print("Removed all PDF files in output_pdf_chunks directory")
 
+def create_chapters_from_source(input_pdf, toc_path='toc.json', output_dir='chapters'):
+    """
+    Write chapter PDFs straight from the source book using the TOC page ranges.
+
+    The source is read once and no intermediate output_pdf_chunks/ files are
+    written or deleted, since the TOC pages are already global page numbers.
+    """
+    sections = load_sections(toc_path)
+    reader = PyPDF2.PdfReader(input_pdf)
+    print(f"Loaded {input_pdf} ({len(reader.pages)} pages)")
+    return write_chapters([reader], sections, output_dir=output_dir)
+
+def main():
+    parser = argparse.ArgumentParser(description="Split the book into one PDF per TOC section.")
+    parser.add_argument("--source", help="Read chapters directly from this PDF instead of output_pdf_chunks/")
+    parser.add_argument("--toc", default="toc.json", help="Path to the TOC JSON file")
+    parser.add_argument("--output-dir", default="chapters", help="Directory to save chapter PDFs")
+    args = parser.parse_args()
+
+    if args.source:
+        create_chapters_from_source(args.source, args.toc, args.output_dir)
+    else:
+        create_chapters(args.toc, args.output_dir)
+
 if __name__ == "__main__":
-    create_chapters()
+    main()
@@ -0,0 +1,56 @@
+"""
+Torch device selection and CPU thread configuration shared by the TTS scripts.
+"""
+
+import os
+
+def select_device(preferred="auto"):
+    """
+    Resolve a torch device name.
+
+    'auto' picks CUDA, then Apple MPS, then CPU, so the same scripts run on the
+    Mac development machines and the CPU-only Linux hosts. An explicitly
+    requested accelerator that is not available falls back to CPU.
+    """
+    if preferred == "cpu":
+        return preferred
+
+    import torch
+    if preferred != "auto":
+        backend = preferred.split(":")[0]
+        available = {
+            "cuda": torch.cuda.is_available(),
+            "mps": getattr(torch.backends, "mps", None) is not None and torch.backends.mps.is_available(),
+        }.get(backend, True)
+        if not available:
+            print(f"Device {preferred} is not available, falling back to cpu")
+            return "cpu"
+        return preferred
+
+    if torch.cuda.is_available():
+        return "cuda"
+    if getattr(torch.backends, "mps", None) is not None and torch.backends.mps.is_available():
+        return "mps"
+    return "cpu"
+
+def configure_threads(intra_op=None, inter_op=None):
+    """
+    Set torch intra-op and inter-op thread counts.
+
+    Must run before the first model forward pass: torch only accepts an
+    inter-op setting before its thread pool starts.
+    """
+    import torch
+    if intra_op:
+        torch.set_num_threads(intra_op)
+    if inter_op:
+        try:
+            torch.set_num_interop_threads(inter_op)
+        except RuntimeError as e:
+            print(f"Could not set inter-op threads: {e}")
+
+def cpu_count():
+    """Cores available to this process (respects CPU affinity on Linux)."""
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
@@ -0,0 +1,167 @@
+"""
+Cached grapheme-to-phoneme stage for Kokoro.
+
+KPipeline re-phonemizes every sentence on every run, although the book repeats
+the same technical terms (RLHF, DPO, PPO) and 'source: ...' citation strings
+throughout. Here G2P runs as its own stage: each unique sentence is
+phonemized once and stored in a SQLite cache, together with the per-word
+phonemes misaki produced. Cached words are fed back into misaki's lexicon so
+out-of-vocabulary terms skip the slow fallback in later sentences. Misses can
+be phonemized in parallel worker processes that only load the G2P, not the
+acoustic model, and the acoustic model then consumes the phoneme strings via
+KPipeline.generate_from_tokens.
+
+Usage:
+    python g2p_cache.py parsed_text --workers 4
+"""
+
+import os
+import sqlite3
+import argparse
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from segmenter import sentence_spans
+
+DEFAULT_CACHE_PATH = ".g2p_cache.sqlite"
+# Kokoro rejects phoneme strings longer than its context window
+MAX_PHONEMES = 510
+
+def misaki_version():
+    try:
+        import misaki
+        return getattr(misaki, "__version__", "unknown")
+    except ImportError:
+        return "unknown"
+
+def split_sentences(text):
+    return [text[start:end] for start, end in sentence_spans(text)]
+
+class G2PCache:
+    """Persistent sentence -> phonemes and word -> phonemes store, namespaced by language and misaki version."""
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, lang_code='b'):
+        self.namespace = f"{lang_code}:{misaki_version()}"
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        with self.db:
+            self.db.execute("CREATE TABLE IF NOT EXISTS sentences (ns TEXT, text TEXT, phonemes TEXT, PRIMARY KEY (ns, text))")
+            self.db.execute("CREATE TABLE IF NOT EXISTS words (ns TEXT, text TEXT, phonemes TEXT, PRIMARY KEY (ns, text))")
+
+    def get_sentences(self, sentences):
+        """Cached phonemes for the given sentences; missing ones are left out of the result."""
+        found = {}
+        with self.lock:
+            for sentence in set(sentences):
+                row = self.db.execute("SELECT phonemes FROM sentences WHERE ns = ? AND text = ?",
+                                      (self.namespace, sentence)).fetchone()
+                if row is not None:
+                    found[sentence] = row[0]
+        return found
+
+    def put(self, sentence, phonemes, words=()):
+        with self.lock, self.db:
+            self.db.execute("INSERT OR REPLACE INTO sentences VALUES (?, ?, ?)", (self.namespace, sentence, phonemes))
+            self.db.executemany("INSERT OR IGNORE INTO words VALUES (?, ?, ?)",
+                                [(self.namespace, word, word_phonemes) for word, word_phonemes in words])
+
+    def words(self):
+        with self.lock:
+            return dict(self.db.execute("SELECT text, phonemes FROM words WHERE ns = ?", (self.namespace,)))
+
+def token_words(tokens):
+    """(word, phonemes) pairs from misaki tokens, skipping punctuation and unresolved words."""
+    return [(token.text, token.phonemes) for token in tokens or []
+            if token.phonemes and any(ch.isalpha() for ch in token.text)]
+
+def prime_lexicon(g2p, words):
+    """Add cached word phonemes to misaki's gold lexicon without overriding its own entries."""
+    golds = getattr(getattr(g2p, "lexicon", None), "golds", None)
+    if golds is None:
+        return
+    for word, phonemes in words.items():
+        golds.setdefault(word, phonemes)
+
+def run_g2p(g2p, sentence):
+    """Phonemize one sentence; returns (phonemes, [(word, phonemes), ...])."""
+    phonemes, tokens = g2p(sentence)
+    return phonemes, token_words(tokens)
+
+class Phonemizer:
+    """
+    Sentence-level G2P through the cache.
+
+    Args:
+        g2p: The G2P callable of a KPipeline (pipeline.g2p)
+        cache (G2PCache): Persistent phoneme cache
+    """
+
+    def __init__(self, g2p, cache):
+        self.g2p = g2p
+        self.cache = cache
+        prime_lexicon(g2p, cache.words())
+
+    def phonemize(self, text):
+        """Phonemes for a segment, phonemizing only sentences not in the cache."""
+        sentences = split_sentences(text)
+        known = self.cache.get_sentences(sentences)
+        for sentence in sentences:
+            if sentence not in known:
+                phonemes, words = run_g2p(self.g2p, sentence)
+                self.cache.put(sentence, phonemes, words)
+                known[sentence] = phonemes
+        return " ".join(known[sentence] for sentence in sentences if known[sentence])
+
+    def length(self, text):
+        """Real phoneme count, usable as segmenter length_fn."""
+        return len(self.phonemize(text))
+
+# Each worker process holds a G2P-only pipeline (no acoustic model weights)
+_worker_g2p = None
+
+def _init_worker(lang_code):
+    global _worker_g2p
+    from kokoro import KPipeline
+    _worker_g2p = KPipeline(lang_code=lang_code, model=False).g2p
+
+def _phonemize_in_worker(sentence):
+    return run_g2p(_worker_g2p, sentence)
+
+def phonemize_all(texts, cache, lang_code='b', workers=None):
+    """
+    Fill the cache for every sentence in texts, running G2P on misses in parallel.
+
+    Returns:
+        int: Number of sentences that had to be phonemized
+    """
+    sentences = list(dict.fromkeys(sentence for text in texts for sentence in split_sentences(text)))
+    known = cache.get_sentences(sentences)
+    misses = [sentence for sentence in sentences if sentence not in known]
+    print(f"{len(sentences) - len(misses)}/{len(sentences)} sentences already phonemized")
+    if not misses:
+        return 0
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(lang_code,)) as executor:
+        for sentence, (phonemes, words) in zip(misses, executor.map(_phonemize_in_worker, misses, chunksize=16)):
+            cache.put(sentence, phonemes, words)
+    return len(misses)
+
+def main():
+    parser = argparse.ArgumentParser(description="Precompute phonemes for parsed chapters.")
+    parser.add_argument("text_dir", nargs="?", default="parsed_text", help="Directory of parsed chapter texts")
+    parser.add_argument("--lang-code", default="b", help="Kokoro language code")
+    parser.add_argument("--workers", type=int, help="G2P worker processes")
+    parser.add_argument("--cache-path", default=DEFAULT_CACHE_PATH, help="Path of the phoneme cache")
+    args = parser.parse_args()
+
+    texts = []
+    for fp in sorted(os.listdir(args.text_dir)):
+        if fp.endswith(".txt"):
+            with open(os.path.join(args.text_dir, fp), "r") as f:
+                texts.append(f.read())
+
+    count = phonemize_all(texts, G2PCache(args.cache_path, args.lang_code), args.lang_code, args.workers)
+    print(f"Phonemized {count} new sentences")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,228 @@
+"""
+Content-addressed on-disk cache for Gemini generate_content responses.
+
+Entries are keyed on the hash of every request part (PDF bytes, prompt text),
+the model name and the response schema, so re-running parse_content.py or
+get_toc.py on unchanged inputs returns the parsed response without a network
+round-trip. The cache only relies on client.models.generate_content returning
+an object with a `.text` attribute, so StubClient can stand in for the real
+client when working offline.
+"""
+
+import hashlib
+import json
+import os
+from types import SimpleNamespace
+
+from google.genai import types
+
+DEFAULT_CACHE_DIR = ".gemini_cache"
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+
+def sha256_bytes(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+def schema_fingerprint(schema) -> str:
+    """Stable string for a pydantic response schema."""
+    if schema is None:
+        return ""
+    return json.dumps(schema.model_json_schema(), sort_keys=True)
+
+def request_key(model: str, contents: list, schema=None) -> str:
+    """
+    Hash a request into a cache key.
+
+    Args:
+        model (str): Gemini model name
+        contents (list): Request parts, bytes for PDF documents and str for text/prompts
+        schema: Pydantic model used as response_schema (or None)
+    """
+    hasher = hashlib.sha256()
+    hasher.update(model.encode())
+    for part in contents:
+        if isinstance(part, bytes):
+            hasher.update(b"pdf:" + sha256_bytes(part).encode())
+        else:
+            hasher.update(b"text:" + sha256_bytes(part.encode()).encode())
+    hasher.update(b"schema:" + schema_fingerprint(schema).encode())
+    return hasher.hexdigest()
+
+def build_contents(contents: list) -> list:
+    """Wrap raw PDF bytes into Parts, leaving text parts untouched."""
+    return [
+        types.Part.from_bytes(data=part, mime_type='application/pdf') if isinstance(part, bytes) else part
+        for part in contents
+    ]
+
+def build_config(schema=None) -> dict:
+    if schema is None:
+        return {}
+    return {
+        'response_mime_type': 'application/json',
+        'response_schema': schema,
+    }
+
+class ResponseCache:
+    """Persistent response store with least-recently-used eviction by total size."""
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def get(self, key: str):
+        """Return the cached response text for key, or None on a miss."""
+        path = self._path(key)
+        try:
+            with open(path, "r") as f:
+                entry = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+        # Bump the modification time so eviction drops least recently used entries first
+        os.utime(path)
+        return entry["text"]
+
+    def put(self, key: str, text: str, model: str = ""):
+        path = self._path(key)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"model": model, "text": text}, f)
+        os.replace(tmp_path, path)
+        self.evict()
+
+    def size(self) -> int:
+        return sum(os.path.getsize(os.path.join(self.cache_dir, f))
+                   for f in os.listdir(self.cache_dir) if f.endswith(".json"))
+
+    def evict(self):
+        """Remove least recently used entries until the cache fits in max_bytes."""
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith(".json"):
+                continue
+            path = os.path.join(self.cache_dir, name)
+            stat = os.stat(path)
+            entries.append((stat.st_mtime, stat.st_size, path))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            os.remove(path)
+            total -= size
+
+def parse_response(text: str, schema=None):
+    if schema is None:
+        return text
+    return schema.model_validate_json(text)
+
+def generate_cached(client, model: str, contents: list, schema=None, cache: ResponseCache = None):
+    """
+    Call client.models.generate_content through the cache.
+
+    Args:
+        client: genai.Client or StubClient
+        model (str): Gemini model name
+        contents (list): Request parts, bytes for PDF documents and str for text/prompts
+        schema: Pydantic model for the structured response, or None for plain text
+        cache (ResponseCache): Cache to use, or None to always call the API
+
+    Returns:
+        An instance of schema (or the raw response text when schema is None)
+    """
+    key = request_key(model, contents, schema)
+    if cache is not None:
+        text = cache.get(key)
+        if text is not None:
+            print(f"Cache hit: {key[:12]}")
+            return parse_response(text, schema)
+
+    response = client.models.generate_content(
+        model=model,
+        contents=build_contents(contents),
+        config=build_config(schema),
+    )
+
+    parsed = parse_response(response.text, schema)
+    if cache is not None:
+        cache.put(key, response.text, model=model)
+    return parsed
+
+async def agenerate_cached(client, model: str, contents: list, schema=None, cache: ResponseCache = None):
+    """Async variant of generate_cached using client.aio.models.generate_content."""
+    key = request_key(model, contents, schema)
+    if cache is not None:
+        text = cache.get(key)
+        if text is not None:
+            print(f"Cache hit: {key[:12]}")
+            return parse_response(text, schema)
+
+    response = await client.aio.models.generate_content(
+        model=model,
+        contents=build_contents(contents),
+        config=build_config(schema),
+    )
+
+    parsed = parse_response(response.text, schema)
+    if cache is not None:
+        cache.put(key, response.text, model=model)
+    return parsed
+
+def stream_cached(client, model: str, contents: list, cache: ResponseCache = None):
+    """
+    Stream a plain-text response through client.models.generate_content_stream.
+
+    Yields text chunks as they arrive. The full text is cached once the stream
+    completes, and a later hit yields it as a single chunk.
+    """
+    key = request_key(model, contents, schema=None)
+    if cache is not None:
+        text = cache.get(key)
+        if text is not None:
+            print(f"Cache hit: {key[:12]}")
+            yield text
+            return
+
+    chunks = []
+    for chunk in client.models.generate_content_stream(
+        model=model,
+        contents=build_contents(contents),
+        config=build_config(None),
+    ):
+        if chunk.text:
+            chunks.append(chunk.text)
+            yield chunk.text
+
+    if cache is not None:
+        cache.put(key, "".join(chunks), model=model)
+
+class StubClient:
+    """
+    Offline stand-in for genai.Client.
+
+    `respond` is called with (model, contents, config) and returns the response
+    text; every call is recorded in `calls` so cache hits can be checked.
+    """
+
+    def __init__(self, respond):
+        self.calls = []
+        self.models = SimpleNamespace(generate_content=self._generate_content,
+                                      generate_content_stream=self._generate_content_stream)
+        self.aio = SimpleNamespace(models=SimpleNamespace(generate_content=self._agenerate_content))
+        self._respond = respond
+
+    def _generate_content(self, model, contents, config=None):
+        self.calls.append((model, contents, config))
+        return SimpleNamespace(text=self._respond(model, contents, config))
+
+    async def _agenerate_content(self, model, contents, config=None):
+        return self._generate_content(model, contents, config)
+
+    def _generate_content_stream(self, model, contents, config=None, chunk_size=64):
+        text = self._generate_content(model, contents, config).text
+        for i in range(0, len(text), chunk_size):
+            yield SimpleNamespace(text=text[i:i + chunk_size])
@@ -1,11 +1,208 @@
-from dia.model import Dia
+"""
+Long-form chapter synthesis with Dia.
 
-model = Dia.from_pretrained("nari-labs/Dia-1.6B", device="mps")
+Sending a whole chapter to model.generate truncates it at max_tokens. Here the
+chapter is split into model-sized chunks of whole sentences and every chunk is
+generated with the same transcript and audio as prompt, the voice-cloning
+trick stitch_generate_dia.py shows for a single clip: the voice profile, or
+without one the first generated chunk. Chaining each chunk on the previous one
+instead lets small changes in the voice add up over a chapter. Encoding a
+finished chunk into the output file runs on a background thread while the
+model generates the next chunk.
 
-with open("parsed_text/chapter_1.txt", "r") as f:
-	text = f.read()
+Usage:
+    python generate_dia.py parsed_text/chapter_1.txt --output output_audio/chapter_1.mp3
+    python generate_dia.py parsed_text/chapter_1.txt --reference-audio sample.mp3 --reference-text sample.txt
+    python generate_dia.py parsed_text/chapter_1.txt --voice-profile narrator
+"""
 
-text = "[S1] " + text
-output = model.generate(text, use_torch_compile=False, verbose=True, max_tokens=2048)
+import os
+import argparse
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import soundfile as sf
 
-model.save_audio("output_audio/chapter_1.mp3", output)
\ No newline at end of file
+from segmenter import segment_text
+from audio_writer import StreamingAudioWriter
+from timing_index import TimingIndex, index_path
+from voice_profiles import VoiceProfileStore
+from device_utils import select_device
+from quantize import PRECISIONS, check_precision, apply_precision
+
+DIA_SAMPLE_RATE = 44100
+# Dia's audio codec runs at about 86 tokens per second of audio and the prompt audio
+# counts against its 3072 token context; a chunk of this many characters takes roughly
+# 14 seconds to speak, so a chunk-sized prompt plus the new chunk still fit
+DEFAULT_CHUNK_CHARS = 200
+CHARS_PER_SECOND = 14
+TOKENS_PER_SECOND = 86
+MAX_TOKENS = 3072
+# nari-tts release whose API (load_audio, compute_dtype, audio prompt codes) this module is written against
+DIA_VERSION = "0.1.0"
+
+def load_model(device="auto", precision="fp32"):
+    """
+    Load Dia-1.6B.
+
+    bf16 uses Dia's own bfloat16 compute dtype. int8 dynamically quantizes the
+    torch Linear layers; Dia's projections are einsum based, so check the
+    reported layer count (and compare_precision.py) before relying on it.
+    """
+    from importlib.metadata import version, PackageNotFoundError
+    from dia.model import Dia
+
+    try:
+        installed = version("nari-tts")
+    except PackageNotFoundError:
+        installed = None
+    if installed != DIA_VERSION:
+        print(f"Dia {installed or '(unknown version)'} is installed, this module was written against {DIA_VERSION}")
+    device = check_precision(precision, select_device(device))
+    print(f"Loading Dia on {device} ({precision})")
+    compute_dtype = "bfloat16" if precision == "bf16" else "float32"
+    model = Dia.from_pretrained("nari-labs/Dia-1.6B", compute_dtype=compute_dtype, device=device)
+    if precision == "int8":
+        apply_precision(model.model, precision, device)
+    return model
+
+def speaker_text(text, speaker="[S1]"):
+    """Dia expects speaker tags in front of the text."""
+    return f"{speaker} {text.strip()}"
+
+def chunk_chapter(text, max_chars=DEFAULT_CHUNK_CHARS):
+    """Segments of whole sentences of at most max_chars characters (see segmenter.py)."""
+    return segment_text(text, target=max_chars, length_fn=len)
+
+def token_budget(text, prompt_tokens=0):
+    """max_tokens for one chunk, with headroom for slow passages, minus what the audio prompt uses."""
+    seconds = len(text) / CHARS_PER_SECOND
+    available = MAX_TOKENS - prompt_tokens
+    return max(min(int(seconds * TOKENS_PER_SECOND * 1.5) + TOKENS_PER_SECOND, available), TOKENS_PER_SECOND)
+
+def encode_prompt_audio(model, audio, directory):
+    """Encode generated audio into prompt tokens once, like a voice profile, instead of on every call."""
+    path = os.path.join(directory, "prompt.wav")
+    sf.write(path, audio, DIA_SAMPLE_RATE)
+    return model.load_audio(path)
+
+def prompt_length(prompt_audio):
+    """Audio tokens a prompt occupies; prompt_audio is a file path or an encoded token tensor."""
+    if isinstance(prompt_audio, str):
+        info = sf.info(prompt_audio)
+        return int(info.frames / info.samplerate * TOKENS_PER_SECOND)
+    return prompt_audio.shape[0]
+
+def generate_chunk(model, text, prompt_text=None, prompt_audio=None):
+    """
+    Generate one chunk, conditioned on a transcript and its audio when given.
+
+    Dia only returns audio for the text following the prompt transcript.
+    prompt_audio is a file path or the token tensor of a voice profile, which
+    skips re-encoding the clip.
+    """
+    prompt_tokens = 0
+    if prompt_audio is not None:
+        full_text = speaker_text(prompt_text) + " " + speaker_text(text)
+        prompt_tokens = prompt_length(prompt_audio)
+    else:
+        full_text = speaker_text(text)
+    output = model.generate(full_text, audio_prompt=prompt_audio,
+                            max_tokens=token_budget(text, prompt_tokens), use_torch_compile=False, verbose=False)
+    return np.asarray(output, dtype=np.float32).reshape(-1)
+
+def generate_chapter(model, text_path, output_path, max_chars=DEFAULT_CHUNK_CHARS, voice_profile=None,
+                     progress=None):
+    """
+    Render a whole chapter into one audio file with a continuous voice.
+
+    Args:
+        model: Loaded Dia model
+        text_path (str): Parsed chapter text
+        output_path (str): Output audio file (format from the extension)
+        max_chars (int): Maximum characters per generated chunk
+        voice_profile (tuple): Optional (audio tokens, transcript) from VoiceProfileStore conditioning every chunk
+        progress (callable): Called with (chunks done, total chunks) after every chunk
+
+    Returns:
+        int: Number of chunks generated
+    """
+    with open(text_path, "r") as f:
+        text = f.read()
+    return generate_text(model, text, output_path, max_chars, voice_profile, text_path, progress)
+
+def generate_text(model, text, output_path, max_chars=DEFAULT_CHUNK_CHARS, voice_profile=None, text_path=None,
+                  progress=None):
+    """
+    generate_chapter for text that is not (yet) in a file.
+
+    With a fixed voice prompt the only CPU work per chunk besides generation
+    is encoding its audio into the output file, so that is what overlaps the
+    generation of the next chunk. Preparing a chunk's text is negligible, and
+    the one-off encoding of the first chunk as prompt is needed before the
+    second chunk can start.
+    """
+    chunks = chunk_chapter(text, max_chars)
+    index = TimingIndex(DIA_SAMPLE_RATE, text_path)
+    # Fixed conditioning for every chunk: the voice profile, or else the first chunk once it is generated
+    prompt_audio, prompt_text = voice_profile if voice_profile is not None else (None, None)
+
+    # The writer is the outer context so the encoder thread is done with it before it closes or aborts
+    with tempfile.TemporaryDirectory() as tmp_dir, \
+            StreamingAudioWriter(output_path, sample_rate=DIA_SAMPLE_RATE) as writer, \
+            ThreadPoolExecutor(max_workers=1) as encoder:
+        pending = None
+        position = 0
+        for i, chunk in enumerate(chunks):
+            print(f"Chunk {i + 1}/{len(chunks)}: {chunk.text[:60]}")
+            audio = generate_chunk(model, chunk.text, prompt_text, prompt_audio)
+
+            # Encode this chunk while the next one is generated; one worker keeps the writes in order
+            if pending is not None:
+                pending.result()
+            pending = encoder.submit(writer.write, audio)
+            index.add(chunk.start, chunk.end, position, position + len(audio))
+            position += len(audio)
+
+            if prompt_audio is None:
+                prompt_text, prompt_audio = chunk.text, encode_prompt_audio(model, audio, tmp_dir)
+            if progress is not None:
+                progress(i + 1, len(chunks))
+        if pending is not None:
+            pending.result()
+
+    index.save(index_path(output_path))
+    return len(chunks)
+
+def main():
+    parser = argparse.ArgumentParser(description="Render a whole chapter with Dia in voice-continuous chunks.")
+    parser.add_argument("text", nargs="?", default="parsed_text/chapter_1.txt", help="Parsed chapter text")
+    parser.add_argument("--output", default="output_audio/chapter_1.mp3", help="Output audio file")
+    parser.add_argument("--max-chars", type=int, default=DEFAULT_CHUNK_CHARS, help="Maximum characters per chunk")
+    parser.add_argument("--voice-profile", help="Stored voice profile to clone (see voice_profiles.py)")
+    parser.add_argument("--reference-audio", help="Voice sample to clone; encoded once into a voice profile")
+    parser.add_argument("--reference-text", help="Text file with the transcript of --reference-audio")
+    parser.add_argument("--device", default="auto", help="Torch device: auto, cpu, cuda or mps")
+    parser.add_argument("--precision", default="fp32", choices=PRECISIONS,
+                        help="Inference precision: int8 (CPU only) or bf16 trade some quality for speed")
+    args = parser.parse_args()
+
+    device = check_precision(args.precision, select_device(args.device))
+    model = load_model(device, args.precision)
+    store = VoiceProfileStore()
+    voice_profile = None
+    if args.reference_audio:
+        with open(args.reference_text, "r") as f:
+            reference_text = f.read()
+        name = args.voice_profile or os.path.splitext(os.path.basename(args.reference_audio))[0]
+        voice_profile = store.get_or_create(model, name, args.reference_audio, reference_text, device)
+    elif args.voice_profile:
+        voice_profile = store.load(args.voice_profile, device)
+        if voice_profile is None:
+            raise SystemExit(f"No voice profile named '{args.voice_profile}', create it with voice_profiles.py")
+
+    count = generate_chapter(model, args.text, args.output, args.max_chars, voice_profile)
+    print(f"Generated {count} chunks into {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,19 @@
+import os
+import re
+import time
+import argparse
+import multiprocessing
+from itertools import islice
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
 
-from kokoro import KPipeline
-import soundfile as sf
+from device_utils import select_device, configure_threads, cpu_count
+from audio_cache import SegmentAudioCache, segment_key
+from segmenter import segment_text, longest_first, estimate_length, DEFAULT_TARGET
+from g2p_cache import G2PCache, Phonemizer, MAX_PHONEMES
+from audio_writer import StreamingAudioWriter
+from timing_index import TimingIndex, index_path
+from quantize import PRECISIONS, check_precision, apply_precision
 
 # 'a' => American English
 # 'b' => British English
@@ -12,27 +25,290 @@ import soundfile as sf
 # 'p' => Brazilian Portuguese pt-br
 # 'z' => Mandarin Chinese: pip install misaki[zh]
 
-pipeline = KPipeline(lang_code='b', device='mps') # <= make sure lang_code matches voice, reference above.
-
-with open('parsed_text/8 Regularization.txt', 'r') as f:
-    text = f.read().strip()
-
-# Generate, display, and save audio files in a loop.
-generator = pipeline(
-    text, voice='af_heart', # <= change voice here
-    speed=1, split_pattern=r'\n+'
-)
-
-# Alternatively, load voice tensor directly:
-# voice_tensor = torch.load('path/to/voice.pt', weights_only=True)
-# generator = pipeline(
-#     text, voice=voice_tensor,
-#     speed=1, split_pattern=r'\n+'
-# )
-
-for i, (gs, ps, audio) in enumerate(generator):
-    print(i)  # i => index
-    print(gs) # gs => graphemes/text
-    print(ps) # ps => phonemes
-    #display(Audio(data=audio, rate=24000, autoplay=i==0))
-    sf.write(f'output_audio/{i}.wav', audio, 24000) # save each audio file
+SAMPLE_RATE = 24000
+DEFAULT_REPO_ID = 'hexgrad/Kokoro-82M'
+# Segments in flight per worker in parallel mode; enough to keep workers busy while the writer catches up
+IN_FLIGHT_PER_WORKER = 4
+# The vocoder ends in an inverse STFT, which has no bfloat16 kernel
+BF16_FLOAT32_MODULES = ('decoder.generator',)
+
+def load_pipeline(lang_code='b', device='auto', precision='fp32'):
+    # Imported here so scripts that only use the helpers (or the engine registry) start fast
+    from kokoro import KPipeline
+    device = check_precision(precision, select_device(device))
+    print(f"Loading Kokoro pipeline on {device} ({precision})")
+    pipeline = KPipeline(lang_code=lang_code, device=device) # <= make sure lang_code matches voice, reference above.
+    if precision != 'fp32':
+        apply_precision(pipeline.model, precision, device, BF16_FLOAT32_MODULES)
+    pipeline.precision = precision
+    return pipeline
+
+def model_version(repo_id=DEFAULT_REPO_ID, precision='fp32'):
+    """Identifies the weights (and precision) in audio cache keys, so upgrading Kokoro invalidates cached segments."""
+    import kokoro
+    version = f"{repo_id}@{getattr(kokoro, '__version__', 'unknown')}"
+    return version if precision == 'fp32' else f"{version}+{precision}"
+
+def load_phonemizer(lang_code='b', pipeline=None):
+    """Cached G2P stage; reuses the pipeline's G2P or loads a G2P-only pipeline without model weights."""
+    if pipeline is None:
+        from kokoro import KPipeline
+        pipeline = KPipeline(lang_code=lang_code, model=False)
+    return Phonemizer(pipeline.g2p, G2PCache(lang_code=lang_code))
+
+def split_segments(text, target=DEFAULT_TARGET, phonemizer=None):
+    """
+    Sentence-packed segments of roughly `target` phonemes (see segmenter.py).
+
+    With a phonemizer the budget is measured in real (cached) phonemes instead of
+    the character-based estimate.
+
+    Returns:
+        list: Segment(text, start, end) tuples with character offsets into text
+    """
+    length_fn = phonemizer.length if phonemizer is not None else estimate_length
+    return segment_text(text, target=target, length_fn=length_fn)
+
+def synthesize_audio(pipeline, text, voice='af_heart', speed=1, phonemes=None):
+    """
+    Run the acoustic model on one segment.
+
+    Precomputed phonemes skip KPipeline's own G2P; a segment with a single sentence
+    longer than the phoneme window goes through the text path, where Kokoro splits
+    it internally. The pieces are concatenated so each segment maps to one array.
+    """
+    if phonemes and len(phonemes) <= MAX_PHONEMES:
+        results = pipeline.generate_from_tokens(phonemes, voice=voice, speed=speed)
+    else:
+        results = pipeline(text, voice=voice, speed=speed, split_pattern=None)
+
+    pieces = [np.asarray(audio, dtype=np.float32) for _, _, audio in results if audio is not None]
+    return np.concatenate(pieces) if pieces else np.zeros(0, dtype=np.float32)
+
+def synthesize_segment(pipeline, text, voice='af_heart', speed=1, cache=None, phonemizer=None):
+    """Synthesize one segment of text, reusing cached audio when available."""
+    version = model_version(getattr(pipeline, 'repo_id', DEFAULT_REPO_ID), getattr(pipeline, 'precision', 'fp32'))
+    key = segment_key(text, voice, speed, pipeline.lang_code, version)
+    if cache is not None:
+        audio = cache.get(key)
+        if audio is not None:
+            return audio, True
+
+    phonemes = phonemizer.phonemize(text) if phonemizer is not None else None
+    audio = synthesize_audio(pipeline, text, voice=voice, speed=speed, phonemes=phonemes)
+    if cache is not None:
+        cache.put(key, audio)
+    return audio, False
+
+def chapter_audio_path(text_path, output_root='output_audio', format='mp3'):
+    """output_root/<chapter name>.<format> for a parsed chapter text."""
+    chapter = os.path.splitext(os.path.basename(text_path))[0]
+    return os.path.join(output_root, f'{chapter}.{format}')
+
+def synthesize_chapter(pipeline, text_path, output_path='output_audio/chapter.mp3', voice='af_heart', speed=1,
+                       cache=None, target=DEFAULT_TARGET, phonemizer=None):
+    """
+    Synthesize one parsed chapter into a single audio file.
+
+    Segments are appended to the encoder as they are synthesized, so memory use
+    does not grow with the chapter. With a SegmentAudioCache only segments whose
+    text (or voice settings) changed since a previous render are synthesized.
+    A TimingIndex mapping the text's character offsets to sample offsets is
+    saved next to the audio.
+
+    Returns:
+        int: Number of segments synthesized
+    """
+    # Not stripped, so segment offsets refer to positions in the file itself
+    with open(text_path, 'r') as f:
+        text = f.read()
+
+    # Alternatively, load voice tensor directly:
+    # voice_tensor = torch.load('path/to/voice.pt', weights_only=True)
+    # and pass voice=voice_tensor
+
+    segments = split_segments(text, target, phonemizer)
+    index = TimingIndex(SAMPLE_RATE, text_path)
+    hits = 0
+    with StreamingAudioWriter(output_path, sample_rate=SAMPLE_RATE) as writer:
+        for i, segment in enumerate(segments):
+            audio, cached = synthesize_segment(pipeline, segment.text, voice=voice, speed=speed, cache=cache,
+                                               phonemizer=phonemizer)
+            hits += cached
+            print(i, "(cached)" if cached else "")  # i => index
+            print(segment.text) # graphemes/text
+            index.add(segment.start, segment.end, writer.frames, writer.frames + len(audio))
+            writer.write(audio)
+    index.save(index_path(output_path))
+
+    print(f"{hits}/{len(segments)} segments from cache, {writer.duration:.0f}s of audio in {output_path}")
+    return len(segments)
+
+# Each worker process of the parallel mode holds its own pipeline
+_worker_pipeline = None
+
+def _init_worker(lang_code, threads, precision, inter_threads=1):
+    global _worker_pipeline
+    # Pin threads so N workers x T threads does not oversubscribe the cores
+    configure_threads(threads, inter_threads)
+    _worker_pipeline = load_pipeline(lang_code=lang_code, device='cpu', precision=precision)
+
+def _synthesize_in_worker(job):
+    text, phonemes, voice, speed = job
+    return synthesize_audio(_worker_pipeline, text, voice=voice, speed=speed, phonemes=phonemes)
+
+def make_worker_pool(lang_code='b', workers=2, threads_per_worker=None, precision='fp32', inter_threads=None):
+    """
+    Start worker processes for sharded CPU synthesis, each loading its own model once.
+
+    Each worker's torch thread count is pinned to threads_per_worker (cores / workers
+    by default) so N workers x T threads does not oversubscribe the cores.
+    """
+    threads_per_worker = threads_per_worker or max(1, cpu_count() // workers)
+    print(f"Starting {workers} synthesis workers x {threads_per_worker} threads")
+    # spawn avoids forking a parent that already initialised torch's thread pools
+    return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'),
+                               initializer=_init_worker, initargs=(lang_code, threads_per_worker, precision, inter_threads or 1))
+
+def synthesize_segments_parallel(executor, segments, lang_code='b', voice='af_heart', speed=1, cache=None,
+                                 phonemizer=None, precision='fp32', workers=2):
+    """
+    Synthesize segments on a worker pool, yielding audio in segment order.
+
+    Cached segments are served from the parent process; only misses are sent to
+    the workers, together with their phonemes when a phonemizer is given. At
+    most workers * IN_FLIGHT_PER_WORKER misses are in flight, so finished audio
+    never piles up far ahead of the segment being written.
+
+    Yields:
+        tuple: (segment index, audio, whether it came from the cache)
+    """
+    version = model_version(precision=precision)
+    keys = [segment_key(text, voice, speed, lang_code, version) for text in segments]
+    cached = [cache.get(key) if cache is not None else None for key in keys]
+    misses = [i for i, audio in enumerate(cached) if audio is None]
+    print(f"{len(segments) - len(misses)}/{len(segments)} segments from cache")
+
+    # Misses enter the window in segment order; each batch is submitted long segments first
+    # so workers finish together, then the audio is reassembled in segment order
+    rank = {i: r for r, i in enumerate(longest_first(segments, misses))}
+    window = max(1, workers) * IN_FLIGHT_PER_WORKER
+    pending = iter(misses)
+    futures = {}
+    for i in range(len(segments)):
+        for j in sorted(islice(pending, window - len(futures)), key=rank.get):
+            phonemes = phonemizer.phonemize(segments[j]) if phonemizer is not None else None
+            futures[j] = executor.submit(_synthesize_in_worker, (segments[j], phonemes, voice, speed))
+        if i in futures:
+            audio = futures.pop(i).result()
+            if cache is not None:
+                cache.put(keys[i], audio)
+            yield i, audio, False
+        else:
+            yield i, cached[i], True
+
+def synthesize_chapter_parallel(executor, text_path, output_path='output_audio/chapter.mp3', lang_code='b',
+                                voice='af_heart', speed=1, cache=None, target=DEFAULT_TARGET, phonemizer=None,
+                                precision='fp32', workers=2):
+    """Sharded CPU variant of synthesize_chapter writing the same audio file and timing index."""
+    with open(text_path, 'r') as f:
+        segments = split_segments(f.read(), target, phonemizer)
+
+    texts = [segment.text for segment in segments]
+    index = TimingIndex(SAMPLE_RATE, text_path)
+    with StreamingAudioWriter(output_path, sample_rate=SAMPLE_RATE) as writer:
+        for i, audio, cached in synthesize_segments_parallel(executor, texts, lang_code, voice, speed, cache,
+                                                             phonemizer, precision, workers):
+            print(i, "(cached)" if cached else "")
+            index.add(segments[i].start, segments[i].end, writer.frames, writer.frames + len(audio))
+            writer.write(audio)
+    index.save(index_path(output_path))
+    return len(segments)
+
+# Sort files by number at beginning of filename
+def extract_number(filename):
+    match = re.search(r'^(\d+)', filename)
+    return int(match.group(1)) if match else float('inf')
+
+def list_chapter_texts(text_dir='parsed_text'):
+    """Parsed chapter files in chapter order."""
+    files = [f for f in os.listdir(text_dir) if f.endswith('.txt')]
+    files.sort(key=extract_number)
+    return files
+
+def synthesize_book(pipeline, text_dir='parsed_text', output_root='output_audio', voice='af_heart', speed=1,
+                    cache=None, target=DEFAULT_TARGET, phonemizer=None, format='mp3'):
+    """
+    Synthesize every chapter in text_dir with one already loaded pipeline.
+
+    Each chapter is encoded to output_root/<chapter name>.<format>.
+    """
+    for fp in list_chapter_texts(text_dir):
+        chapter = os.path.splitext(fp)[0]
+        start = time.time()
+        text_path = os.path.join(text_dir, fp)
+        count = synthesize_chapter(pipeline, text_path, chapter_audio_path(text_path, output_root, format),
+                                   voice=voice, speed=speed, cache=cache, target=target, phonemizer=phonemizer)
+        print(f"Synthesized {chapter}: {count} segments in {time.time() - start:.1f}s")
+
+def main():
+    parser = argparse.ArgumentParser(description="Synthesize parsed chapters with Kokoro, loading the model once.")
+    parser.add_argument("--chapter", help="Only synthesize this parsed text file")
+    parser.add_argument("--text-dir", default="parsed_text", help="Directory of parsed chapter texts")
+    parser.add_argument("--output-dir", default="output_audio", help="Directory for the chapter audio files")
+    parser.add_argument("--format", default="mp3", choices=["mp3", "wav", "flac", "ogg", "opus"],
+                        help="Output audio format")
+    parser.add_argument("--voice", default="af_heart", help="Kokoro voice")
+    parser.add_argument("--lang-code", default="b", help="Kokoro language code (must match the voice)")
+    parser.add_argument("--speed", type=float, default=1, help="Speech speed")
+    parser.add_argument("--device", default="auto", help="Torch device: auto, cpu, cuda or mps")
+    parser.add_argument("--target-length", type=int, default=DEFAULT_TARGET,
+                        help="Approximate phonemes per segment (Kokoro's window is 510)")
+    parser.add_argument("--no-g2p-cache", action="store_true", help="Let KPipeline phonemize every sentence itself")
+    parser.add_argument("--no-audio-cache", action="store_true", help="Resynthesize every segment")
+    parser.add_argument("--audio-cache-dir", default=".audio_cache", help="Directory of the segment audio cache")
+    parser.add_argument("--workers", type=int, default=1, help="Worker processes for sharded CPU synthesis")
+    parser.add_argument("--intra-threads", type=int, help="Torch intra-op threads (CPU inference, per worker with --workers)")
+    parser.add_argument("--inter-threads", type=int, help="Torch inter-op threads (CPU inference, per worker with --workers)")
+    parser.add_argument("--precision", default="fp32", choices=PRECISIONS,
+                        help="Inference precision: int8 (CPU only) or bf16 trade some quality for speed")
+    args = parser.parse_args()
+    if args.workers > 1 and args.device not in ("auto", "cpu"):
+        parser.error("--workers runs sharded CPU synthesis; use --workers 1 with --device " + args.device)
+
+    cache = None if args.no_audio_cache else SegmentAudioCache(args.audio_cache_dir)
+
+    if args.workers > 1:
+        if args.chapter:
+            jobs = [args.chapter]
+        else:
+            jobs = [os.path.join(args.text_dir, fp) for fp in list_chapter_texts(args.text_dir)]
+
+        # G2P runs in the parent through the cache; workers only run the acoustic model
+        phonemizer = None if args.no_g2p_cache else load_phonemizer(args.lang_code)
+
+        # One pool for the whole run, so each worker loads the model once
+        with make_worker_pool(args.lang_code, args.workers, args.intra_threads, args.precision,
+                              args.inter_threads) as executor:
+            for text_path in jobs:
+                output_path = chapter_audio_path(text_path, args.output_dir, args.format)
+                synthesize_chapter_parallel(executor, text_path, output_path, lang_code=args.lang_code,
+                                            voice=args.voice, speed=args.speed, cache=cache,
+                                            target=args.target_length, phonemizer=phonemizer,
+                                            precision=args.precision, workers=args.workers)
+        return
+
+    configure_threads(args.intra_threads, args.inter_threads)
+    pipeline = load_pipeline(lang_code=args.lang_code, device=args.device, precision=args.precision)
+    phonemizer = None if args.no_g2p_cache else load_phonemizer(args.lang_code, pipeline)
+
+    if args.chapter:
+        synthesize_chapter(pipeline, args.chapter, chapter_audio_path(args.chapter, args.output_dir, args.format),
+                           voice=args.voice, speed=args.speed, cache=cache, target=args.target_length,
+                           phonemizer=phonemizer)
+    else:
+        synthesize_book(pipeline, args.text_dir, args.output_dir, voice=args.voice, speed=args.speed, cache=cache,
+                        target=args.target_length, phonemizer=phonemizer, format=args.format)
+
+if __name__ == "__main__":
+    main()
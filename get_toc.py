@@ -1,49 +1,54 @@
 import os
-import ast
+import argparse
 from dotenv import load_dotenv
 from google import genai
-from google.genai import types
 import pathlib
 from pydantic import BaseModel
 import json
 
-load_dotenv()
-
-GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
-client = genai.Client(api_key=GEMINI_API_KEY)
-
-filepath = pathlib.Path('./output_pdf_chunks/rlhfbook_part_1.pdf')
+from gemini_cache import ResponseCache, generate_cached
 
-with open("prompts/parse_toc.txt", "r") as f:
-    prompt = f.read()
+load_dotenv()
 
-print(prompt)
+MODEL = "gemini-2.5-pro-exp-03-25"
 
 class TableOfContents(BaseModel):
     sections: str
 
-response = client.models.generate_content(
-  model="gemini-2.5-pro-exp-03-25",
-  contents=[
-      types.Part.from_bytes(
-        data=filepath.read_bytes(),
-        mime_type='application/pdf',
-      ),
-      prompt],
-  config={
-        'response_mime_type': 'application/json',
-        'response_schema': TableOfContents,
-    }
-  )
-
-print(response.text)
-
-json_dict = ast.literal_eval(response.text)
-print(json_dict)
-
-try:
-    with open("toc.json", "w") as outfile:
+def get_toc(client, pdf_bytes, prompt, cache=None):
+    """Ask Gemini for the chapter page ranges in the given PDF."""
+    return generate_cached(
+        client,
+        MODEL,
+        [pdf_bytes, prompt],
+        schema=TableOfContents,
+        cache=cache,
+    )
+
+def main():
+    parser = argparse.ArgumentParser(description="Extract chapter page ranges from the book's table of contents.")
+    parser.add_argument("input_pdf", nargs="?", default="./output_pdf_chunks/rlhfbook_part_1.pdf",
+                        help="PDF containing the table of contents")
+    parser.add_argument("--output", default="toc.json", help="Path to write the TOC JSON")
+    parser.add_argument("--no-cache", action="store_true", help="Always call the API instead of reusing cached responses")
+    parser.add_argument("--cache-dir", default=".gemini_cache", help="Directory of the response cache")
+    args = parser.parse_args()
+
+    GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
+    client = genai.Client(api_key=GEMINI_API_KEY)
+    cache = None if args.no_cache else ResponseCache(args.cache_dir)
+
+    with open("prompts/parse_toc.txt", "r") as f:
+        prompt = f.read()
+
+    print(prompt)
+
+    toc = get_toc(client, pathlib.Path(args.input_pdf).read_bytes(), prompt, cache=cache)
+    json_dict = toc.model_dump()
+    print(json_dict)
+
+    with open(args.output, "w") as outfile:
         json.dump(json_dict, outfile, indent=4, sort_keys=False)
-except SyntaxError as e:
-    print(f"Error writing to file: {e}")
-    print("Response text:", response.text)
+
+if __name__ == "__main__":
+    main()
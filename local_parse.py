@@ -0,0 +1,171 @@
+"""
+Offline, rule-based chapter parsing with PyPDF2.
+
+Approximates what prompts/parse_pdf_to_text.txt asks of Gemini without any
+network call: page numbers, running headers/footers, table-of-contents lines and
+formula debris are dropped, wrapped lines are reflowed into paragraphs and [N]
+citations are replaced from the local bibliography index. Formulas are not
+explained, and figures only when captions from caption_figures.py are passed
+in; this backend is meant for quick drafts, large books and deterministic test
+runs.
+"""
+
+import re
+import unicodedata
+from collections import Counter
+from PyPDF2 import PdfReader
+
+from bibliography import resolve_citations
+
+PAGE_NUMBER_PATTERN = re.compile(r'^\s*(\d+|[ivxlcdm]+)\s*$', re.IGNORECASE)
+TOC_LINE_PATTERN = re.compile(r'^.+?(\s*\.){3,}\s*\d+\s*$')
+HEADING_PATTERN = re.compile(r'^(\d+(\.\d+)*|[A-Z])\s+[A-Z]\S*')
+WORD_PATTERN = re.compile(r'^[A-Za-z][a-z]{2,}[.,;:]?$')
+MATH_SYMBOLS = set('=+−∣∼∈∑∏∫≤≥·×^_{}|αβγδελμπσθ')
+SENTENCE_END = ('.', '!', '?', ':', '”', '"', ')')
+# A wrapped line is at least this fraction of the longest lines on its page
+FULL_LINE_RATIO = 0.8
+
+def page_lines(pdf_path):
+    """Extract the text of every page as a list of stripped, non-empty lines."""
+    reader = PdfReader(pdf_path)
+    pages = []
+    for page in reader.pages:
+        text = page.extract_text() or ""
+        # NFKC folds math italics (𝑃 -> P) and ligatures (ﬀ -> ff) into plain text
+        text = unicodedata.normalize("NFKC", text)
+        pages.append([line.strip() for line in text.splitlines() if line.strip()])
+    return pages
+
+def repeated_edge_lines(pages, min_pages=3, min_fraction=0.5):
+    """Lines that appear at the top or bottom of many pages (running headers/footers)."""
+    counts = Counter()
+    for lines in pages:
+        # Digits vary page to page in footers like 'Chapter 6 - 27', so compare without them
+        edges = {re.sub(r'\d+', '#', line) for line in lines[:1] + lines[-1:]}
+        counts.update(edges)
+
+    threshold = max(min_pages, int(len(pages) * min_fraction))
+    return {line for line, count in counts.items() if count >= threshold}
+
+def is_formula_debris(line):
+    """Heuristic for extracted math: few real words, several math symbols or mostly non-letters."""
+    if len(line) < 4:
+        return not line.isalpha()
+    letters = sum(ch.isalpha() for ch in line)
+    if letters / len(line) < 0.5:
+        return True
+
+    tokens = line.split()
+    words = sum(bool(WORD_PATTERN.match(token)) for token in tokens)
+    symbols = sum(ch in MATH_SYMBOLS for ch in line)
+    return symbols >= 2 and words / len(tokens) < 0.4
+
+def clean_page(lines, edge_lines):
+    cleaned = []
+    for i, line in enumerate(lines):
+        at_edge = i == 0 or i == len(lines) - 1
+        if at_edge and PAGE_NUMBER_PATTERN.match(line):
+            continue
+        if at_edge and re.sub(r'\d+', '#', line) in edge_lines:
+            continue
+        if TOC_LINE_PATTERN.match(line) or line.lower() in ("contents", "table of contents"):
+            continue
+        if is_formula_debris(line):
+            continue
+        cleaned.append(line)
+    return cleaned
+
+def reflow(lines):
+    """Join wrapped lines into paragraphs, keeping headings and figure captions on their own."""
+    if not lines:
+        return []
+
+    full_width = sorted(len(line) for line in lines)[int(len(lines) * 0.9)] * FULL_LINE_RATIO
+    paragraphs, current = [], ""
+    for line in lines:
+        standalone = HEADING_PATTERN.match(line) and len(line) < full_width or line.startswith("Figure ")
+        if standalone and current:
+            paragraphs.append(current)
+            current = ""
+
+        if current.endswith("-") and line[:1].islower():
+            current = current[:-1] + line
+        else:
+            current = f"{current} {line}".strip()
+
+        ends_paragraph = standalone or (len(line) < full_width and line.endswith(SENTENCE_END))
+        if ends_paragraph:
+            paragraphs.append(current)
+            current = ""
+
+    if current:
+        paragraphs.append(current)
+    return paragraphs
+
+def inject_captions(paragraphs, captions):
+    """
+    Insert figure explanations into one page's paragraphs.
+
+    Each caption follows the page's next 'Figure N' paragraph; captions without
+    one go at the end of the page, but before a paragraph that continues on
+    the next page so join_pages can still mend it.
+    """
+    figure_positions = [i for i, p in enumerate(paragraphs) if p.startswith("Figure ")]
+    result = list(paragraphs)
+    # Insert from the bottom so earlier positions stay valid
+    for position, caption in reversed(list(zip(figure_positions, captions))):
+        result.insert(position + 1, caption)
+
+    leftover = captions[len(figure_positions):]
+    if leftover:
+        at = len(result)
+        if result and not result[-1].endswith(SENTENCE_END):
+            at -= 1
+        result[at:at] = leftover
+    return result
+
+def parse_pages(pdf_path, citation_index=None, captions=None):
+    """
+    Parse a chapter PDF into cleaned paragraphs, grouped per page.
+
+    Args:
+        captions (list): Figure explanations per page (see caption_figures.py), injected in place
+
+    Returns:
+        list: One list of paragraphs per page
+    """
+    pages = page_lines(pdf_path)
+    edge_lines = repeated_edge_lines(pages)
+
+    parsed = []
+    for page_number, lines in enumerate(pages):
+        paragraphs = reflow(clean_page(lines, edge_lines))
+        if citation_index is not None:
+            paragraphs = [resolve_citations(p, citation_index) for p in paragraphs]
+        # '[32]and' in the PDF text becomes '(source: ...)and' once resolved
+        paragraphs = [re.sub(r'\)(?=\w)', ') ', p) for p in paragraphs]
+        if captions and page_number < len(captions) and captions[page_number]:
+            paragraphs = inject_captions(paragraphs, captions[page_number])
+        parsed.append(paragraphs)
+    return parsed
+
+def join_pages(pages):
+    """
+    Join per-page paragraphs into the chapter text.
+
+    A paragraph cut by a page break is continued on the next page instead of
+    being split in two.
+    """
+    paragraphs = []
+    for page in pages:
+        for i, paragraph in enumerate(page):
+            if i == 0 and paragraphs and not paragraphs[-1].endswith(SENTENCE_END) and paragraph[:1].islower():
+                paragraphs[-1] = f"{paragraphs[-1]} {paragraph}"
+            else:
+                paragraphs.append(paragraph)
+    return "\n".join(paragraphs)
+
+def parse_chapter_file(pdf_path, citation_index=None, captions=None):
+    """Parse one chapter PDF into TTS-ready text, with figure explanations if captions are given."""
+    return join_pages(parse_pages(pdf_path, citation_index, captions))
@@ -1,31 +1,65 @@
-import torch
-from PIL import Image
-from transformers import AutoModel, AutoTokenizer
+import argparse
 
-torch.manual_seed(100)
+from device_utils import select_device
 
-model = AutoModel.from_pretrained('openbmb/MiniCPM-o-2_6', trust_remote_code=True, attn_implementation='sdpa', torch_dtype=torch.bfloat16) # sdpa or flash_attention_2, no eager
-model = model.eval().mps()
-tokenizer = AutoTokenizer.from_pretrained('openbmb/MiniCPM-o-2_6', trust_remote_code=True)
+MODEL_ID = 'openbmb/MiniCPM-o-2_6'
 
-image = Image.open('/Users/kieranschubert/Desktop/title_img.png').convert('RGB')
+def load_minicpm(device='auto', init_tts=False):
+    """
+    Load MiniCPM-o and its tokenizer.
 
-# First round chat
-question = "Describe the contents of the image"
-msgs = [{'role': 'user', 'content': [image, question]}]
+    torch and transformers are imported here so importing this module (e.g. from
+    the engine registry) stays cheap. bfloat16 is used on accelerators, float32 on CPU.
+    """
+    import torch
+    from transformers import AutoModel, AutoTokenizer
 
-answer = model.chat(
-    msgs=msgs,
-    tokenizer=tokenizer
-)
-print(answer)
+    device = select_device(device)
+    print(f"Loading MiniCPM-o on {device}")
+    dtype = torch.float32 if device == 'cpu' else torch.bfloat16
+    model = AutoModel.from_pretrained(MODEL_ID, trust_remote_code=True, attn_implementation='sdpa', torch_dtype=dtype,
+                                      init_tts=init_tts) # sdpa or flash_attention_2, no eager
+    model = model.eval().to(device)
+    tokenizer = AutoTokenizer.from_pretrained(MODEL_ID, trust_remote_code=True)
+    if init_tts:
+        model.init_tts()
+        model.tts.float()
+    return model, tokenizer
 
-# Second round chat, pass history context of multi-turn conversation
-msgs.append({"role": "assistant", "content": [answer]})
-msgs.append({"role": "user", "content": ["What should I know to understand the topics?"]})
+def chat(model, tokenizer, msgs):
+    """Answer one conversation, or a list of conversations as one batch (returning a list of answers)."""
+    return model.chat(
+        msgs=msgs,
+        tokenizer=tokenizer
+    )
 
-answer = model.chat(
-    msgs=msgs,
-    tokenizer=tokenizer
-)
-print(answer)
\ No newline at end of file
+def main():
+    parser = argparse.ArgumentParser(description="Ask MiniCPM-o about an image.")
+    parser.add_argument("image", help="Image to describe")
+    parser.add_argument("--device", default="auto", help="Torch device: auto, cpu, cuda or mps")
+    args = parser.parse_args()
+
+    import torch
+    from PIL import Image
+
+    torch.manual_seed(100)
+    model, tokenizer = load_minicpm(args.device)
+
+    image = Image.open(args.image).convert('RGB')
+
+    # First round chat
+    question = "Describe the contents of the image"
+    msgs = [{'role': 'user', 'content': [image, question]}]
+
+    answer = chat(model, tokenizer, msgs)
+    print(answer)
+
+    # Second round chat, pass history context of multi-turn conversation
+    msgs.append({"role": "assistant", "content": [answer]})
+    msgs.append({"role": "user", "content": ["What should I know to understand the topics?"]})
+
+    answer = chat(model, tokenizer, msgs)
+    print(answer)
+
+if __name__ == "__main__":
+    main()
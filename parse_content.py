@@ -1,68 +1,357 @@
 import os
 import re
+import json
+import time
+import random
+import asyncio
+import hashlib
+import argparse
+from concurrent.futures import ProcessPoolExecutor
 from dotenv import load_dotenv
 from google import genai
-from google.genai import types
 import pathlib
 from pydantic import BaseModel
 
-load_dotenv()
+from gemini_cache import ResponseCache, generate_cached, agenerate_cached, stream_cached
+from bibliography import load_citation_index, cited_entries_text, resolve_citations
+import local_parse
 
-GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
-client = genai.Client(api_key=GEMINI_API_KEY)
+load_dotenv()
 
-with open("prompts/parse_pdf_to_text.txt", "r") as f:
-    prompt = f.read()
+MODEL = "gemini-2.5-pro-exp-03-25"
+MANIFEST_FILE = "manifest.json"
+# Appended to the prompt in streaming mode, where paragraphs are consumed before the response is complete
+STREAMING_NOTE = "Ignore the response_format above: return only the parsed content as plain text, one paragraph per line, without JSON and without the summary."
+# Replaces the prompt's bibliography instructions when citations are resolved locally after parsing
+KEEP_CITATIONS_INSTRUCTION = "<instruction>keep footnotes/bibliographic references (eg [15]) exactly as they appear: no bibliography is attached, they are resolved afterwards.</instruction>"
+BIBLIOGRAPHY_INSTRUCTION = re.compile(r'^([ \t]*)<instruction>[^\n]*bibliograph[^\n]*</instruction>\n?', re.MULTILINE | re.IGNORECASE)
 
 class ParsedDocument(BaseModel):
     content: str
     summary: str
 
-# Get all PDF files excluding Bibliography
-pdf_files = [f for f in os.listdir("chapters") if f.endswith(".pdf") and f != "Bibliography.pdf"]
+def load_prompt(path="prompts/parse_pdf_to_text.txt"):
+    with open(path, "r") as f:
+        return f.read()
 
 # Sort files by number at beginning of filename
 def extract_number(filename):
     match = re.search(r'^(\d+)', filename)
     return int(match.group(1)) if match else float('inf')
 
-pdf_files.sort(key=extract_number)
+def list_chapter_pdfs(chapters_dir="chapters"):
+    """Get all chapter PDF files excluding Bibliography, in chapter order."""
+    pdf_files = [f for f in os.listdir(chapters_dir) if f.endswith(".pdf") and f != "Bibliography.pdf"]
+    pdf_files.sort(key=extract_number)
+    return pdf_files
+
+def keep_citations_prompt(prompt):
+    """The parsing prompt with its bibliography instructions replaced by KEEP_CITATIONS_INSTRUCTION."""
+    replaced = []
+
+    def replace(match):
+        if replaced:
+            return ""
+        replaced.append(match)
+        return f"{match.group(1)}{KEEP_CITATIONS_INSTRUCTION}\n"
+
+    return BIBLIOGRAPHY_INSTRUCTION.sub(replace, prompt)
+
+def request_parts(chapter, citation_index, prompt, resolve_locally=False):
+    """
+    The chapter, the bibliography entries it cites and the prompt.
 
-bibliography = pathlib.Path('./chapters/Bibliography.pdf').read_bytes()
+    In keep-citations mode (resolve_locally, or no citation index) no entries
+    are sent and the prompt asks to leave [N] markers in place, so
+    resolve_parsed can replace them locally.
+    """
+    if resolve_locally or citation_index is None:
+        return [chapter, keep_citations_prompt(prompt)]
+    return [chapter, cited_entries_text(chapter, citation_index), prompt]
 
-for fp in pdf_files[12:]:
-    print(f"Processing: {fp}")
-    chapter_path = os.path.join("chapters", fp)
+def resolve_parsed(parsed, citation_index):
+    """
+    Replace the [N] markers kept in the parsed content using the local citation index.
+
+    Only for keep-citations mode: when the model was sent the cited entries it
+    already wrote the sources out, and any bracket left is not a citation.
+    """
+    if citation_index is None:
+        return parsed
+    return ParsedDocument(
+        content=resolve_citations(parsed.content, citation_index),
+        summary=resolve_citations(parsed.summary, citation_index),
+    )
+
+def parse_chapter(client, chapter_path, citation_index, prompt, cache=None, resolve_locally=False):
+    """Send one chapter PDF (plus the entries it cites) to Gemini and return the ParsedDocument."""
     chapter = pathlib.Path(chapter_path).read_bytes()
+    parsed = generate_cached(
+        client,
+        MODEL,
+        request_parts(chapter, citation_index, prompt, resolve_locally),
+        schema=ParsedDocument,
+        cache=cache,
+    )
+    return resolve_parsed(parsed, citation_index) if resolve_locally else parsed
 
-    # Create output filename using the same name as the PDF but with .txt extension
+def write_parsed(fp, parsed, output_dir="parsed_text"):
+    """Write summary + content to parsed_text/ using the same name as the PDF but with .txt extension."""
     output_file = os.path.splitext(fp)[0] + ".txt"
+    chapter_with_summary = parsed.summary + parsed.content
+
+    os.makedirs(output_dir, exist_ok=True)  # Ensure directory exists
+    with open(os.path.join(output_dir, output_file), "w") as f:
+        f.write(chapter_with_summary.strip())
+    print(f"Successfully wrote {output_file}")
+
+def stream_paragraphs(client, chapter_path, citation_index, prompt, cache=None, resolve_locally=False):
+    """
+    Stream a chapter's parsed text and yield each paragraph as soon as it is complete.
+
+    Uses the streaming API with a plain-text response so TTS can start on the
+    first paragraphs while the rest of the chapter is still being generated.
+    """
+    chapter = pathlib.Path(chapter_path).read_bytes()
+    contents = request_parts(chapter, citation_index, prompt, resolve_locally) + [STREAMING_NOTE]
+
+    def finish(paragraph):
+        paragraph = paragraph.strip()
+        if paragraph and resolve_locally and citation_index is not None:
+            paragraph = resolve_citations(paragraph, citation_index)
+        return paragraph
+
+    buffer = ""
+    for chunk in stream_cached(client, MODEL, contents, cache=cache):
+        buffer += chunk
+        *complete, buffer = buffer.split("\n")
+        for paragraph in map(finish, complete):
+            if paragraph:
+                yield paragraph
+
+    paragraph = finish(buffer)
+    if paragraph:
+        yield paragraph
+
+class TokenBucket:
+    """
+    Async token-bucket rate limiter.
+
+    Allows bursts of up to `capacity` requests and refills at `rate` tokens per second.
+    """
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+class Manifest:
+    """Record of chapters already parsed, keyed by PDF filename and checked against the PDF hash."""
+
+    def __init__(self, path):
+        self.path = path
+        try:
+            with open(path, "r") as f:
+                self.entries = json.load(f)
+        except FileNotFoundError:
+            self.entries = {}
+
+    def is_done(self, fp, pdf_hash, output_path, backend="gemini"):
+        entry = self.entries.get(fp)
+        return (entry is not None and entry["pdf_sha256"] == pdf_hash
+                and entry.get("backend", "gemini") == backend and os.path.exists(output_path))
+
+    def mark_done(self, fp, pdf_hash, output_path, backend="gemini"):
+        self.entries[fp] = {"pdf_sha256": pdf_hash, "output": output_path, "backend": backend}
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.entries, f, indent=4)
+        os.replace(tmp_path, self.path)
+
+async def with_retries(make_call, max_retries=5, base_delay=2.0, max_delay=60.0):
+    """Await make_call(), retrying failures with exponential backoff and jitter."""
+    for attempt in range(max_retries + 1):
+        try:
+            return await make_call()
+        except Exception as e:
+            if attempt == max_retries:
+                raise
+            delay = min(max_delay, base_delay * 2 ** attempt) * (0.5 + random.random() / 2)
+            print(f"Request failed ({e}), retrying in {delay:.1f}s ({attempt + 1}/{max_retries})")
+            await asyncio.sleep(delay)
+
+async def aparse_chapter(client, chapter, citation_index, prompt, cache=None, resolve_locally=False):
+    parsed = await agenerate_cached(
+        client,
+        MODEL,
+        request_parts(chapter, citation_index, prompt, resolve_locally),
+        schema=ParsedDocument,
+        cache=cache,
+    )
+    return resolve_parsed(parsed, citation_index) if resolve_locally else parsed
+
+class ChapterParser:
+    """
+    Gemini chapter requests with bounded concurrency, a request rate limit and retries.
+
+    Share one instance between all chapters so the limits hold across them.
+    """
+
+    def __init__(self, client, citation_index, prompt, cache=None, concurrency=4, requests_per_minute=10,
+                 max_retries=5, resolve_locally=False):
+        self.client = client
+        self.citation_index = citation_index
+        self.prompt = prompt
+        self.cache = cache
+        self.max_retries = max_retries
+        self.resolve_locally = resolve_locally
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.bucket = TokenBucket(rate=requests_per_minute / 60, capacity=concurrency)
+
+    async def parse(self, chapter):
+        """ParsedDocument of one chapter's PDF bytes."""
+        async with self.semaphore:
+            async def call():
+                await self.bucket.acquire()
+                return await aparse_chapter(self.client, chapter, self.citation_index, self.prompt,
+                                            cache=self.cache, resolve_locally=self.resolve_locally)
+
+            return await with_retries(call, max_retries=self.max_retries)
+
+async def parse_chapters_async(client, pdf_files, citation_index, prompt, cache=None,
+                               chapters_dir="chapters", output_dir="parsed_text",
+                               concurrency=4, requests_per_minute=10, max_retries=5, force=False,
+                               resolve_locally=False):
+    """
+    Parse chapters concurrently with bounded concurrency and a request rate limit.
+
+    Chapters whose PDF hash matches a completed entry in the manifest are skipped,
+    so rerunning after a crash resumes with the chapters that did not finish.
+
+    Returns:
+        list: Filenames of the chapters that failed after all retries
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    manifest = Manifest(os.path.join(output_dir, MANIFEST_FILE))
+    parser = ChapterParser(client, citation_index, prompt, cache=cache, concurrency=concurrency,
+                           requests_per_minute=requests_per_minute, max_retries=max_retries,
+                           resolve_locally=resolve_locally)
+
+    async def run(fp):
+        chapter = pathlib.Path(os.path.join(chapters_dir, fp)).read_bytes()
+        pdf_hash = hashlib.sha256(chapter).hexdigest()
+        output_path = os.path.join(output_dir, os.path.splitext(fp)[0] + ".txt")
+        if not force and manifest.is_done(fp, pdf_hash, output_path):
+            print(f"Skipping (already parsed): {fp}")
+            return
+
+        print(f"Processing: {fp}")
+        parsed = await parser.parse(chapter)
+
+        write_parsed(fp, parsed, output_dir)
+        manifest.mark_done(fp, pdf_hash, output_path)
+
+    results = await asyncio.gather(*(run(fp) for fp in pdf_files), return_exceptions=True)
+
+    failed = []
+    for fp, result in zip(pdf_files, results):
+        if isinstance(result, Exception):
+            print(f"Failed: {fp}: {result}")
+            failed.append(fp)
+    return failed
+
+def parse_chapters_local(pdf_files, citation_index, chapters_dir="chapters", output_dir="parsed_text",
+                         workers=None, force=False, captioner=None):
+    """
+    Parse chapters offline with local_parse, one chapter per worker process.
+
+    Uses the same manifest as the Gemini backend, so rerunning skips chapters
+    already parsed by this backend. With a caption_figures.FigureCaptioner the
+    figures of all pending chapters are explained first, in shared batches, and
+    injected into the parsed text.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    manifest = Manifest(os.path.join(output_dir, MANIFEST_FILE))
+    backend = "local" if captioner is None else "local+captions"
+
+    pending = []
+    for fp in pdf_files:
+        pdf_hash = hashlib.sha256(pathlib.Path(os.path.join(chapters_dir, fp)).read_bytes()).hexdigest()
+        output_path = os.path.join(output_dir, os.path.splitext(fp)[0] + ".txt")
+        if not force and manifest.is_done(fp, pdf_hash, output_path, backend=backend):
+            print(f"Skipping (already parsed): {fp}")
+            continue
+        pending.append((fp, pdf_hash, output_path))
+
+    captions = {}
+    if captioner is not None and pending:
+        captions = captioner.caption_chapters([os.path.join(chapters_dir, fp) for fp, _, _ in pending])
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            executor.submit(local_parse.parse_chapter_file, os.path.join(chapters_dir, fp), citation_index,
+                            captions.get(os.path.join(chapters_dir, fp)))
+            for fp, _, _ in pending
+        ]
+        for (fp, pdf_hash, output_path), future in zip(pending, futures):
+            write_parsed(fp, ParsedDocument(content=future.result(), summary=""), output_dir)
+            manifest.mark_done(fp, pdf_hash, output_path, backend=backend)
+
+def main():
+    parser = argparse.ArgumentParser(description="Parse chapter PDFs to TTS-ready text with Gemini.")
+    parser.add_argument("--backend", choices=["gemini", "local"], default="gemini",
+                        help="'local' parses offline with PyPDF2 and rule-based cleanup")
+    parser.add_argument("--workers", type=int, help="Worker processes for the local backend")
+    parser.add_argument("--captions", action="store_true",
+                        help="Local backend: explain figures with MiniCPM-o (see caption_figures.py)")
+    parser.add_argument("--device", default="auto", help="Torch device for figure captioning")
+    parser.add_argument("--concurrency", type=int, default=4, help="Maximum number of requests in flight")
+    parser.add_argument("--rpm", type=float, default=10, help="Maximum requests per minute")
+    parser.add_argument("--max-retries", type=int, default=5, help="Retries per chapter before giving up")
+    parser.add_argument("--force", action="store_true", help="Reparse chapters already recorded in the manifest")
+    parser.add_argument("--resolve-citations-locally", action="store_true",
+                        help="Send no bibliography entries and replace [N] markers from the local index after parsing")
+    parser.add_argument("--no-cache", action="store_true", help="Always call the API instead of reusing cached responses")
+    parser.add_argument("--cache-dir", default=".gemini_cache", help="Directory of the response cache")
+    args = parser.parse_args()
+
+    citation_index = load_citation_index('./chapters/Bibliography.pdf')
+    if args.backend == "local":
+        captioner = None
+        if args.captions:
+            from caption_figures import FigureCaptioner
+            captioner = FigureCaptioner(device=args.device)
+        parse_chapters_local(list_chapter_pdfs(), citation_index, workers=args.workers, force=args.force,
+                             captioner=captioner)
+        return
+
+    GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
+    client = genai.Client(api_key=GEMINI_API_KEY)
+    cache = None if args.no_cache else ResponseCache(args.cache_dir)
+
+    prompt = load_prompt()
+
+    failed = asyncio.run(parse_chapters_async(
+        client, list_chapter_pdfs(), citation_index, prompt, cache=cache,
+        concurrency=args.concurrency, requests_per_minute=args.rpm,
+        max_retries=args.max_retries, force=args.force,
+        resolve_locally=args.resolve_citations_locally,
+    ))
+    if failed:
+        print(f"{len(failed)} chapter(s) failed, rerun to resume: {failed}")
 
-    response = client.models.generate_content(
-      model="gemini-2.5-pro-exp-03-25",
-      contents=[
-          types.Part.from_bytes(
-            data=chapter,
-            mime_type='application/pdf',
-          ),
-          types.Part.from_bytes(
-            data=bibliography,
-            mime_type='application/pdf',
-          ),
-          prompt],
-      config={
-            'response_mime_type': 'application/json',
-            'response_schema': ParsedDocument,
-        }
-      )
-
-    chapter_with_summary = response.parsed.summary + response.parsed.content
-
-    try:
-        os.makedirs("parsed_text", exist_ok=True)  # Ensure directory exists
-        with open(f"parsed_text/{output_file}", "w") as f:
-            f.write(chapter_with_summary.strip())
-        print(f"Successfully wrote {output_file}")
-    except Exception as e:
-        print(f"Error writing to file: {e}")
-        print("Response text:", response.text)
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,378 @@
+"""
+Incremental runner for the whole book pipeline.
+
+Models the scripts from the README as a DAG of stages:
+
+    toc -> chapters -> bibliography -> (captions:<chapter> ->) parse:<chapter> -> tts:<chapter> -> video:<chapter>
+
+Each stage declares its input and output paths. After a stage runs, the
+content hashes of its inputs and outputs are recorded in .pipeline_manifest.json;
+on the next run a stage is only executed again if an input changed, an output
+is missing, or its parameters changed. Hand edits to an output (e.g. a chapter's
+parsed text) are kept and only invalidate the stages downstream of it, so
+editing one chapter does not redo the whole book. Independent per-chapter
+branches run in parallel, while stages sharing a resource (the TTS model) are
+serialized.
+
+Usage:
+    python pipeline.py --source input_pdf/rlhfbook.pdf --backend local
+    python pipeline.py --source input_pdf/rlhfbook.pdf --dry-run
+"""
+
+import os
+import json
+import hashlib
+import pathlib
+import asyncio
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+MANIFEST_PATH = ".pipeline_manifest.json"
+
+def hash_path(path):
+    """Content hash of a file, or of every file in a directory; None if missing."""
+    if os.path.isdir(path):
+        hasher = hashlib.sha256()
+        for name in sorted(os.listdir(path)):
+            hasher.update(name.encode())
+            hasher.update((hash_path(os.path.join(path, name)) or "").encode())
+        return hasher.hexdigest()
+    if not os.path.exists(path):
+        return None
+
+    hasher = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            hasher.update(block)
+    return hasher.hexdigest()
+
+class Stage:
+    """
+    One step of the pipeline.
+
+    Args:
+        name (str): Unique stage name, e.g. 'parse:8 Regularization'
+        inputs (list): Paths the stage reads
+        outputs (list): Paths the stage writes
+        run (callable): Function performing the work
+        deps (list): Names of stages that must finish first
+        params (dict): Settings that should invalidate the outputs when changed
+        resource (str): Stages with the same resource never run concurrently
+    """
+
+    def __init__(self, name, inputs, outputs, run, deps=(), params=None, resource=None):
+        self.name = name
+        self.inputs = list(inputs)
+        self.outputs = list(outputs)
+        self.run = run
+        self.deps = list(deps)
+        self.params = params or {}
+        self.resource = resource
+
+class PipelineManifest:
+    """Input/output content hashes of the last successful run of each stage."""
+
+    def __init__(self, path=MANIFEST_PATH):
+        self.path = path
+        self.lock = threading.Lock()
+        try:
+            with open(path, "r") as f:
+                self.entries = json.load(f)
+        except FileNotFoundError:
+            self.entries = {}
+
+    @staticmethod
+    def snapshot(stage):
+        return {
+            "inputs": {path: hash_path(path) for path in stage.inputs},
+            "params": stage.params,
+        }
+
+    def is_fresh(self, stage):
+        entry = self.entries.get(stage.name)
+        if entry is None:
+            return False
+        if entry["inputs"] != self.snapshot(stage)["inputs"] or entry["params"] != stage.params:
+            return False
+        # Outputs edited by hand count as fresh: the edit is kept and only downstream stages rerun
+        return all(os.path.exists(path) for path in stage.outputs)
+
+    def record(self, stage):
+        entry = self.snapshot(stage)
+        entry["outputs"] = {path: hash_path(path) for path in stage.outputs}
+        with self.lock:
+            self.entries[stage.name] = entry
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(self.entries, f, indent=4)
+            os.replace(tmp_path, self.path)
+
+class Pipeline:
+    def __init__(self, manifest, workers=4, force=False, dry_run=False):
+        self.manifest = manifest
+        self.workers = workers
+        self.force = force
+        self.dry_run = dry_run
+        self.stages = {}
+
+    def add(self, stage):
+        self.stages[stage.name] = stage
+
+    def _execute(self, stage, upstream_ran=False):
+        """Run a stage if stale; returns True if it ran."""
+        # In a dry run upstream outputs are not rewritten, so staleness has to be propagated by hand
+        upstream_stale = self.dry_run and upstream_ran
+        if not self.force and not upstream_stale and self.manifest.is_fresh(stage):
+            return False
+        if self.dry_run:
+            print(f"[stale] {stage.name}")
+            return True
+
+        print(f"[run] {stage.name}")
+        stage.run()
+        self.manifest.record(stage)
+        return True
+
+    def run(self):
+        """
+        Run every stale stage once its dependencies are done.
+
+        A stage whose resource is taken stays queued here instead of waiting
+        in a worker thread, so the workers stay free for stages that can run.
+
+        Returns:
+            dict: Stage name -> 'ran', 'fresh', 'failed' or 'skipped'
+        """
+        status = {}
+        remaining = {name: set(stage.deps) & set(self.stages) for name, stage in self.stages.items()}
+
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            running = {}
+            busy = set()
+            while remaining or running:
+                ready = [name for name, deps in remaining.items() if not deps]
+                for name in ready:
+                    stage = self.stages[name]
+                    if stage.resource is not None:
+                        if stage.resource in busy:
+                            continue
+                        busy.add(stage.resource)
+                    del remaining[name]
+                    upstream_ran = any(status.get(dep) == "ran" for dep in stage.deps)
+                    running[executor.submit(self._execute, stage, upstream_ran)] = name
+
+                if not running:
+                    break
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    busy.discard(self.stages[name].resource)
+                    try:
+                        status[name] = "ran" if future.result() else "fresh"
+                    except Exception as e:
+                        print(f"[failed] {name}: {e}")
+                        status[name] = "failed"
+                        self._skip_dependents(name, remaining, status)
+                    for deps in remaining.values():
+                        deps.discard(name)
+
+        return status
+
+    def _skip_dependents(self, failed, remaining, status):
+        for name in [n for n, deps in remaining.items() if failed in deps]:
+            if name in remaining:
+                del remaining[name]
+                status[name] = "skipped"
+                self._skip_dependents(name, remaining, status)
+
+_shared = {}
+_shared_lock = threading.Lock()
+
+def shared(key, factory):
+    """Create expensive objects (API client) once and reuse them across stages; TTS models come from tts_engines."""
+    with _shared_lock:
+        if key not in _shared:
+            _shared[key] = factory()
+        return _shared[key]
+
+def event_loop():
+    """An asyncio loop running in a daemon thread, for the async Gemini requests of all stages."""
+    loop = asyncio.new_event_loop()
+    threading.Thread(target=loop.run_forever, daemon=True).start()
+    return loop
+
+def gemini_client():
+    from google import genai
+    from dotenv import load_dotenv
+    load_dotenv()
+    return genai.Client(api_key=os.getenv("GEMINI_API_KEY"))
+
+def toc_stage(args):
+    """Stage producing toc.json from the first pages of the source book."""
+    def run_toc():
+        from PyPDF2 import PdfReader
+        from split_pdf import serialize_pages
+        from get_toc import get_toc
+        from gemini_cache import ResponseCache
+
+        reader = PdfReader(args.source)
+        pdf_bytes = serialize_pages(reader.pages[:args.toc_pages])
+        with open("prompts/parse_toc.txt", "r") as f:
+            prompt = f.read()
+        toc = get_toc(shared("gemini", gemini_client), pdf_bytes, prompt, cache=ResponseCache())
+        with open(args.toc, "w") as f:
+            json.dump(toc.model_dump(), f, indent=4)
+
+    return Stage("toc", [args.source, "prompts/parse_toc.txt"], [args.toc], run_toc,
+                 params={"toc_pages": args.toc_pages})
+
+def chapter_stages(args, sections):
+    """Per-chapter parse -> tts (-> video) branches for every TOC section."""
+    from create_chapters import safe_filename
+
+    def run_chapters():
+        from create_chapters import create_chapters_from_source
+        create_chapters_from_source(args.source, args.toc, "chapters")
+
+    chapter_pdfs = [os.path.join("chapters", f"{safe_filename(name)}.pdf") for name in sections]
+    stages = [Stage("chapters", [args.source, args.toc], chapter_pdfs, run_chapters)]
+
+    bibliography_pdf = os.path.join("chapters", "Bibliography.pdf")
+    bibliography_index = os.path.join("chapters", "bibliography.json")
+
+    def run_bibliography():
+        from bibliography import load_citation_index
+        load_citation_index(bibliography_pdf, bibliography_index)
+
+    stages.append(Stage("bibliography", [bibliography_pdf], [bibliography_index], run_bibliography,
+                        deps=["chapters"]))
+
+    for name in sections:
+        safe_name = safe_filename(name)
+        if safe_name == "Bibliography":
+            continue
+
+        chapter_pdf = os.path.join("chapters", f"{safe_name}.pdf")
+        text_path = os.path.join("parsed_text", f"{safe_name}.txt")
+        audio_path = os.path.join("output_audio", f"{safe_name}.{args.format}")
+
+        captions_path = os.path.join("figure_captions", f"{safe_name}.json")
+        with_captions = args.captions and args.backend == "local"
+
+        def run_captions(chapter_pdf=chapter_pdf, captions_path=captions_path):
+            from caption_figures import FigureCaptioner, caption_chapters
+
+            # One captioner, and so one MiniCPM-o model, for every chapter
+            captioner = shared("captioner", lambda: FigureCaptioner(device=args.device))
+            caption_chapters([chapter_pdf], captioner, os.path.dirname(captions_path))
+
+        if with_captions:
+            stages.append(Stage(f"captions:{safe_name}", [chapter_pdf], [captions_path], run_captions,
+                                deps=["chapters"], resource="minicpm"))
+
+        def run_parse(chapter_pdf=chapter_pdf, safe_name=safe_name, captions_path=captions_path):
+            from bibliography import load_citation_index
+            import parse_content
+
+            citation_index = load_citation_index(bibliography_pdf, bibliography_index)
+            if args.backend == "local":
+                import local_parse
+                from caption_figures import load_captions
+                captions = load_captions(captions_path) if args.captions else None
+                parsed = parse_content.ParsedDocument(
+                    content=local_parse.parse_chapter_file(chapter_pdf, citation_index, captions), summary="")
+            else:
+                from gemini_cache import ResponseCache
+
+                # One parser for every chapter, so concurrency, rate limit and retries hold book-wide
+                parser = shared("chapter_parser", lambda: parse_content.ChapterParser(
+                    shared("gemini", gemini_client), citation_index, parse_content.load_prompt(),
+                    cache=ResponseCache(), requests_per_minute=args.rpm, max_retries=args.max_retries))
+                chapter = pathlib.Path(chapter_pdf).read_bytes()
+                parsed = asyncio.run_coroutine_threadsafe(parser.parse(chapter),
+                                                          shared("loop", event_loop)).result()
+            parse_content.write_parsed(f"{safe_name}.pdf", parsed, "parsed_text")
+
+        def run_tts(text_path=text_path, audio_path=audio_path):
+            from tts_engines import get_engine
+
+            # Synthesis streams straight into the chapter file; unchanged segments come back from the audio cache.
+            # The engine comes from the process-wide model pool, so the weights load once for all chapters
+            engine = get_engine("kokoro", args.device, lang_code=args.lang_code)
+            engine.synthesize_chapter(text_path, audio_path, voice=args.voice)
+
+        parse_inputs = [chapter_pdf, bibliography_index, "prompts/parse_pdf_to_text.txt"]
+        parse_deps = ["bibliography"]
+        parse_params = {"backend": args.backend}
+        if with_captions:
+            parse_inputs.append(captions_path)
+            parse_deps.append(f"captions:{safe_name}")
+            parse_params["captions"] = True
+        stages.append(Stage(f"parse:{safe_name}", parse_inputs, [text_path], run_parse, deps=parse_deps,
+                            params=parse_params))
+        stages.append(Stage(f"tts:{safe_name}", [text_path], [audio_path, f"{audio_path}.timing.json"], run_tts,
+                            deps=[f"parse:{safe_name}"],
+                            params={"voice": args.voice, "lang_code": args.lang_code, "format": args.format},
+                            resource="tts"))
+
+        if args.image:
+            video_path = os.path.join("videos", f"{safe_name}.mp4")
+
+            def run_video(audio_path=audio_path, video_path=video_path):
+                from to_youtube import create_video
+                os.makedirs("videos", exist_ok=True)
+                if create_video(args.image, audio_path, video_path) is None:
+                    raise RuntimeError(f"Failed to create {video_path}")
+
+            stages.append(Stage(f"video:{safe_name}", [args.image, audio_path], [video_path], run_video,
+                                deps=[f"tts:{safe_name}"]))
+
+    return stages
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the book-to-audio pipeline, redoing only stale stages.")
+    parser.add_argument("--source", required=True, help="Path to the source book PDF")
+    parser.add_argument("--toc", default="toc.json", help="Path of the TOC JSON")
+    parser.add_argument("--toc-pages", type=int, default=20, help="Number of leading pages sent to find the TOC")
+    parser.add_argument("--backend", choices=["gemini", "local"], default="gemini", help="Chapter parsing backend")
+    parser.add_argument("--captions", action="store_true",
+                        help="Local backend: explain figures with MiniCPM-o (see caption_figures.py)")
+    parser.add_argument("--voice", default="af_heart", help="Kokoro voice")
+    parser.add_argument("--lang-code", default="b", help="Kokoro language code")
+    parser.add_argument("--device", default="auto", help="Torch device for TTS and captioning: auto, cpu, cuda or mps")
+    parser.add_argument("--format", default="mp3", choices=["mp3", "wav", "flac", "ogg", "opus"],
+                        help="Chapter audio format")
+    parser.add_argument("--image", help="Cover image; also render one video per chapter when set")
+    parser.add_argument("--rpm", type=float, default=10, help="Gemini backend: maximum requests per minute")
+    parser.add_argument("--max-retries", type=int, default=5, help="Gemini backend: retries per chapter")
+    parser.add_argument("--workers", type=int, default=4, help="Stages run in parallel")
+    parser.add_argument("--force", action="store_true", help="Rerun every stage")
+    parser.add_argument("--dry-run", action="store_true", help="Only list the stages that would run")
+    args = parser.parse_args()
+
+    manifest = PipelineManifest()
+
+    # The per-chapter DAG depends on the TOC, so bring the book-level stages up to date first
+    book = Pipeline(manifest, workers=args.workers, force=args.force, dry_run=args.dry_run)
+    book.add(toc_stage(args))
+    status = book.run()
+    if status.get("toc") == "failed" or not os.path.exists(args.toc):
+        print("No table of contents available, stopping.")
+        return
+
+    from create_chapters import load_sections
+    sections = load_sections(args.toc)
+
+    pipeline = Pipeline(manifest, workers=args.workers, force=args.force, dry_run=args.dry_run)
+    for stage in chapter_stages(args, sections):
+        pipeline.add(stage)
+    status.update(pipeline.run())
+
+    counts = {}
+    for result in status.values():
+        counts[result] = counts.get(result, 0) + 1
+    print(", ".join(f"{count} {result}" for result, count in sorted(counts.items())))
+
+if __name__ == "__main__":
+    main()
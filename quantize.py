@@ -0,0 +1,107 @@
+"""
+Reduced-precision CPU inference for the TTS models.
+
+The CPU-only hosts spend most of a render in full-precision matrix multiplies.
+Two opt-in modes trade a little quality for speed and memory:
+
+    int8  dynamic int8 quantization of the Linear and LSTM layers: weights are
+          stored as int8 and activations are quantized on the fly. CPU only.
+    bf16  bfloat16 autocast: weights stay float32, matmuls and convolutions run
+          in bfloat16, which is fast on CPUs with AVX512-BF16/AMX.
+
+fp32 leaves the model untouched. See compare_precision.py for the
+speed/memory/quality trade-off on real chapters.
+"""
+
+import dataclasses
+import functools
+
+PRECISIONS = ("fp32", "bf16", "int8")
+
+def check_precision(precision, device):
+    """
+    Validate a precision for a device.
+
+    Returns:
+        str: The device to load on; int8 kernels only exist for CPU
+    """
+    if precision not in PRECISIONS:
+        raise ValueError(f"Unknown precision '{precision}', expected one of {PRECISIONS}")
+    if precision == "int8" and device != "cpu":
+        print(f"int8 inference runs on cpu, not {device}")
+        return "cpu"
+    return device
+
+def quantize_int8(module):
+    """
+    Dynamically quantize the Linear and LSTM layers of a module in place.
+
+    Returns:
+        int: Number of quantized layers
+    """
+    import torch
+    from torch.ao.quantization import quantize_dynamic
+
+    layers = (torch.nn.Linear, torch.nn.LSTM)
+    count = sum(isinstance(m, layers) for m in module.modules())
+    quantize_dynamic(module, set(layers), dtype=torch.qint8, inplace=True)
+    return count
+
+def _to_float32(value):
+    """Cast floating point tensors in a model output (tensor, tuple or dataclass) back to float32."""
+    import torch
+    if torch.is_tensor(value):
+        return value.float() if value.is_floating_point() else value
+    if dataclasses.is_dataclass(value) and not isinstance(value, type):
+        return dataclasses.replace(value, **{f.name: _to_float32(getattr(value, f.name))
+                                             for f in dataclasses.fields(value) if f.init})
+    if isinstance(value, tuple) and not hasattr(value, "_fields"):
+        return tuple(_to_float32(v) for v in value)
+    return value
+
+def autocast_bf16(module, device="cpu"):
+    """Run module.forward under bfloat16 autocast, returning float32 outputs as before."""
+    import torch
+    forward = module.forward
+    device_type = device.split(":")[0]
+
+    @functools.wraps(forward)
+    def forward_bf16(*args, **kwargs):
+        with torch.autocast(device_type=device_type, dtype=torch.bfloat16):
+            return _to_float32(forward(*args, **kwargs))
+
+    module.forward = forward_bf16
+
+def keep_float32(module, device="cpu"):
+    """Run module.forward in float32 inside an autocast region, for ops without bfloat16 kernels."""
+    import torch
+    forward = module.forward
+    device_type = device.split(":")[0]
+
+    @functools.wraps(forward)
+    def forward_fp32(*args, **kwargs):
+        with torch.autocast(device_type=device_type, enabled=False):
+            return forward(*[_to_float32(a) for a in args], **{k: _to_float32(v) for k, v in kwargs.items()})
+
+    module.forward = forward_fp32
+
+def apply_precision(module, precision, device="cpu", float32_modules=()):
+    """
+    Convert a loaded torch module to the given precision in place.
+
+    Args:
+        module (torch.nn.Module): Model in eval mode
+        precision (str): One of PRECISIONS
+        device (str): Device the module lives on
+        float32_modules (tuple): Names of submodules that stay in float32 under bf16
+    """
+    if precision == "int8":
+        count = quantize_int8(module)
+        print(f"Quantized {count} layers of {type(module).__name__} to int8")
+        if not count:
+            print(f"{type(module).__name__} has no Linear or LSTM layers, int8 leaves it in float32")
+    elif precision == "bf16":
+        autocast_bf16(module, device)
+        for name in float32_modules:
+            keep_float32(module.get_submodule(name), device)
+    return module
@@ -0,0 +1,126 @@
+"""
+Length-balanced, sentence-aware segmentation of chapter text for TTS.
+
+Kokoro handles at most 510 phonemes per forward pass. Splitting on newlines
+produces anything from one-word headings to paragraphs that overflow the
+window and get re-split internally. Here whole sentences are packed into
+segments up to a target length budget, never breaking inside a sentence, and
+every segment keeps its character span in the source text.
+"""
+
+import re
+from collections import namedtuple, defaultdict
+
+# Kokoro's phoneme window is 510; leave headroom since the default length is an estimate
+DEFAULT_TARGET = 400
+DEFAULT_BUCKET_WIDTH = 50
+
+Segment = namedtuple("Segment", ["text", "start", "end"])
+
+ABBREVIATIONS = ("e.g.", "i.e.", "et al.", "etc.", "vs.", "Fig.", "fig.", "eq.", "Eq.", "Dr.", "Mr.", "Ms.", "No.")
+# Anchored on a word boundary so words ending like an abbreviation ("config.", "Geo.") still end sentences
+ABBREVIATION_END = re.compile(r'(?<!\w)(?:' + '|'.join(map(re.escape, ABBREVIATIONS)) + r')$')
+SENTENCE_END = re.compile(r'[.!?…]["”’)\]]*(?=\s)|\n+')
+
+def estimate_length(text):
+    """
+    Rough phoneme count for English text.
+
+    Misaki emits about one phoneme per letter, so the number of non-space
+    characters is a cheap, slightly pessimistic stand-in for running G2P.
+    """
+    return len(text) - text.count(" ")
+
+def sentence_spans(text):
+    """
+    (start, end) character spans of the sentences in text, with surrounding whitespace excluded.
+
+    >>> text = "See Fig. 3 for details. Edit the config. Then run it."
+    >>> [text[start:end] for start, end in sentence_spans(text)]
+    ['See Fig. 3 for details.', 'Edit the config.', 'Then run it.']
+    """
+    spans = []
+    start = 0
+    for match in SENTENCE_END.finditer(text):
+        end = match.end()
+        if match.group().strip() and ABBREVIATION_END.search(text[start:end].rstrip()):
+            continue
+        spans.append((start, end))
+        start = end
+    spans.append((start, len(text)))
+
+    trimmed = []
+    for start, end in spans:
+        chunk = text[start:end]
+        stripped = chunk.strip()
+        if not stripped:
+            continue
+        offset = start + len(chunk) - len(chunk.lstrip())
+        trimmed.append((offset, offset + len(stripped)))
+    return trimmed
+
+def iter_segments(text, target=DEFAULT_TARGET, length_fn=estimate_length, first_target=None):
+    """
+    Lazy segment_text: length_fn only runs on the sentences needed so far.
+
+    With first_target the first segment gets its own, usually smaller, budget.
+    """
+    budget = first_target if first_target is not None else target
+    seg_start = seg_end = None
+    seg_length = 0
+    for start, end in sentence_spans(text):
+        length = length_fn(text[start:end])
+        if seg_start is not None and seg_length + length > budget:
+            yield Segment(text[seg_start:seg_end], seg_start, seg_end)
+            seg_start, budget = None, target
+
+        if seg_start is None:
+            seg_start, seg_length = start, 0
+        seg_end = end
+        seg_length += length
+
+    if seg_start is not None:
+        yield Segment(text[seg_start:seg_end], seg_start, seg_end)
+
+def segment_text(text, target=DEFAULT_TARGET, length_fn=estimate_length):
+    """
+    Pack whole sentences into segments of at most `target` length.
+
+    A sentence longer than the target becomes a segment of its own rather than
+    being cut. Headings and other short lines are merged with what follows.
+
+    Args:
+        text (str): Chapter text
+        target (int): Length budget per segment, in length_fn units
+        length_fn (callable): Length of a piece of text, e.g. a real phoneme count
+
+    Returns:
+        list: Segment(text, start, end) tuples with text == source[start:end]
+    """
+    return list(iter_segments(text, target, length_fn))
+
+def bucket_segments(texts, bucket_width=DEFAULT_BUCKET_WIDTH, length_fn=estimate_length):
+    """
+    Group segment indices into length buckets so similar-length segments can be batched.
+
+    Args:
+        texts (list): Segment texts
+
+    Returns:
+        dict: Bucket number (length // bucket_width) -> list of segment indices
+    """
+    buckets = defaultdict(list)
+    for i, text in enumerate(texts):
+        buckets[length_fn(text) // bucket_width].append(i)
+    return dict(buckets)
+
+def longest_first(texts, indices=None, bucket_width=DEFAULT_BUCKET_WIDTH, length_fn=estimate_length):
+    """
+    Order segment indices bucket by bucket, longest bucket first.
+
+    Scheduling long segments first keeps parallel workers evenly loaded at the
+    end of a chapter.
+    """
+    indices = set(range(len(texts)) if indices is None else indices)
+    buckets = bucket_segments(texts, bucket_width, length_fn)
+    return [i for bucket in sorted(buckets, reverse=True) for i in buckets[bucket] if i in indices]
@@ -6,9 +6,12 @@
 # Upload to spotify?
 
 import os
+import io
 import argparse
 from PyPDF2 import PdfReader, PdfWriter
 
+MAX_CHUNK_MB = 20
+
 def split_pdf_by_pages(input_path: str, pages_per_chunk: int, output_dir: str):
     reader = PdfReader(input_path)
     total_pages = len(reader.pages)
@@ -29,19 +32,115 @@ def split_pdf_by_pages(input_path: str, pages_per_chunk: int, output_dir: str):
 
         # Check if the output file size exceeds 20MB
         file_size_mb = os.path.getsize(output_path) / (1024 * 1024)
-        if file_size_mb > 20:
+        if file_size_mb > MAX_CHUNK_MB:
             print(f"WARNING: Chunk {filename_base}_part_{i // pages_per_chunk + 1}.pdf exceeds 20MB (size: {file_size_mb:.2f}MB)")
 
         print(f"Saved chunk: {output_path} ({file_size_mb:.2f}MB)")
 
+def serialize_pages(pages) -> bytes:
+    """Write the given pages to an in-memory PDF and return its bytes."""
+    writer = PdfWriter()
+    for page in pages:
+        writer.add_page(page)
+    buffer = io.BytesIO()
+    writer.write(buffer)
+    return buffer.getvalue()
+
+def largest_chunk_under_budget(pages, start: int, max_bytes: int):
+    """
+    Find the longest run of pages starting at `start` whose serialized PDF fits in max_bytes.
+
+    Grows the run exponentially, then binary searches between the last size that
+    fit and the first that did not, so each chunk costs O(log n) serializations.
+    A single page larger than the budget is returned on its own.
+
+    Returns:
+        tuple: (end index, exclusive; serialized bytes of pages[start:end])
+    """
+    total_pages = len(pages)
+    good_end, good_data = start + 1, serialize_pages(pages[start:start + 1])
+    if len(good_data) > max_bytes:
+        return good_end, good_data
+
+    # Exponential search for an end index that no longer fits
+    step = 1
+    bad_end = None
+    while good_end < total_pages:
+        end = min(good_end + step, total_pages)
+        data = serialize_pages(pages[start:end])
+        if len(data) > max_bytes:
+            bad_end = end
+            break
+        good_end, good_data = end, data
+        step *= 2
+
+    # Binary search between the last fitting and the first failing end index
+    if bad_end is not None:
+        while bad_end - good_end > 1:
+            mid = (good_end + bad_end) // 2
+            data = serialize_pages(pages[start:mid])
+            if len(data) > max_bytes:
+                bad_end = mid
+            else:
+                good_end, good_data = mid, data
+
+    return good_end, good_data
+
+def split_pdf_by_size(input_path: str, max_mb: float, output_dir: str):
+    """
+    Split a PDF into as few chunks as possible, each at most max_mb on disk.
+
+    Unlike split_pdf_by_pages, the chunk size adapts to the content so that every
+    chunk stays under the upload limit instead of only warning about it.
+    """
+    reader = PdfReader(input_path)
+    pages = reader.pages
+    max_bytes = int(max_mb * 1024 * 1024)
+    filename_base = os.path.splitext(os.path.basename(input_path))[0]
+
+    os.makedirs(output_dir, exist_ok=True)
+
+    start, part = 0, 1
+    while start < len(pages):
+        end, data = largest_chunk_under_budget(pages, start, max_bytes)
+
+        output_path = os.path.join(output_dir, f"{filename_base}_part_{part}.pdf")
+        with open(output_path, "wb") as f:
+            f.write(data)
+
+        file_size_mb = len(data) / (1024 * 1024)
+        if len(data) > max_bytes:
+            print(f"WARNING: Page {start + 1} alone exceeds {max_mb}MB (size: {file_size_mb:.2f}MB)")
+
+        print(f"Saved chunk: {output_path} (pages {start + 1}-{end}, {file_size_mb:.2f}MB)")
+        start, part = end, part + 1
+
 def main():
     parser = argparse.ArgumentParser(description="Split a PDF into smaller chunks of X pages each.")
     parser.add_argument("input_pdf", help="Path to the input PDF file")
-    parser.add_argument("pages_per_chunk", type=int, help="Number of pages per chunk")
-    parser.add_argument("output_dir", help="Directory to save output PDF chunks")
+    parser.add_argument("pages_per_chunk", nargs="?", help="Number of pages per chunk")
+    parser.add_argument("positional_output_dir", nargs="?", metavar="output_dir",
+                        help="Same as --output-dir, for older invocations")
+    parser.add_argument("--output-dir", help="Directory to save output PDF chunks (default: output_pdf_chunks)")
+    parser.add_argument("--max-mb", type=float, help=f"Size chunks by bytes instead of pages (e.g. {MAX_CHUNK_MB} for the upload limit)")
     args = parser.parse_args()
 
-    split_pdf_by_pages(args.input_pdf, args.pages_per_chunk, args.output_dir)
+    # `split_pdf.py book.pdf out --max-mb 20`: a lone non-numeric positional is the output directory
+    if args.pages_per_chunk is not None and not args.pages_per_chunk.isdigit() and args.positional_output_dir is None:
+        args.pages_per_chunk, args.positional_output_dir = None, args.pages_per_chunk
+    if args.pages_per_chunk is not None and not args.pages_per_chunk.isdigit():
+        parser.error(f"pages_per_chunk must be a positive integer, got '{args.pages_per_chunk}'")
+    if args.output_dir and args.positional_output_dir and args.output_dir != args.positional_output_dir:
+        parser.error("output directory given both as positional argument and --output-dir")
+    args.output_dir = args.output_dir or args.positional_output_dir or "output_pdf_chunks"
+    pages_per_chunk = int(args.pages_per_chunk) if args.pages_per_chunk is not None else None
+
+    if args.max_mb is not None:
+        split_pdf_by_size(args.input_pdf, args.max_mb, args.output_dir)
+    elif pages_per_chunk is not None:
+        split_pdf_by_pages(args.input_pdf, pages_per_chunk, args.output_dir)
+    else:
+        parser.error("either pages_per_chunk or --max-mb is required")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -1,42 +1,150 @@
-from pydub import AudioSegment
 import os
+import re
+import argparse
+import tempfile
+import numpy as np
+import soundfile as sf
+
+from audio_writer import StreamingAudioWriter
+from timing_index import TimingIndex, BookIndex, index_path, book_index_path
+
+# Books above this many samples are assembled in a memory-mapped temp file instead of RAM (~1 GB of float32)
+MEMMAP_THRESHOLD = 256 * 1024 * 1024
+# Silence between numbered segments, and between chapters when stitching a book
+SEGMENT_SILENCE_MS = 0
+CHAPTER_SILENCE_MS = 1000
+
+def list_segment_files(input_dir):
+    """WAV segment files of input_dir in numerical order."""
+    files = [f for f in os.listdir(input_dir) if f.endswith('.wav')]
+    files.sort(key=lambda x: int(os.path.splitext(x)[0]))
+    return files
+
+def overlap_frames(previous, length, gap=0, crossfade=0):
+    """
+    Frames by which a segment overlaps the one before it.
+
+    Without silence, consecutive segments overlap by `crossfade` frames, limited
+    so a fade never spans more than a whole segment. With silence they do not
+    overlap: the edges next to the silence are faded out and in instead.
+    """
+    return 0 if gap else min(crossfade, previous, length)
+
+def segment_offsets(lengths, gap=0, crossfade=0):
+    """
+    Start offset of every segment and the total length.
+
+    Consecutive segments are separated by `gap` frames of silence or overlap as
+    decided by overlap_frames.
+    """
+    offsets = []
+    position = 0
+    previous = None
+    for length in lengths:
+        if previous is not None:
+            position += gap - overlap_frames(previous, length, gap, crossfade)
+        offsets.append(position)
+        position += length
+        previous = length
+    return offsets, position
+
+def allocate_buffer(frames):
+    """Zeroed float32 buffer of the given length, memory-mapped if it is too large for RAM."""
+    if frames <= MEMMAP_THRESHOLD:
+        return np.zeros(frames, dtype=np.float32)
+    tmp = tempfile.TemporaryFile()
+    return np.memmap(tmp, dtype=np.float32, mode='w+', shape=(frames,))
+
+def grow_buffer(buffer, frames):
+    """Copy of buffer zero-extended to at least `frames`."""
+    grown = allocate_buffer(max(frames, int(len(buffer) * 1.1)))
+    grown[:len(buffer)] = buffer
+    return grown
+
+def to_mono(audio):
+    return audio.mean(axis=1) if audio.ndim > 1 else audio
+
+def concatenate_files(paths, output_file, format="mp3", silence_ms=SEGMENT_SILENCE_MS, crossfade_ms=0):
+    """
+    Concatenate audio files into one encoded file.
+
+    Lengths are read from the file headers first, so the output buffer is
+    allocated once and every input is copied into place exactly once; the
+    result is encoded in a single pass. Header frame counts of some MP3s are
+    off by a few frames, so inputs are placed by their decoded length and the
+    buffer is only grown in the rare case the estimate falls short.
+
+    Returns:
+        tuple: (start offset of every input in samples, sample rate)
+    """
+    infos = [sf.info(path) for path in paths]
+    sample_rate = infos[0].samplerate
+    if any(info.samplerate != sample_rate for info in infos):
+        raise ValueError("Audio files to combine have different sample rates")
+
+    gap = int(sample_rate * silence_ms / 1000)
+    crossfade = int(sample_rate * crossfade_ms / 1000)
+    _, estimate = segment_offsets([info.frames for info in infos], gap, crossfade)
+    combined = allocate_buffer(estimate)
+
+    offsets = []
+    end = 0
+    for path in paths:
+        print(f"Adding {os.path.basename(path)}")
+        audio = to_mono(sf.read(path, dtype='float32')[0])
+        offset = end
+        if offsets:
+            offset += gap - overlap_frames(previous, len(audio), gap, crossfade)
+            if gap and crossfade:
+                # Fade out into the silence and back in from it
+                fade_out = min(crossfade, previous)
+                combined[end - fade_out:end] *= np.linspace(1, 0, fade_out, endpoint=False, dtype=np.float32)
+                fade_in = min(crossfade, len(audio))
+                audio[:fade_in] *= np.linspace(0, 1, fade_in, endpoint=False, dtype=np.float32)
+        if offset + len(audio) > len(combined):
+            combined = grow_buffer(combined, offset + len(audio))
+        overlap = max(0, end - offset)
+        if overlap:
+            fade_in = np.linspace(0, 1, overlap, endpoint=False, dtype=np.float32)
+            combined[offset:end] *= 1 - fade_in
+            combined[offset:end] += audio[:overlap] * fade_in
+        combined[offset + overlap:offset + len(audio)] = audio[overlap:]
+        offsets.append(offset)
+        end = offset + len(audio)
+        previous = len(audio)
+    total = end
+
+    # Export combined audio in the specified format
+    with StreamingAudioWriter(output_file, format=format, sample_rate=sample_rate) as writer:
+        for start in range(0, total, writer.buffer.size):
+            writer.write(combined[start:min(start + writer.buffer.size, total)])
+    print(f"Combined audio saved to {output_file} ({total / sample_rate:.0f}s)")
+    return offsets, sample_rate
 
 def combine_audio_files(input_dir="output_audio", output_file="output_audio/combined_output.mp3",
-                        format="mp3", remove_source_files=True):
+                        format="mp3", remove_source_files=True, silence_ms=SEGMENT_SILENCE_MS, crossfade_ms=0):
     """
     Combines multiple WAV files in numerical order into a single file.
 
     Args:
         input_dir (str): Directory containing the WAV files
         output_file (str): Name of the output file
-        format (str): Output format (mp3, wav, etc.)
+        format (str): Output format (mp3, wav, flac, ogg or opus)
         remove_source_files (bool): Whether to remove source WAV files after combining
+        silence_ms (int): Silence inserted between segments
+        crossfade_ms (int): Overlap between consecutive segments, faded linearly; with silence,
+                            length of the fades into and out of it
     """
-    # Get all wav files in the directory
-    files = [f for f in os.listdir(input_dir) if f.endswith('.wav')]
-
-    # Extract numbers from filenames and sort numerically
-    files.sort(key=lambda x: int(os.path.splitext(x)[0]))
+    files = list_segment_files(input_dir)
 
     print(f"Found {len(files)} files to combine.")
 
-    # Initialize with the first file
     if not files:
         print("No WAV files found!")
         return
 
-    combined = AudioSegment.from_wav(os.path.join(input_dir, files[0]))
-    print(f"Starting with {files[0]}")
-
-    # Append each subsequent file
-    for file in files[1:]:
-        print(f"Adding {file}")
-        audio = AudioSegment.from_wav(os.path.join(input_dir, file))
-        combined += audio
-
-    # Export combined audio in the specified format
-    combined.export(output_file, format=format)
-    print(f"Combined audio saved to {output_file}")
+    concatenate_files([os.path.join(input_dir, file) for file in files], output_file, format=format,
+                      silence_ms=silence_ms, crossfade_ms=crossfade_ms)
 
     # Remove source WAV files if requested
     if remove_source_files:
@@ -49,6 +157,56 @@ def combine_audio_files(input_dir="output_audio", output_file="output_audio/comb
             except Exception as e:
                 print(f"Error removing {file}: {e}")
 
+def list_chapter_audio(audio_dir="output_audio", format="mp3"):
+    """Chapter audio files of audio_dir in chapter order (by leading number)."""
+    files = [f for f in os.listdir(audio_dir) if f.endswith(f".{format}") and re.match(r"^\d+", f)]
+    files.sort(key=lambda x: int(re.match(r"^(\d+)", x).group(1)))
+    return [os.path.join(audio_dir, f) for f in files]
+
+def combine_chapters(audio_paths, output_file="output_audio/combined_output.mp3", format="mp3",
+                     silence_ms=CHAPTER_SILENCE_MS, crossfade_ms=0):
+    """
+    Stitch chapter audio files into one book and carry their timing indexes along.
+
+    The chapters' TimingIndex files are shifted to their position in the book
+    and saved together as a BookIndex next to the output.
+    """
+    offsets, sample_rate = concatenate_files(audio_paths, output_file, format=format,
+                                             silence_ms=silence_ms, crossfade_ms=crossfade_ms)
+    book = BookIndex(sample_rate)
+    for path, offset in zip(audio_paths, offsets):
+        title = os.path.splitext(os.path.basename(path))[0]
+        if os.path.exists(index_path(path)):
+            index = TimingIndex.load(index_path(path))
+        else:
+            index = TimingIndex(sample_rate)
+        book.add(title, index, offset)
+    book.save(book_index_path(output_file))
+    return book
+
 if __name__ == "__main__":
-    # For MP3 output with WAV file cleanup
-    combine_audio_files(output_file="output_audio/combined_output.mp3", format="mp3", remove_source_files=True)
+    parser = argparse.ArgumentParser(description="Combine numbered WAV segments into one audio file.")
+    parser.add_argument("input_dir", nargs="?", default="output_audio", help="Directory of numbered WAV segments")
+    parser.add_argument("--chapters", action="store_true",
+                        help="Stitch the chapter files in input_dir (output of generate_kokoro.py) into one book")
+    parser.add_argument("--output", default="output_audio/combined_output.mp3", help="Combined output file")
+    parser.add_argument("--format", default="mp3", help="Output format (mp3, wav, flac, ogg or opus)")
+    parser.add_argument("--silence-ms", type=int,
+                        help=f"Silence between segments (default {SEGMENT_SILENCE_MS}, "
+                             f"{CHAPTER_SILENCE_MS} between chapters with --chapters)")
+    parser.add_argument("--crossfade-ms", type=int, default=0,
+                        help="Crossfade between segments; with silence, fade out into it and in from it instead")
+    parser.add_argument("--keep-segments", action="store_true", help="Keep the WAV segments after combining")
+    args = parser.parse_args()
+    if args.silence_ms is None:
+        args.silence_ms = CHAPTER_SILENCE_MS if args.chapters else SEGMENT_SILENCE_MS
+
+    if args.chapters:
+        book = combine_chapters(list_chapter_audio(args.input_dir, args.format), args.output, format=args.format,
+                                silence_ms=args.silence_ms, crossfade_ms=args.crossfade_ms)
+        print("\n".join(book.chapter_marks()))
+    else:
+        # For MP3 output with WAV file cleanup
+        combine_audio_files(args.input_dir, args.output, format=args.format,
+                            remove_source_files=not args.keep_segments,
+                            silence_ms=args.silence_ms, crossfade_ms=args.crossfade_ms)
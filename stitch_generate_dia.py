@@ -1,20 +1,26 @@
-from dia.model import Dia
+import numpy as np
 
-model = Dia.from_pretrained("nari-labs/Dia-1.6B", device="mps")
+from generate_dia import load_model, speaker_text, token_budget
+from voice_profiles import VoiceProfileStore
+from device_utils import select_device
 
-# Clone from text and audio
+device = select_device("auto")
+model = load_model(device)
+
+# Clone from text and audio; the clip is encoded once and reused from .voice_profiles/ on later runs
 with open("./sample.txt", "r") as f:
     clone_from_text = f.read()
 
-clone_from_text = "[S1] " + clone_from_text
-clone_from_audio = "sample.mp3"
+clone_from_audio, clone_from_text = VoiceProfileStore().get_or_create(model, "sample", "sample.mp3", clone_from_text,
+                                                                        device=device)
 
 # Text to generate
-text_to_generate = "[S1] Open Questions Fundamental problems and discussions for the long-term evolution of how RLHF is used. 17. Over-optimization: Qualitative observations of why RLHF goes wrong and why over-optimization is inevitable with a soft optimization target in reward models."
+text_to_generate = "Open Questions Fundamental problems and discussions for the long-term evolution of how RLHF is used. 17. Over-optimization: Qualitative observations of why RLHF goes wrong and why over-optimization is inevitable with a soft optimization target in reward models."
 
 # It will only return the audio from the text_to_generate
 output = model.generate(
-    clone_from_text + text_to_generate, audio_prompt=clone_from_audio, use_torch_compile=False, verbose=True
+    speaker_text(clone_from_text) + " " + speaker_text(text_to_generate), audio_prompt=clone_from_audio,
+    max_tokens=token_budget(text_to_generate, clone_from_audio.shape[0]), use_torch_compile=False, verbose=True
 )
 
-model.save_audio("voice_clone.mp3", output)
\ No newline at end of file
+model.save_audio("voice_clone.mp3", np.asarray(output))
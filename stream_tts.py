@@ -0,0 +1,105 @@
+"""
+Overlap Gemini parsing and Kokoro synthesis for one chapter.
+
+A producer thread streams the chapter's parsed paragraphs from
+parse_content.stream_paragraphs into a queue while the main thread
+synthesizes them, so the first audio segment exists seconds after the request
+starts and the chapter takes roughly max(parse, synth) instead of their sum.
+Audio is appended to one encoded chapter file as it is synthesized, like
+generate_kokoro.py, and the parsed text is saved to parsed_text/ once the
+stream completes.
+"""
+
+import os
+import queue
+import argparse
+import threading
+from dotenv import load_dotenv
+from google import genai
+
+import parse_content
+from bibliography import load_citation_index
+from gemini_cache import ResponseCache
+from audio_cache import SegmentAudioCache
+from audio_writer import StreamingAudioWriter
+from timing_index import TimingIndex, index_path
+from generate_kokoro import load_pipeline, synthesize_segment, SAMPLE_RATE
+
+_DONE = object()
+
+def produce_paragraphs(paragraphs, paragraph_queue):
+    """Push paragraphs into the queue, then the end marker (or the exception that stopped the stream)."""
+    try:
+        for paragraph in paragraphs:
+            paragraph_queue.put(paragraph)
+    except Exception as e:
+        paragraph_queue.put(e)
+    finally:
+        paragraph_queue.put(_DONE)
+
+def parse_and_synthesize(client, tts_pipeline, chapter_path, citation_index, prompt,
+                         output_path="output_audio/chapter.mp3", text_dir="parsed_text", voice="af_heart", speed=1,
+                         cache=None, resolve_locally=False, audio_cache=None):
+    """
+    Stream one chapter through parsing and synthesis concurrently.
+
+    Returns:
+        int: Number of paragraphs synthesized
+    """
+    paragraph_queue = queue.Queue()
+    paragraphs = parse_content.stream_paragraphs(client, chapter_path, citation_index, prompt,
+                                                 cache=cache, resolve_locally=resolve_locally)
+    producer = threading.Thread(target=produce_paragraphs, args=(paragraphs, paragraph_queue), daemon=True)
+    producer.start()
+
+    fp = os.path.basename(chapter_path)
+    text_path = os.path.join(text_dir, os.path.splitext(fp)[0] + ".txt")
+    index = TimingIndex(SAMPLE_RATE, text_path)
+    parsed, char_offset = [], 0
+    with StreamingAudioWriter(output_path, sample_rate=SAMPLE_RATE) as writer:
+        while True:
+            paragraph = paragraph_queue.get()
+            if paragraph is _DONE:
+                break
+            if isinstance(paragraph, Exception):
+                raise paragraph
+
+            audio, _ = synthesize_segment(tts_pipeline, paragraph, voice=voice, speed=speed, cache=audio_cache)
+            # Paragraphs are saved joined by newlines, so offsets match the written text file
+            index.add(char_offset, char_offset + len(paragraph), writer.frames, writer.frames + len(audio))
+            char_offset += len(paragraph) + 1
+            writer.write(audio)
+            print(f"Segment {len(parsed)}: {paragraph[:60]}")
+            parsed.append(paragraph)
+
+    producer.join()
+
+    parse_content.write_parsed(fp, parse_content.ParsedDocument(content="\n".join(parsed), summary=""), text_dir)
+    index.save(index_path(output_path))
+    return len(parsed)
+
+def main():
+    parser = argparse.ArgumentParser(description="Parse a chapter with Gemini and synthesize it while it streams.")
+    parser.add_argument("chapter_pdf", help="Path to the chapter PDF")
+    parser.add_argument("--output", help="Chapter audio file (default: output_audio/<chapter>.mp3)")
+    parser.add_argument("--voice", default="af_heart", help="Kokoro voice")
+    parser.add_argument("--lang-code", default="b", help="Kokoro language code")
+    parser.add_argument("--device", default="auto", help="Torch device for TTS: auto, cpu, cuda or mps")
+    parser.add_argument("--no-cache", action="store_true", help="Always call the API instead of reusing cached responses")
+    args = parser.parse_args()
+
+    load_dotenv()
+    client = genai.Client(api_key=os.getenv("GEMINI_API_KEY"))
+    cache = None if args.no_cache else ResponseCache()
+    tts_pipeline = load_pipeline(args.lang_code, args.device)
+    chapter = os.path.splitext(os.path.basename(args.chapter_pdf))[0]
+    output_path = args.output or os.path.join("output_audio", f"{chapter}.mp3")
+
+    count = parse_and_synthesize(
+        client, tts_pipeline, args.chapter_pdf, load_citation_index(), parse_content.load_prompt(),
+        output_path=output_path, voice=args.voice, cache=cache, audio_cache=SegmentAudioCache(),
+    )
+    print(f"Wrote {count} segments to {output_path}")
+
+if __name__ == "__main__":
+    main()
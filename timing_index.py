@@ -0,0 +1,196 @@
+"""
+Text-to-audio timing index.
+
+Synthesis knows exactly which characters of the parsed text each segment
+covers and how many samples it produced, so it records both as it goes. The
+index is stored next to the audio (chapter.mp3 -> chapter.mp3.timing.json)
+and maps character offsets in the parsed_text file to sample offsets in the
+final audio and back. Lookups are a binary search over the segment starts;
+positions inside a segment are interpolated linearly, which is close enough to
+seek to a sentence without re-decoding or re-aligning the audio.
+
+Usage:
+    python timing_index.py output_audio/01_Introduction.mp3 --char 1200
+    python timing_index.py output_audio/01_Introduction.mp3 --seconds 95.5
+    python timing_index.py output_audio/combined_output.mp3 --chapters
+"""
+
+import json
+import argparse
+from bisect import bisect_right
+
+def index_path(audio_path):
+    return f"{audio_path}.timing.json"
+
+def book_index_path(audio_path):
+    return f"{audio_path}.chapters.json"
+
+class TimingIndex:
+    """
+    Sorted (char_start, char_end) -> (sample_start, sample_end) spans of one audio file.
+
+    Args:
+        sample_rate (int): Sample rate of the audio
+        text_path (str): Parsed text the character offsets refer to
+    """
+
+    def __init__(self, sample_rate, text_path=None):
+        self.sample_rate = sample_rate
+        self.text_path = text_path
+        self.char_starts, self.char_ends = [], []
+        self.sample_starts, self.sample_ends = [], []
+
+    def __len__(self):
+        return len(self.char_starts)
+
+    def add(self, char_start, char_end, sample_start, sample_end):
+        """Record one segment; segments must be added in order."""
+        self.char_starts.append(char_start)
+        self.char_ends.append(char_end)
+        self.sample_starts.append(sample_start)
+        self.sample_ends.append(sample_end)
+
+    def shifted(self, samples):
+        """Copy of the index with every sample offset moved by `samples`, e.g. after stitching."""
+        index = TimingIndex(self.sample_rate, self.text_path)
+        for span in zip(self.char_starts, self.char_ends, self.sample_starts, self.sample_ends):
+            index.add(span[0], span[1], span[2] + samples, span[3] + samples)
+        return index
+
+    def sample_at_char(self, offset):
+        """Sample offset where the text at character `offset` is spoken."""
+        if not self:
+            return 0
+        i = max(bisect_right(self.char_starts, offset) - 1, 0)
+        return self._interpolate(offset, self.char_starts[i], self.char_ends[i],
+                                 self.sample_starts[i], self.sample_ends[i])
+
+    def char_at_sample(self, sample):
+        """Character offset being spoken at `sample`."""
+        if not self:
+            return 0
+        i = max(bisect_right(self.sample_starts, sample) - 1, 0)
+        return self._interpolate(sample, self.sample_starts[i], self.sample_ends[i],
+                                 self.char_starts[i], self.char_ends[i])
+
+    def seconds_at_char(self, offset):
+        return self.sample_at_char(offset) / self.sample_rate
+
+    def char_at_seconds(self, seconds):
+        return self.char_at_sample(int(seconds * self.sample_rate))
+
+    @staticmethod
+    def _interpolate(value, start, end, target_start, target_end):
+        if end <= start:
+            return target_start
+        fraction = min(max((value - start) / (end - start), 0), 1)
+        return target_start + int(fraction * (target_end - target_start))
+
+    def to_dict(self):
+        return {
+            "sample_rate": self.sample_rate,
+            "text_path": self.text_path,
+            "char_starts": self.char_starts,
+            "char_ends": self.char_ends,
+            "sample_starts": self.sample_starts,
+            "sample_ends": self.sample_ends,
+        }
+
+    def save(self, path):
+        with open(path, "w") as f:
+            json.dump(self.to_dict(), f, separators=(",", ":"))
+
+    @classmethod
+    def from_dict(cls, data):
+        index = cls(data["sample_rate"], data.get("text_path"))
+        index.char_starts, index.char_ends = data["char_starts"], data["char_ends"]
+        index.sample_starts, index.sample_ends = data["sample_starts"], data["sample_ends"]
+        return index
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "r") as f:
+            return cls.from_dict(json.load(f))
+
+class BookIndex:
+    """
+    Timing indexes of several chapters stitched into one audio file.
+
+    Chapter starts are kept sorted, so finding the chapter at a position is a
+    binary search as well.
+    """
+
+    def __init__(self, sample_rate):
+        self.sample_rate = sample_rate
+        self.titles = []
+        self.starts = []
+        self.chapters = []
+
+    def add(self, title, index, sample_offset):
+        """Append a chapter whose audio starts at sample_offset in the stitched file."""
+        self.titles.append(title)
+        self.starts.append(sample_offset)
+        self.chapters.append(index.shifted(sample_offset))
+
+    def chapter_at_sample(self, sample):
+        return self.titles[max(bisect_right(self.starts, sample) - 1, 0)]
+
+    def seconds_at(self, title, char_offset=0):
+        """Position of a character offset within a chapter, in seconds from the start of the book."""
+        i = self.titles.index(title)
+        if char_offset == 0 or not self.chapters[i]:
+            return self.starts[i] / self.sample_rate
+        return self.chapters[i].seconds_at_char(char_offset)
+
+    def chapter_marks(self):
+        """'H:MM:SS Title' lines, e.g. for video chapter descriptions."""
+        marks = []
+        for title, start in zip(self.titles, self.starts):
+            seconds = int(start / self.sample_rate)
+            marks.append(f"{seconds // 3600}:{seconds // 60 % 60:02d}:{seconds % 60:02d} {title}")
+        return marks
+
+    def save(self, path):
+        data = {"sample_rate": self.sample_rate, "chapters": [
+            dict(index.to_dict(), title=title, start=start)
+            for title, start, index in zip(self.titles, self.starts, self.chapters)
+        ]}
+        with open(path, "w") as f:
+            json.dump(data, f, separators=(",", ":"))
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "r") as f:
+            data = json.load(f)
+        book = cls(data["sample_rate"])
+        for chapter in data["chapters"]:
+            book.titles.append(chapter["title"])
+            book.starts.append(chapter["start"])
+            book.chapters.append(TimingIndex.from_dict(chapter))
+        return book
+
+def main():
+    parser = argparse.ArgumentParser(description="Look up positions in a synthesized chapter.")
+    parser.add_argument("audio", help="Audio file with a .timing.json index next to it")
+    group = parser.add_mutually_exclusive_group(required=True)
+    group.add_argument("--char", type=int, help="Character offset in the parsed text")
+    group.add_argument("--seconds", type=float, help="Position in the audio")
+    group.add_argument("--chapters", action="store_true", help="List chapter start times of a stitched book")
+    args = parser.parse_args()
+
+    if args.chapters:
+        print("\n".join(BookIndex.load(book_index_path(args.audio)).chapter_marks()))
+        return
+
+    index = TimingIndex.load(index_path(args.audio))
+    if args.char is not None:
+        print(f"{index.seconds_at_char(args.char):.2f}")
+    else:
+        offset = index.char_at_seconds(args.seconds)
+        print(offset)
+        if index.text_path:
+            with open(index.text_path, "r") as f:
+                print(f.read()[offset:offset + 200])
+
+if __name__ == "__main__":
+    main()
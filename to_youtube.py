@@ -1,13 +1,106 @@
 #!/usr/bin/env python3
 """
 Script to create an MP4 video from an MP3 audio file and a PNG image.
+
+The default path calls ffmpeg directly: the still image is looped at 1 fps and
+encoded once with x264's stillimage tuning, and MP3/AAC audio is copied into
+the MP4 as is. Compared to rendering 24 identical frames per second through
+moviepy this makes an hour-long chapter take seconds instead of many minutes.
+moviepy remains available with --moviepy (or when no ffmpeg binary is found).
+
+Passing several audio files (or a directory of chapter audio) renders one
+video per chapter in parallel worker processes.
+
+Usage:
+    python to_youtube.py cover.png "output_audio/1 Introduction.mp3" -o "videos/1 Introduction.mp4"
+    python to_youtube.py cover.png output_audio --output-dir videos --workers 4
 """
 
 import os
+import shutil
 import argparse
-from moviepy.editor import ImageClip, AudioFileClip, CompositeAudioClip
+import subprocess
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from device_utils import cpu_count
+
+# Audio codecs the MP4 container takes without re-encoding
+COPY_AUDIO_EXTENSIONS = (".mp3", ".m4a", ".aac")
+
+def ffmpeg_executable():
+    """ffmpeg on the PATH, else the binary bundled with moviepy's imageio-ffmpeg, else None."""
+    path = shutil.which("ffmpeg")
+    if path:
+        return path
+    try:
+        import imageio_ffmpeg
+        return imageio_ffmpeg.get_ffmpeg_exe()
+    except (ImportError, RuntimeError):
+        return None
+
+def still_image_command(ffmpeg, image_path, audio_path, output_path, threads=None):
+    """ffmpeg arguments muxing audio under a still image encoded once at 1 fps."""
+    command = [
+        ffmpeg, "-y", "-hide_banner", "-loglevel", "error",
+        "-loop", "1", "-framerate", "1", "-i", image_path,
+        "-i", audio_path,
+        "-map", "0:v", "-map", "1:a",
+        # yuv420p needs even dimensions and is what players and YouTube expect
+        "-vf", "scale=trunc(iw/2)*2:trunc(ih/2)*2,format=yuv420p",
+        "-c:v", "libx264", "-tune", "stillimage", "-preset", "veryfast", "-r", "1",
+    ]
+    if audio_path.lower().endswith(COPY_AUDIO_EXTENSIONS):
+        command += ["-c:a", "copy"]
+    else:
+        command += ["-c:a", "aac", "-b:a", "192k"]
+    if threads:
+        command += ["-threads", str(threads)]
+    command += ["-shortest", "-movflags", "+faststart", "-f", "mp4", output_path]
+    return command
 
-def create_video(image_path, audio_path, output_path=None):
+def render_still(image_path, audio_path, output_path, threads=None, ffmpeg=None):
+    """
+    Render the video with one ffmpeg call.
+
+    The video is written to a temporary file and moved into place when ffmpeg
+    succeeds, so an interrupted render never leaves a truncated MP4 behind.
+    """
+    ffmpeg = ffmpeg or ffmpeg_executable()
+    tmp_path = f"{output_path}.tmp"
+    try:
+        subprocess.run(still_image_command(ffmpeg, image_path, audio_path, tmp_path, threads),
+                       check=True, capture_output=True, text=True)
+    except subprocess.CalledProcessError as e:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise RuntimeError(f"ffmpeg failed: {e.stderr.strip()}") from e
+    os.replace(tmp_path, output_path)
+
+def render_moviepy(image_path, audio_path, output_path):
+    """Render the video frame by frame with moviepy."""
+    from moviepy.editor import ImageClip, AudioFileClip
+
+    # Load the audio file
+    audio_clip = AudioFileClip(audio_path)
+
+    # Load the image file and set its duration to match the audio
+    image_clip = ImageClip(image_path).set_duration(audio_clip.duration)
+
+    # Set the audio of the image clip
+    video_clip = image_clip.set_audio(audio_clip)
+
+    # Write the result to a file
+    video_clip.write_videofile(output_path, fps=24, codec='libx264',
+                              audio_codec='aac',
+                              temp_audiofile=f"{output_path}.temp-audio.m4a",
+                              remove_temp=True)
+
+    # Close the clips to free up memory
+    video_clip.close()
+    audio_clip.close()
+    image_clip.close()
+
+def create_video(image_path, audio_path, output_path=None, fast=True, threads=None):
     """
     Create an MP4 video from an audio file and an image.
 
@@ -16,35 +109,25 @@ def create_video(image_path, audio_path, output_path=None):
         audio_path (str): Path to the MP3 audio file.
         output_path (str, optional): Path to save the output video. If None,
                                      will use the audio filename with .mp4 extension.
+        fast (bool): Use the ffmpeg still-image path when an ffmpeg binary is available.
+        threads (int, optional): ffmpeg encoder threads (all cores by default).
 
     Returns:
         str: Path to the created video file.
     """
     try:
-        # Load the audio file
-        audio_clip = AudioFileClip(audio_path)
-
-        # Load the image file and set its duration to match the audio
-        image_clip = ImageClip(image_path).set_duration(audio_clip.duration)
-
-        # Set the audio of the image clip
-        video_clip = image_clip.set_audio(audio_clip)
-
         # If no output path is specified, derive it from the audio filename
         if output_path is None:
             base_name = os.path.splitext(os.path.basename(audio_path))[0]
             output_path = f"{base_name}.mp4"
 
-        # Write the result to a file
-        video_clip.write_videofile(output_path, fps=24, codec='libx264',
-                                  audio_codec='aac',
-                                  temp_audiofile='temp-audio.m4a',
-                                  remove_temp=True)
-
-        # Close the clips to free up memory
-        video_clip.close()
-        audio_clip.close()
-        image_clip.close()
+        ffmpeg = ffmpeg_executable() if fast else None
+        if ffmpeg:
+            render_still(image_path, audio_path, output_path, threads, ffmpeg)
+        else:
+            if fast:
+                print("ffmpeg not found, rendering with moviepy")
+            render_moviepy(image_path, audio_path, output_path)
 
         return output_path
 
@@ -52,11 +135,47 @@ def create_video(image_path, audio_path, output_path=None):
         print(f"Error creating video: {str(e)}")
         return None
 
+def chapter_video_path(audio_path, output_dir="videos"):
+    """output_dir/<chapter name>.mp4 for a chapter audio file."""
+    chapter = os.path.splitext(os.path.basename(audio_path))[0]
+    return os.path.join(output_dir, f"{chapter}.mp4")
+
+def create_videos(image_path, audio_paths, output_dir="videos", workers=None, fast=True):
+    """
+    Render one video per audio file in parallel worker processes.
+
+    ffmpeg threads are split between the workers so they do not oversubscribe the cores.
+
+    Returns:
+        list: Paths of the created videos (None for failed ones), in audio_paths order
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    workers = max(1, min(workers or cpu_count(), len(audio_paths)))
+    threads = max(1, cpu_count() // workers)
+    print(f"Rendering {len(audio_paths)} videos with {workers} workers x {threads} threads")
+
+    results = [None] * len(audio_paths)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {
+            executor.submit(create_video, image_path, audio_path, chapter_video_path(audio_path, output_dir),
+                            fast, threads): i
+            for i, audio_path in enumerate(audio_paths)
+        }
+        for future in as_completed(futures):
+            i = futures[future]
+            results[i] = future.result()
+            print(f"{'Created' if results[i] else 'Failed'} video for {audio_paths[i]}")
+    return results
+
 def main():
-    parser = argparse.ArgumentParser(description='Create an MP4 video from an MP3 audio file and a PNG image.')
+    parser = argparse.ArgumentParser(description='Create MP4 videos from audio files and a PNG image.')
     parser.add_argument('image', help='Path to the PNG image file')
-    parser.add_argument('audio', help='Path to the MP3 audio file')
-    parser.add_argument('-o', '--output', help='Path to save the output video')
+    parser.add_argument('audio', nargs='+', help='Audio file(s), or a directory of chapter audio files')
+    parser.add_argument('-o', '--output', help='Path to save the output video (single audio file only)')
+    parser.add_argument('--output-dir', default='videos', help='Directory for the videos of several audio files')
+    parser.add_argument('--format', default='mp3', help='Audio format to pick up from an audio directory')
+    parser.add_argument('--workers', type=int, help='Parallel renders (default: one per core, at most one per file)')
+    parser.add_argument('--moviepy', action='store_true', help='Render frame by frame with moviepy')
 
     args = parser.parse_args()
 
@@ -65,12 +184,27 @@ def main():
         print(f"Error: Image file not found: {args.image}")
         return
 
-    if not os.path.exists(args.audio):
-        print(f"Error: Audio file not found: {args.audio}")
+    audio_paths = []
+    for path in args.audio:
+        if os.path.isdir(path):
+            from stitch_audio_kokoro import list_chapter_audio
+            audio_paths.extend(list_chapter_audio(path, args.format))
+        elif os.path.exists(path):
+            audio_paths.append(path)
+        else:
+            print(f"Error: Audio file not found: {path}")
+            return
+    if not audio_paths:
+        print("Error: No audio files to render")
+        return
+
+    if len(audio_paths) > 1:
+        results = create_videos(args.image, audio_paths, args.output_dir, args.workers, fast=not args.moviepy)
+        print(f"Created {sum(r is not None for r in results)}/{len(results)} videos in {args.output_dir}")
         return
 
     # Create the video
-    output_file = create_video(args.image, args.audio, args.output)
+    output_file = create_video(args.image, audio_paths[0], args.output, fast=not args.moviepy)
 
     if output_file:
         print(f"Video created successfully: {output_file}")
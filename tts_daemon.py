@@ -0,0 +1,353 @@
+"""
+Long-running synthesis daemon with a local job queue.
+
+Every script cold-starts Python, torch and the model weights, so a one-line
+render costs as much startup as a chapter. The daemon keeps engines warm in
+the tts_engines model pool and takes jobs over a Unix socket, speaking one
+JSON object per line:
+
+    {"op": "submit", "text": "...", "engine": "kokoro", "priority": 0, "wait": true}
+    {"op": "submit", "text_path": "parsed_text/01_Introduction.txt", "output": "output_audio/01.mp3"}
+    {"op": "status", "id": "..."}     {"op": "cancel", "id": "..."}     {"op": "list"}
+
+Jobs run in priority order (lower first, then submission order). Short texts
+default to priority 0 and chapters to 10. Between two segments a running job
+hands the warm model to any queued job of strictly higher priority, so a
+paragraph submitted while a book renders waits for the current segment only,
+not for the rest of the chapter. Running jobs report per-segment progress and
+can be cancelled between segments. A JSONL job file (one job per line, like
+requests.jsonl) can be loaded at startup or submitted later; it is validated
+as a whole before any of its jobs is queued.
+
+Usage:
+    python tts_daemon.py serve --preload kokoro --jobs jobs.jsonl
+    python tts_daemon.py submit --text "Hello there." --wait
+    python tts_daemon.py submit-file jobs.jsonl
+    python tts_daemon.py status <id> | cancel <id> | list
+"""
+
+import os
+import json
+import time
+import heapq
+import uuid
+import socket
+import argparse
+import itertools
+import threading
+import socketserver
+
+from tts_engines import get_engine, ENGINES
+
+DEFAULT_SOCKET = ".tts_daemon.sock"
+DEFAULT_OUTPUT_DIR = os.path.join("output_audio", "jobs")
+# Texts up to this length are treated as interactive requests
+SHORT_TEXT_CHARS = 500
+SHORT_PRIORITY = 0
+DEFAULT_PRIORITY = 10
+
+class JobCancelled(Exception):
+    pass
+
+class Job:
+    """One synthesis request and its progress."""
+
+    def __init__(self, spec, output_dir=DEFAULT_OUTPUT_DIR):
+        self.id = str(spec.get("id") or spec.get("request_id") or uuid.uuid4().hex[:12])
+        # requests.jsonl style lines carry their text in "body"
+        self.text = spec.get("text", spec.get("body"))
+        self.text_path = spec.get("text_path")
+        if not self.text and not self.text_path:
+            raise ValueError("A job needs 'text' or 'text_path'")
+
+        self.engine = spec.get("engine", "kokoro")
+        if self.engine not in ENGINES:
+            raise ValueError(f"Unknown TTS engine '{self.engine}', expected one of {sorted(ENGINES)}")
+        self.options = spec.get("options", {"lang_code": spec.get("lang_code", "b")} if self.engine == "kokoro" else {})
+        self.device = spec.get("device", "auto")
+        self.voice = spec.get("voice")
+        self.speed = spec.get("speed", 1)
+        self.output = spec.get("output") or os.path.join(output_dir, f"{self.id}.{spec.get('format', 'mp3')}")
+
+        short = self.text is not None and len(self.text) <= SHORT_TEXT_CHARS
+        priority = spec.get("priority", SHORT_PRIORITY if short else DEFAULT_PRIORITY)
+        # Checked here, before the queue registers the job: heapq would only fail after that
+        try:
+            self.priority = int(priority)
+        except (TypeError, ValueError):
+            raise ValueError(f"Job priority must be an integer, got {priority!r}") from None
+        self.status = "queued"
+        self.done = 0
+        self.total = None
+        self.error = None
+        self.submitted = time.time()
+        self.started = self.finished = None
+        self.cancel_requested = False
+        self.finished_event = threading.Event()
+
+    def to_dict(self):
+        return {
+            "id": self.id, "status": self.status, "engine": self.engine, "priority": self.priority,
+            "output": self.output, "done": self.done, "total": self.total, "error": self.error,
+            "queued_seconds": round((self.started or time.time()) - self.submitted, 3),
+            "run_seconds": round((self.finished or time.time()) - self.started, 3) if self.started else None,
+        }
+
+class JobQueue:
+    """Priority queue of jobs plus the table of every job seen, for status and cancellation."""
+
+    def __init__(self):
+        self.heap = []
+        self.jobs = {}
+        self.condition = threading.Condition()
+        self.counter = itertools.count()
+
+    def submit(self, job):
+        return self.submit_all([job])[0]
+
+    def submit_all(self, jobs):
+        """Queue several jobs at once; if any of them conflicts with a known job, none is queued."""
+        with self.condition:
+            ids = set()
+            for job in jobs:
+                known = self.jobs.get(job.id)
+                if job.id in ids or (known is not None and known.status in ("queued", "running")):
+                    raise ValueError(f"Job {job.id} is already {known.status if known else 'in this batch'}")
+                ids.add(job.id)
+            for job in jobs:
+                self.jobs[job.id] = job
+                heapq.heappush(self.heap, (job.priority, next(self.counter), job.id))
+            self.condition.notify_all()
+        return jobs
+
+    def next(self, before=None, block=True):
+        """
+        Take the next queued job and mark it running.
+
+        Args:
+            before (int): Only take a job whose priority is strictly lower than this
+            block (bool): Wait for a job instead of returning None
+        """
+        with self.condition:
+            while True:
+                # Jobs cancelled while queued stay in the heap until they reach the top
+                while self.heap and self.jobs[self.heap[0][2]].status != "queued":
+                    heapq.heappop(self.heap)
+                if self.heap and (before is None or self.heap[0][0] < before):
+                    job = self.jobs[heapq.heappop(self.heap)[2]]
+                    job.status = "running"
+                    job.started = time.time()
+                    return job
+                if not block:
+                    return None
+                self.condition.wait()
+
+    def get(self, job_id):
+        with self.condition:
+            return self.jobs.get(job_id)
+
+    def cancel(self, job_id):
+        with self.condition:
+            job = self.jobs.get(job_id)
+            if job is None:
+                return None
+            if job.status == "queued":
+                job.status = "cancelled"
+                job.finished = time.time()
+                job.finished_event.set()
+            elif job.status == "running":
+                # Picked up by the worker between two segments
+                job.cancel_requested = True
+            return job
+
+    def all(self):
+        with self.condition:
+            return list(self.jobs.values())
+
+def run_job(job, jobs):
+    """
+    Synthesize one job with a pooled engine, updating its progress as segments finish.
+
+    Between two segments, queued jobs of higher priority run to completion first
+    on this same thread, so the models are never used concurrently.
+    """
+    engine = get_engine(job.engine, job.device, **job.options)
+
+    def progress(done, total):
+        job.done, job.total = done, total
+        if job.cancel_requested:
+            raise JobCancelled()
+        while True:
+            urgent = jobs.next(before=job.priority, block=False)
+            if urgent is None:
+                break
+            print(f"Job {job.id} paused for job {urgent.id}")
+            execute(urgent, jobs)
+
+    if job.text_path:
+        engine.synthesize_chapter(job.text_path, job.output, voice=job.voice, speed=job.speed, progress=progress)
+    else:
+        engine.synthesize_text(job.text, job.output, voice=job.voice, speed=job.speed, progress=progress)
+
+def execute(job, jobs):
+    """Run a job taken from the queue and record how it ended."""
+    print(f"Running job {job.id} ({job.engine}, priority {job.priority})")
+    try:
+        run_job(job, jobs)
+        job.status = "done"
+    except JobCancelled:
+        job.status = "cancelled"
+    except Exception as e:
+        job.status = "failed"
+        job.error = f"{type(e).__name__}: {e}"
+        print(f"Job {job.id} failed: {job.error}")
+    job.finished = time.time()
+    job.finished_event.set()
+    print(f"Job {job.id} {job.status} in {job.finished - job.started:.2f}s")
+
+def worker(jobs):
+    """Run jobs one at a time; models are not thread safe and share one device."""
+    while True:
+        execute(jobs.next(), jobs)
+
+def load_job_file(path, jobs, output_dir=DEFAULT_OUTPUT_DIR):
+    """
+    Submit every job of a JSONL file; returns the submitted jobs.
+
+    Every line is parsed and validated first, so a malformed line queues nothing.
+    """
+    parsed = []
+    with open(path, "r") as f:
+        for number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                parsed.append(Job(json.loads(line), output_dir))
+            except ValueError as e:
+                raise ValueError(f"{path}:{number}: {e}") from e
+    submitted = jobs.submit_all(parsed)
+    print(f"Queued {len(submitted)} jobs from {path}")
+    return submitted
+
+class DaemonHandler(socketserver.StreamRequestHandler):
+    """Handles JSON-lines requests on one client connection."""
+
+    def handle(self):
+        for line in self.rfile:
+            if not line.strip():
+                continue
+            try:
+                response = self.server.dispatch(json.loads(line))
+            except Exception as e:
+                response = {"error": f"{type(e).__name__}: {e}"}
+            self.wfile.write((json.dumps(response) + "\n").encode())
+            self.wfile.flush()
+
+class TTSDaemon(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, socket_path, jobs, output_dir=DEFAULT_OUTPUT_DIR):
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+        super().__init__(socket_path, DaemonHandler)
+        self.jobs = jobs
+        self.output_dir = output_dir
+
+    def dispatch(self, request):
+        op = request.get("op")
+        if op == "submit":
+            job = self.jobs.submit(Job(request, self.output_dir))
+            if request.get("wait"):
+                job.finished_event.wait()
+            return job.to_dict()
+        if op == "submit_file":
+            return {"jobs": [job.id for job in load_job_file(request["path"], self.jobs, self.output_dir)]}
+        if op == "list":
+            return {"jobs": [job.to_dict() for job in self.jobs.all()]}
+        if op in ("status", "cancel", "wait"):
+            job = self.jobs.cancel(request["id"]) if op == "cancel" else self.jobs.get(request["id"])
+            if job is None:
+                return {"error": f"Unknown job {request['id']}"}
+            if op == "wait":
+                job.finished_event.wait()
+            return job.to_dict()
+        return {"error": f"Unknown op {op}"}
+
+def serve(args):
+    jobs = JobQueue()
+    for name in args.preload or []:
+        options = {"lang_code": args.lang_code} if name == "kokoro" else {}
+        get_engine(name, args.device, **options)
+    if args.jobs:
+        load_job_file(args.jobs, jobs, args.output_dir)
+
+    threading.Thread(target=worker, args=(jobs,), daemon=True).start()
+    server = TTSDaemon(args.socket, jobs, args.output_dir)
+    print(f"TTS daemon listening on {args.socket}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\nDaemon stopped.")
+    finally:
+        server.server_close()
+        os.remove(args.socket)
+
+def request(socket_path, message):
+    """Send one request to a running daemon and return its response."""
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+        client.connect(socket_path)
+        client.sendall((json.dumps(message) + "\n").encode())
+        with client.makefile("r") as reader:
+            return json.loads(reader.readline())
+
+def main():
+    parser = argparse.ArgumentParser(description="Warm-model TTS daemon with a priority job queue.")
+    parser.add_argument("--socket", default=DEFAULT_SOCKET, help="Unix socket path")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    serve_parser = subparsers.add_parser("serve", help="Run the daemon")
+    serve_parser.add_argument("--preload", nargs="*", choices=sorted(ENGINES), help="Engines to load at startup")
+    serve_parser.add_argument("--jobs", help="JSONL job file to queue at startup")
+    serve_parser.add_argument("--output-dir", default=DEFAULT_OUTPUT_DIR, help="Default directory for job outputs")
+    serve_parser.add_argument("--device", default="auto", help="Torch device for preloaded engines")
+    serve_parser.add_argument("--lang-code", default="b", help="Kokoro language code for preloading")
+
+    submit_parser = subparsers.add_parser("submit", help="Queue a job")
+    submit_parser.add_argument("--text", help="Text to synthesize")
+    submit_parser.add_argument("--text-path", help="Parsed chapter to synthesize")
+    submit_parser.add_argument("--engine", default="kokoro", help="TTS engine")
+    submit_parser.add_argument("--voice", help="Voice (Kokoro voice or Dia voice profile)")
+    submit_parser.add_argument("--output", help="Output audio file")
+    submit_parser.add_argument("--priority", type=int, help="Lower runs first")
+    submit_parser.add_argument("--wait", action="store_true", help="Return when the job has finished")
+
+    file_parser = subparsers.add_parser("submit-file", help="Queue every job of a JSONL file")
+    file_parser.add_argument("path", help="JSONL job file")
+    for command in ("status", "cancel", "wait"):
+        subparsers.add_parser(command, help=f"{command.capitalize()} a job").add_argument("id", help="Job id")
+    subparsers.add_parser("list", help="List all jobs")
+    args = parser.parse_args()
+
+    if args.command == "serve":
+        serve(args)
+        return
+
+    if args.command == "submit":
+        message = {"op": "submit", "engine": args.engine, "wait": args.wait}
+        for key in ("text", "text_path", "voice", "output", "priority"):
+            if getattr(args, key) is not None:
+                message[key] = getattr(args, key)
+        # The daemon may run in another directory
+        for key in ("text_path", "output"):
+            if key in message:
+                message[key] = os.path.abspath(message[key])
+    elif args.command == "submit-file":
+        message = {"op": "submit_file", "path": os.path.abspath(args.path)}
+    elif args.command == "list":
+        message = {"op": "list"}
+    else:
+        message = {"op": args.command, "id": args.id}
+    print(json.dumps(request(args.socket, message), indent=2))
+
+if __name__ == "__main__":
+    main()
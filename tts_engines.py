@@ -0,0 +1,249 @@
+"""
+Common interface over the TTS backends.
+
+Kokoro (generate_kokoro.py), Dia (generate_dia.py) and MiniCPM-o (minicpm.py)
+each expose the same TTSEngine methods here. Backends are registered by name
+and import their heavy dependencies (torch, kokoro, dia, transformers) only
+when a model is loaded, so CLI startup stays fast. Loaded engines live in a
+process-wide ModelPool keyed by engine, device and options: switching between
+engines, or asking for the same one from another stage or request, reuses the
+weights that are already in memory.
+
+Usage:
+    python tts_engines.py --list
+    python tts_engines.py parsed_text/01_Introduction.txt --engine dia --output output_audio/01_Introduction.mp3
+"""
+
+import os
+import argparse
+import threading
+import numpy as np
+
+from device_utils import select_device
+from segmenter import segment_text
+from audio_writer import StreamingAudioWriter
+from timing_index import TimingIndex, index_path
+from quantize import PRECISIONS, check_precision
+
+ENGINES = {}
+
+def register_engine(name):
+    """Class decorator adding a TTSEngine subclass to the registry."""
+    def register(cls):
+        cls.name = name
+        ENGINES[name] = cls
+        return cls
+    return register
+
+class TTSEngine:
+    """
+    One loaded TTS model.
+
+    Args:
+        device (str): Torch device, already resolved by select_device
+        **options: Engine specific options (e.g. lang_code for Kokoro)
+    """
+
+    name = None
+    sample_rate = 24000
+    # Characters per synthesis call for the default chapter implementation
+    chunk_chars = 400
+
+    def __init__(self, device, **options):
+        self.device = device
+        self.options = options
+
+    def load(self):
+        raise NotImplementedError
+
+    def synthesize(self, text, voice=None, speed=1):
+        """Audio for a piece of text as a float32 array at self.sample_rate."""
+        raise NotImplementedError
+
+    def segments(self, text):
+        """Segment(text, start, end) pieces synthesized one call each."""
+        return segment_text(text, target=self.chunk_chars, length_fn=len)
+
+    def synthesize_chapter(self, text_path, output_path, voice=None, speed=1, progress=None):
+        """
+        Render a parsed chapter into one audio file with a timing index.
+
+        Args:
+            progress (callable): Called with (segments done, total segments); may raise to stop early
+
+        Returns:
+            int: Number of synthesis calls
+        """
+        with open(text_path, "r") as f:
+            text = f.read()
+        return self.synthesize_text(text, output_path, voice, speed, progress, text_path)
+
+    def synthesize_text(self, text, output_path, voice=None, speed=1, progress=None, text_path=None):
+        """synthesize_chapter for text that is not (yet) in a file."""
+        segments = self.segments(text)
+        index = TimingIndex(self.sample_rate, text_path)
+        with StreamingAudioWriter(output_path, sample_rate=self.sample_rate) as writer:
+            for i, segment in enumerate(segments):
+                audio = self.synthesize(segment.text, voice=voice, speed=speed)
+                index.add(segment.start, segment.end, writer.frames, writer.frames + len(audio))
+                writer.write(audio)
+                if progress is not None:
+                    progress(i + 1, len(segments))
+        index.save(index_path(output_path))
+        return len(segments)
+
+@register_engine("kokoro")
+class KokoroEngine(TTSEngine):
+    sample_rate = 24000
+
+    def load(self):
+        import generate_kokoro
+        from audio_cache import SegmentAudioCache
+
+        self.pipeline = generate_kokoro.load_pipeline(self.options.get("lang_code", "b"), self.device,
+                                                      self.options.get("precision", "fp32"))
+        self.phonemizer = generate_kokoro.load_phonemizer(self.pipeline.lang_code, self.pipeline)
+        self.cache = SegmentAudioCache()
+
+    def synthesize(self, text, voice=None, speed=1):
+        from generate_kokoro import synthesize_segment
+        audio, _ = synthesize_segment(self.pipeline, text, voice=voice or "af_heart", speed=speed, cache=self.cache,
+                                      phonemizer=self.phonemizer)
+        return audio
+
+    def segments(self, text):
+        from generate_kokoro import split_segments
+        return split_segments(text, phonemizer=self.phonemizer)
+
+@register_engine("dia")
+class DiaEngine(TTSEngine):
+    """voice names a stored voice profile (see voice_profiles.py)."""
+
+    sample_rate = 44100
+
+    def load(self):
+        from generate_dia import load_model
+        from voice_profiles import VoiceProfileStore
+
+        self.model = load_model(self.device, self.options.get("precision", "fp32"))
+        self.profiles = VoiceProfileStore()
+
+    def voice_profile(self, voice):
+        if voice is None:
+            return None
+        profile = self.profiles.load(voice, self.device)
+        if profile is None:
+            raise ValueError(f"No Dia voice profile named '{voice}'")
+        return profile
+
+    def synthesize(self, text, voice=None, speed=1):
+        from generate_dia import generate_chunk
+        prompt_audio, prompt_text = self.voice_profile(voice) or (None, None)
+        return generate_chunk(self.model, text, prompt_text, prompt_audio)
+
+    def synthesize_text(self, text, output_path, voice=None, speed=1, progress=None, text_path=None):
+        # Every chunk is conditioned on the same voice prompt, see generate_dia.generate_text
+        from generate_dia import generate_text
+        return generate_text(self.model, text, output_path, voice_profile=self.voice_profile(voice),
+                             text_path=text_path, progress=progress)
+
+@register_engine("minicpm")
+class MiniCPMEngine(TTSEngine):
+    sample_rate = 24000
+    chunk_chars = 300
+
+    def load(self):
+        from minicpm import load_minicpm
+        self.model, self.tokenizer = load_minicpm(self.device, init_tts=True)
+
+    def synthesize(self, text, voice=None, speed=1):
+        import tempfile
+        import soundfile as sf
+
+        msgs = [{"role": "user", "content": [f"Read the following text aloud, word for word: {text}"]}]
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, "speech.wav")
+            self.model.chat(msgs=msgs, tokenizer=self.tokenizer, sampling=True, use_tts_template=True,
+                            generate_audio=True, temperature=0.3, output_audio_path=path)
+            audio, sample_rate = sf.read(path, dtype="float32")
+        if sample_rate != self.sample_rate:
+            raise ValueError(f"MiniCPM-o produced {sample_rate} Hz audio, expected {self.sample_rate}")
+        return np.asarray(audio).reshape(-1)
+
+class ModelPool:
+    """
+    Process-wide cache of loaded engines.
+
+    Each (engine, device, options) combination is loaded once, even when
+    several threads ask for it at the same time.
+    """
+
+    def __init__(self):
+        self.engines = {}
+        self.lock = threading.Lock()
+        self.loading = {}
+
+    def get(self, name, device="auto", **options):
+        if name not in ENGINES:
+            raise ValueError(f"Unknown TTS engine '{name}', expected one of {sorted(ENGINES)}")
+
+        device = select_device(device)
+        if "precision" in options:
+            device = check_precision(options["precision"], device)
+        key = (name, device, tuple(sorted(options.items())))
+        with self.lock:
+            if key in self.engines:
+                return self.engines[key]
+            # Serialize loading per model without blocking lookups of other models
+            load_lock = self.loading.setdefault(key, threading.Lock())
+
+        with load_lock:
+            with self.lock:
+                if key in self.engines:
+                    return self.engines[key]
+            engine = ENGINES[name](device, **options)
+            engine.load()
+            with self.lock:
+                self.engines[key] = engine
+            return engine
+
+    def unload(self, name=None):
+        """Drop loaded engines (all of them, or those of one backend) so their memory can be freed."""
+        with self.lock:
+            for key in [key for key in self.engines if name is None or key[0] == name]:
+                del self.engines[key]
+
+_pool = ModelPool()
+
+def get_engine(name, device="auto", **options):
+    """Loaded engine from the process-wide pool."""
+    return _pool.get(name, device, **options)
+
+def main():
+    parser = argparse.ArgumentParser(description="Synthesize a parsed chapter with any registered TTS engine.")
+    parser.add_argument("text", nargs="?", help="Parsed chapter text")
+    parser.add_argument("--engine", default="kokoro", choices=sorted(ENGINES), help="TTS backend")
+    parser.add_argument("--output", help="Output audio file (default: output_audio/<chapter>.mp3)")
+    parser.add_argument("--voice", help="Voice (Kokoro voice name or Dia voice profile)")
+    parser.add_argument("--speed", type=float, default=1, help="Speech speed (Kokoro)")
+    parser.add_argument("--lang-code", default="b", help="Kokoro language code")
+    parser.add_argument("--device", default="auto", help="Torch device: auto, cpu, cuda or mps")
+    parser.add_argument("--precision", choices=PRECISIONS, help="Kokoro and Dia inference precision (default fp32)")
+    parser.add_argument("--list", action="store_true", help="List the registered engines")
+    args = parser.parse_args()
+
+    if args.list or not args.text:
+        print("\n".join(f"{name}: {ENGINES[name].sample_rate} Hz" for name in sorted(ENGINES)))
+        return
+
+    options = {"lang_code": args.lang_code} if args.engine == "kokoro" else {}
+    if args.precision:
+        options["precision"] = args.precision
+    engine = get_engine(args.engine, args.device, **options)
+    chapter = os.path.splitext(os.path.basename(args.text))[0]
+    output = args.output or os.path.join("output_audio", f"{chapter}.mp3")
+    count = engine.synthesize_chapter(args.text, output, voice=args.voice, speed=args.speed)
+    print(f"Synthesized {args.text} with {args.engine} in {count} parts into {output}")
+
+if __name__ == "__main__":
+    main()
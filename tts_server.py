@@ -0,0 +1,204 @@
+"""
+Low-latency streaming TTS over HTTP.
+
+AudioStreamingOptions.start_local_server can only serve a finished
+combined_output.mp3. This server synthesizes on request and sends encoded
+audio with chunked transfer as soon as the first segment is ready: the first
+segment is a single short sentence, later ones are packed up to the usual
+phoneme budget, so playback starts after roughly one sentence of synthesis.
+
+    GET  /tts?chapter=<parsed_text name, e.g. 1%20Introduction>&format=mp3
+    GET  /tts?text=<url-encoded text>&format=wav
+    POST /tts?format=opus        (request body is the text)
+
+Usage:
+    python tts_server.py --port 8080
+    curl -N "http://localhost:8080/tts?chapter=1%20Introduction" | mpv -
+"""
+
+import os
+import argparse
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+from segmenter import iter_segments, estimate_length, DEFAULT_TARGET
+from audio_writer import encode_stream
+from generate_kokoro import synthesize_segment, SAMPLE_RATE
+from tts_engines import get_engine
+
+# Phoneme budget of the first segment; short enough to synthesize in well under a second
+FIRST_SEGMENT_TARGET = 80
+
+CONTENT_TYPES = {
+    "wav": "audio/wav",
+    "mp3": "audio/mpeg",
+    "ogg": "audio/ogg",
+    "opus": "audio/ogg",
+}
+
+# Voices shipped with Kokoro-82M; the first letter is the language code they need
+KOKORO_VOICES = (
+    "af_alloy", "af_aoede", "af_bella", "af_heart", "af_jessica", "af_kore", "af_nicole", "af_nova", "af_river",
+    "af_sarah", "af_sky", "am_adam", "am_echo", "am_eric", "am_fenrir", "am_liam", "am_michael", "am_onyx",
+    "am_puck", "am_santa", "bf_alice", "bf_emma", "bf_isabella", "bf_lily", "bm_daniel", "bm_fable", "bm_george",
+    "bm_lewis", "jf_alpha", "jf_gongitsune", "jf_nezumi", "jf_tebukuro", "jm_kumo", "zf_xiaobei", "zf_xiaoni",
+    "zf_xiaoxiao", "zf_xiaoyi", "zm_yunjian", "zm_yunxi", "zm_yunxia", "zm_yunyang", "ef_dora", "em_alex",
+    "em_santa", "ff_siwis", "hf_alpha", "hf_beta", "hm_omega", "hm_psi", "if_sara", "im_nicola", "pf_dora",
+    "pm_alex", "pm_santa",
+)
+
+def low_latency_segments(text, target=DEFAULT_TARGET, first_target=FIRST_SEGMENT_TARGET, length_fn=None):
+    """
+    Segments of text where the first one is kept short to start playback early.
+
+    A generator: sentences are only measured (phonemized, with a real
+    length_fn) as the segments holding them are requested, so the first
+    segment is ready without looking at the rest of the chapter.
+    """
+    for segment in iter_segments(text, target, length_fn or estimate_length, first_target):
+        yield segment.text
+
+class TTSService:
+    """
+    One warm Kokoro pipeline shared by all requests.
+
+    The model is not thread safe, so synthesis is serialized per segment;
+    concurrent listeners take turns segment by segment instead of waiting
+    for each other's whole chapters.
+    """
+
+    def __init__(self, pipeline, text_dir="parsed_text", voice="af_heart", speed=1, cache=None, phonemizer=None):
+        if voice not in KOKORO_VOICES:
+            raise ValueError(f"Unknown Kokoro voice '{voice}'")
+        self.pipeline = pipeline
+        self.text_dir = text_dir
+        self.voice = voice
+        self.speed = speed
+        self.cache = cache
+        self.phonemizer = phonemizer
+        self.lock = threading.Lock()
+
+    def chapter_text(self, chapter):
+        """Text of a parsed chapter, or None if it does not exist."""
+        name = os.path.basename(chapter)
+        if not name.endswith(".txt"):
+            name += ".txt"
+        path = os.path.join(self.text_dir, name)
+        if not os.path.exists(path):
+            return None
+        with open(path, "r") as f:
+            return f.read().strip()
+
+    def voices(self):
+        """Voices a request may ask for: the default one and the Kokoro voices of the pipeline's language."""
+        lang_code = getattr(self.pipeline, "lang_code", self.voice[0])
+        return [voice for voice in KOKORO_VOICES if voice[0] == lang_code or voice == self.voice]
+
+    def length(self, text):
+        # The G2P is shared with synthesis, so measuring takes the lock too
+        with self.lock:
+            return self.phonemizer.length(text)
+
+    def synthesize(self, text, voice=None):
+        """Yield audio arrays segment by segment."""
+        length_fn = self.length if self.phonemizer is not None else None
+        for segment in low_latency_segments(text, length_fn=length_fn):
+            with self.lock:
+                audio, _ = synthesize_segment(self.pipeline, segment, voice=voice or self.voice, speed=self.speed,
+                                              cache=self.cache, phonemizer=self.phonemizer)
+            yield audio
+
+class TTSHandler(BaseHTTPRequestHandler):
+    # Chunked transfer encoding needs HTTP/1.1
+    protocol_version = "HTTP/1.1"
+    service = None
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path != "/tts":
+            self.send_error(404)
+            return
+
+        query = parse_qs(url.query)
+        if "chapter" in query:
+            text = self.service.chapter_text(query["chapter"][0])
+            if text is None:
+                self.send_error(404, f"Unknown chapter {query['chapter'][0]}")
+                return
+        elif "text" in query:
+            text = query["text"][0]
+        else:
+            self.send_error(400, "Pass chapter=<name> or text=<text>")
+            return
+        self.stream(text, query)
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        if url.path != "/tts":
+            self.send_error(404)
+            return
+
+        length = int(self.headers.get("Content-Length", 0))
+        text = self.rfile.read(length).decode("utf-8")
+        self.stream(text, parse_qs(url.query))
+
+    def stream(self, text, query):
+        format = query.get("format", ["mp3"])[0]
+        if format not in CONTENT_TYPES:
+            self.send_error(400, f"Unsupported format {format}")
+            return
+        if not text.strip():
+            self.send_error(400, "No text to synthesize")
+            return
+        # Only known voice names: KPipeline would also load .pt paths and arbitrary Hugging Face files
+        voice = query.get("voice", [None])[0]
+        if voice is not None and voice not in self.service.voices():
+            self.send_error(400, f"Unknown voice {voice}")
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPES[format])
+        self.send_header("Transfer-Encoding", "chunked")
+        self.send_header("Cache-Control", "no-store")
+        self.end_headers()
+
+        audio = self.service.synthesize(text, voice=voice)
+        try:
+            for data in encode_stream(audio, format, SAMPLE_RATE):
+                self.wfile.write(f"{len(data):X}\r\n".encode() + data + b"\r\n")
+                self.wfile.flush()
+            self.wfile.write(b"0\r\n\r\n")
+        except (BrokenPipeError, ConnectionResetError):
+            # Listener went away; stop synthesizing the rest of the text
+            print(f"Client {self.client_address[0]} disconnected")
+            self.close_connection = True
+
+def main():
+    parser = argparse.ArgumentParser(description="Stream Kokoro speech over HTTP while it is synthesized.")
+    parser.add_argument("--host", default="0.0.0.0", help="Interface to listen on")
+    parser.add_argument("--port", type=int, default=8080, help="Port to listen on")
+    parser.add_argument("--text-dir", default="parsed_text", help="Directory of parsed chapter texts")
+    parser.add_argument("--voice", default="af_heart", choices=KOKORO_VOICES, metavar="VOICE",
+                        help="Default Kokoro voice")
+    parser.add_argument("--lang-code", default="b", help="Kokoro language code (must match the voice)")
+    parser.add_argument("--speed", type=float, default=1, help="Speech speed")
+    parser.add_argument("--device", default="auto", help="Torch device: auto, cpu, cuda or mps")
+    parser.add_argument("--no-audio-cache", action="store_true", help="Resynthesize every segment")
+    args = parser.parse_args()
+
+    engine = get_engine("kokoro", args.device, lang_code=args.lang_code)
+    TTSHandler.service = TTSService(
+        engine.pipeline, args.text_dir, voice=args.voice, speed=args.speed,
+        cache=None if args.no_audio_cache else engine.cache, phonemizer=engine.phonemizer,
+    )
+
+    server = ThreadingHTTPServer((args.host, args.port), TTSHandler)
+    print(f"Streaming TTS on http://{args.host}:{args.port}/tts")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\nServer stopped.")
+
+if __name__ == "__main__":
+    main()
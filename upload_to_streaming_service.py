@@ -1,9 +1,7 @@
 import os
 import webbrowser
-import shutil
 import json
 from pathlib import Path
-import subprocess
 
 class AudioStreamingOptions:
     def __init__(self):
@@ -117,61 +115,21 @@ class AudioStreamingOptions:
         if open_site.lower() == 'y':
             webbrowser.open("https://anchor.fm/dashboard/episode/new")
 
-    def start_local_server(self):
-        """Start a simple HTTP server to stream audio files."""
-        # Create a directory for serving files
-        server_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "audio_server")
-        os.makedirs(server_dir, exist_ok=True)
+    def start_local_server(self, port=8000):
+        """Serve the audio library (output_audio/) in place, with seeking, for phones on the same network."""
+        from audio_server import run_server
 
-        # Copy the MP3 file to the server directory
         if os.path.exists(self.mp3_path):
-            shutil.copy2(self.mp3_path, os.path.join(server_dir, "audio.mp3"))
-
-            # Create a simple HTML player
-            html_content = """<!DOCTYPE html>
-<html>
-<head>
-    <title>Audio Player</title>
-    <meta name="viewport" content="width=device-width, initial-scale=1">
-    <style>
-        body { font-family: Arial, sans-serif; text-align: center; padding: 20px; }
-        .player { max-width: 500px; margin: 0 auto; }
-        audio { width: 100%; margin-top: 20px; }
-    </style>
-</head>
-<body>
-    <div class="player">
-        <h1>Your Audio</h1>
-        <audio controls autoplay>
-            <source src="audio.mp3" type="audio/mpeg">
-            Your browser does not support the audio element.
-        </audio>
-    </div>
-</body>
-</html>"""
-
-            with open(os.path.join(server_dir, "index.html"), "w") as f:
-                f.write(html_content)
-
             # Start server
             print("\nStarting HTTP server...")
             print("To access your audio:")
             print("1. Connect your phone to the same WiFi network as this computer")
             print("2. Find this computer's IP address on the network")
-            print("3. On your phone, go to: http://<computer-ip>:8000")
+            print(f"3. On your phone, go to: http://<computer-ip>:{port}")
+            print(f"   or play http://<computer-ip>:{port}/{os.path.basename(self.mp3_path)} directly")
             print("\nPress Ctrl+C to stop the server when finished.")
 
-            # Change to server directory and start server
-            original_dir = os.getcwd()
-            os.chdir(server_dir)
-
-            try:
-                # Use Python's built-in HTTP server
-                subprocess.run(["python", "-m", "http.server", "8000"])
-            except KeyboardInterrupt:
-                print("\nServer stopped.")
-            finally:
-                os.chdir(original_dir)
+            run_server(os.path.dirname(self.mp3_path), port=port)
         else:
             print(f"Error: MP3 file not found at {self.mp3_path}")
 
@@ -0,0 +1,106 @@
+"""
+Reusable Dia voice-clone prompts.
+
+Cloning a voice with Dia means passing a reference clip as audio_prompt and
+its transcript in front of the text. Passing the clip as a file path makes the
+model decode and re-encode it with its audio codec on every generate call.
+A voice profile stores the encoded audio tokens (model.load_audio) and the
+transcript once under .voice_profiles/<name>.pt, so later runs pass the token
+tensor directly. Profiles are rebuilt when the clip or transcript changes.
+
+Usage:
+    python voice_profiles.py create narrator sample.mp3 sample.txt
+    python voice_profiles.py list
+"""
+
+import os
+import argparse
+import hashlib
+
+DEFAULT_PROFILE_DIR = ".voice_profiles"
+DIA_MODEL_ID = "nari-labs/Dia-1.6B"
+
+def source_hash(audio_path, transcript):
+    digest = hashlib.sha256()
+    with open(audio_path, "rb") as f:
+        digest.update(f.read())
+    digest.update(transcript.encode())
+    digest.update(DIA_MODEL_ID.encode())
+    return digest.hexdigest()
+
+class VoiceProfileStore:
+    """
+    Directory of encoded voice prompts.
+
+    Args:
+        profile_dir (str): Where profiles are stored
+    """
+
+    def __init__(self, profile_dir=DEFAULT_PROFILE_DIR):
+        self.profile_dir = profile_dir
+        os.makedirs(profile_dir, exist_ok=True)
+
+    def _path(self, name):
+        return os.path.join(self.profile_dir, f"{name}.pt")
+
+    def names(self):
+        return sorted(os.path.splitext(f)[0] for f in os.listdir(self.profile_dir) if f.endswith(".pt"))
+
+    def load(self, name, device="cpu"):
+        """
+        Returns:
+            tuple: (audio token tensor, transcript), or None if there is no such profile
+        """
+        import torch
+        path = self._path(name)
+        if not os.path.exists(path):
+            return None
+        profile = torch.load(path, map_location=device)
+        return profile["codes"], profile["transcript"]
+
+    def create(self, model, name, audio_path, transcript):
+        """Encode a reference clip with the model's audio codec and save it with its transcript."""
+        import torch
+        codes = model.load_audio(audio_path)
+        profile = {"codes": codes.detach().cpu(), "transcript": transcript.strip(),
+                   "source": source_hash(audio_path, transcript), "model": DIA_MODEL_ID}
+        tmp_path = f"{self._path(name)}.tmp"
+        torch.save(profile, tmp_path)
+        os.replace(tmp_path, self._path(name))
+        print(f"Saved voice profile '{name}' ({codes.shape[0]} audio tokens)")
+        return codes, profile["transcript"]
+
+    def get_or_create(self, model, name, audio_path, transcript, device="cpu"):
+        """Reuse the stored profile unless the clip or transcript changed since it was encoded."""
+        import torch
+        path = self._path(name)
+        if os.path.exists(path):
+            profile = torch.load(path, map_location=device)
+            if profile.get("source") == source_hash(audio_path, transcript):
+                return profile["codes"], profile["transcript"]
+        return self.create(model, name, audio_path, transcript)
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage encoded Dia voice profiles.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    create = subparsers.add_parser("create", help="Encode a reference clip and transcript")
+    create.add_argument("name", help="Profile name")
+    create.add_argument("audio", help="Reference clip")
+    create.add_argument("transcript", help="Text file with the transcript of the clip")
+    create.add_argument("--device", default="auto", help="Torch device: auto, cpu, cuda or mps")
+    subparsers.add_parser("list", help="List stored profiles")
+    parser.add_argument("--profile-dir", default=DEFAULT_PROFILE_DIR, help="Directory of voice profiles")
+    args = parser.parse_args()
+
+    store = VoiceProfileStore(args.profile_dir)
+    if args.command == "list":
+        print("\n".join(store.names()))
+        return
+
+    from generate_dia import load_model
+    with open(args.transcript, "r") as f:
+        transcript = f.read()
+    store.create(load_model(args.device), args.name, args.audio, transcript)
+
+if __name__ == "__main__":
+    main()